@@ -0,0 +1,68 @@
+# مقارنة سرعة فحص انتظار الـ XP في on_message: الطريقة القديمة (نص ISO) مقابل CooldownCache
+#   python benchmarks/bench_cooldown.py --messages 500000 --users 20000
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+
+from bot5 import CooldownCache, XP_COOLDOWN  # noqa: E402
+
+
+def legacy_run(user_ids):
+    levels = {}
+    awarded = 0
+    for user_id in user_ids:
+        if user_id not in levels:
+            levels[user_id] = {"xp": 0, "level": 1, "messages": 0, "last_xp": datetime.now().isoformat()}
+        last_xp_time = datetime.fromisoformat(levels[user_id]["last_xp"])
+        if datetime.now() - last_xp_time < timedelta(seconds=XP_COOLDOWN):
+            continue
+        levels[user_id]["last_xp"] = datetime.now().isoformat()
+        awarded += 1
+    return awarded
+
+
+def cache_run(user_ids):
+    cooldowns = CooldownCache(XP_COOLDOWN)
+    awarded = 0
+    for user_id in user_ids:
+        if cooldowns.hit(user_id):
+            continue
+        awarded += 1
+    return awarded
+
+
+def measure(name, func, user_ids, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(user_ids)
+        best = min(best, time.perf_counter() - started)
+    rate = len(user_ids) / best
+    print(f"{name:<12} {best * 1000:10.1f}ms  {rate:14,.0f} رسالة/ثانية")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    user_ids = [str(rng.randrange(args.users)) for _ in range(args.messages)]
+
+    print(f"📊 {args.messages:,} رسالة من {args.users:,} عضو")
+    before = measure("ISO (قبل)", legacy_run, user_ids, args.repeat)
+    after = measure("Cache (بعد)", cache_run, user_ids, args.repeat)
+    print(f"⚡ التسريع: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
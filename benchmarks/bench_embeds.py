@@ -0,0 +1,101 @@
+# مقارنة تكلفة بناء الردود: discord.Embed جديد لكل رد مقابل قوالب EMBEDS
+#   python benchmarks/bench_embeds.py --responses 200000 --level-ups 0.1 --dynamic 0.2
+# مجموعة الأوامر تُستخرج من bot5.py نفسه: كل نص ثابت يمر عبر EMBEDS[...].static
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+
+import discord  # noqa: E402
+from bot5 import EMBEDS  # noqa: E402
+
+STATIC_CALL = re.compile(r'EMBEDS\["(\w+)"\]\.static\("([^"]*)"\)')
+
+
+def command_set():
+    with open(os.path.join(ROOT, "bot5.py"), encoding="utf-8") as f:
+        return sorted(set(STATIC_CALL.findall(f.read())))
+
+
+def build_workload(args, rng):
+    statics = command_set()
+    workload = []
+    for _ in range(args.responses):
+        roll = rng.random()
+        if roll < args.level_ups:
+            level = rng.randrange(2, 80)
+            values = {"mention": f"<@{rng.randrange(10 ** 17, 10 ** 18)}>", "level": level, "reward": level * 100}
+            workload.append(("format", "level_up", None, values))
+        elif roll < args.level_ups + args.dynamic:
+            workload.append(("render", "error", f"حدث خطأ: 404 Not Found (error code: {rng.randrange(10000, 99999)})", None))
+        else:
+            workload.append(("static",) + rng.choice(statics) + (None,))
+    return statics, workload
+
+
+def legacy_response(mode, key, text, values):
+    # ما كان يفعله كل أمر: Embed جديد بعنوان ولون ونص، ثم to_dict عند الإرسال
+    template = EMBEDS[key]
+    if mode == "format":
+        text = template.description.format(**values)
+    embed = discord.Embed(title=template.title, description=text, color=template.colour.value)
+    return embed, embed.to_dict()
+
+
+def template_response(mode, key, text, values):
+    template = EMBEDS[key]
+    if mode == "static":
+        embed = template.static(text)
+    elif mode == "format":
+        embed = template.render(**values)
+    else:
+        embed = template.render(text)
+    return embed, embed.to_dict()
+
+
+def measure(name, func, workload, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in workload:
+            func(*item)
+        best = min(best, time.perf_counter() - started)
+
+    # الردود تبقى حية حتى يقيس tracemalloc ما يُبنى لكل رد (Embed + Colour + القواميس)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [func(*item) for item in workload]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats) - 1  # بدون قائمة kept نفسها
+    size = sum(stat.size_diff for stat in stats) - sys.getsizeof(kept)
+    per = len(workload)
+    print(f"{name:<10} {best * 1e9 / per:8.0f}ns/رد  {blocks / per:6.2f} كائن/رد  {size / per:8.0f} بايت/رد")
+    return best, blocks, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--responses", type=int, default=200_000)
+    parser.add_argument("--level-ups", type=float, default=0.1)
+    parser.add_argument("--dynamic", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    statics, workload = build_workload(args, random.Random(0))
+    print(f"📊 {args.responses:,} رد: {len(statics)} نص ثابت من bot5.py، {args.level_ups:.0%} ترقية، {args.dynamic:.0%} خطأ متغير")
+    legacy = measure("discord", legacy_response, workload, args.repeat)
+    cached = measure("templates", template_response, workload, args.repeat)
+    print(f"التوفير: {1 - cached[0] / legacy[0]:.0%} وقت، {1 - cached[1] / legacy[1]:.0%} كائنات، {1 - cached[2] / legacy[2]:.0%} ذاكرة لكل رد")
+
+
+if __name__ == "__main__":
+    main()
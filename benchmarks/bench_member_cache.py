@@ -0,0 +1,112 @@
+# مقارنة استهلاك الذاكرة لملفات INTENTS_PROFILE على سيرفر اصطناعي
+#   python benchmarks/bench_member_cache.py --members 100000 --online 0.3 --active 0.02
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+
+import discord  # noqa: E402
+from discord.ext import commands  # noqa: E402
+from bot5 import build_intents  # noqa: E402
+
+GUILD_ID = 1
+VOICE_CHANNEL_ID = 2
+
+
+def member_payload(user_id, rng):
+    return {
+        "user": {"id": str(user_id), "username": f"user{user_id}", "global_name": f"User {user_id}",
+                 "discriminator": "0", "avatar": None},
+        "roles": [str(10 + rng.randrange(8))] if rng.random() < 0.5 else [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def presence_payload(user_id):
+    return {
+        "user": {"id": str(user_id)},
+        "status": "online",
+        "activities": [{"name": "Game", "type": 0, "created_at": 0}],
+        "client_status": {"desktop": "online"},
+    }
+
+
+def guild_payload(members, presences, voice_ids, total):
+    return {
+        "id": str(GUILD_ID),
+        "name": "Synthetic",
+        "member_count": total,
+        "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0,
+                   "color": 0, "hoist": False, "managed": False, "mentionable": False}]
+                 + [{"id": str(10 + i), "name": f"role{i}", "permissions": "0", "position": i + 1,
+                     "color": 0, "hoist": False, "managed": False, "mentionable": False} for i in range(8)],
+        "channels": [{"id": str(VOICE_CHANNEL_ID), "type": 2, "name": "voice", "position": 0,
+                      "permission_overwrites": [], "bitrate": 64000, "user_limit": 0}],
+        "voice_states": [{"user_id": str(user_id), "channel_id": str(VOICE_CHANNEL_ID), "session_id": "x",
+                          "deaf": False, "mute": False, "self_deaf": False, "self_mute": False,
+                          "self_video": False, "suppress": False} for user_id in voice_ids],
+        "members": members,
+        "presences": presences,
+    }
+
+
+def build_payloads(profile, args, rng):
+    # ما ترسله البوابة فعلياً لكل ملف: full يحمّل كل الأعضاء مع حالاتهم، والباقي يستقبل أعضاء الصوت فقط
+    user_ids = list(range(1000, 1000 + args.members))
+    voice_ids = user_ids[:args.voice]
+    if profile == "full":
+        members = [member_payload(user_id, rng) for user_id in user_ids]
+        presences = [presence_payload(user_id) for user_id in user_ids if rng.random() < args.online]
+        return guild_payload(members, presences, voice_ids, args.members), []
+    members = [member_payload(user_id, rng) for user_id in voice_ids]
+    # الأعضاء النشطون يُجلبون لاحقاً عند الحاجة عبر query_members
+    active = [member_payload(user_id, rng) for user_id in rng.sample(user_ids, int(args.members * args.active))]
+    return guild_payload(members, [], voice_ids, args.members), active
+
+
+def measure(profile, args):
+    intents, flags, _ = build_intents(profile)
+    bot = commands.Bot(command_prefix="!", intents=intents, member_cache_flags=flags)
+    state = bot._connection
+    payload, active = build_payloads(profile, args, random.Random(0))
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    guild = discord.Guild(data=payload, state=state)
+    for data in active:
+        member = discord.Member(data=data, guild=guild, state=state)
+        if flags.value:
+            guild._add_member(member)
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(guild.members), current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--online", type=float, default=0.3)
+    parser.add_argument("--voice", type=int, default=200)
+    parser.add_argument("--active", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"📊 سيرفر اصطناعي: {args.members:,} عضو، {args.online:.0%} متصل، {args.voice:,} في الصوت، {args.active:.0%} نشط")
+    baseline = None
+    for profile in ("full", "standard", "minimal"):
+        cached, memory, elapsed = measure(profile, args)
+        baseline = baseline or memory
+        print(f"{profile:<10} {cached:>9,} عضو في الكاش  {memory / 1024 / 1024:8.1f}MB  "
+              f"({memory / baseline:6.1%})  {elapsed * 1000:8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# إعادة تشغيل المسارات الساخنة في bot5.py بدون اتصال بديسكورد:
+# on_message وأوامر الاقتصاد وفتح التذاكر و/ترتيب و/اغنى على بيانات اصطناعية، ثم قياس توقف الحفظ
+#   python benchmarks/bench_replay.py --users 1000000 --messages 200000 --backend sqlite
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+WORKDIR = tempfile.mkdtemp(prefix="kimi-replay-")
+os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ["SQLITE_FILE"] = os.path.join(WORKDIR, "replay.sqlite3")
+os.environ["GUILDS_DIR"] = WORKDIR
+os.environ["COMMAND_HASH_FILE"] = os.path.join(WORKDIR, ".commands.sha256")
+
+GUILD_ID = 1
+BOT_ID = 999
+SUPPORT_CATEGORY_ID = 50
+STAFF_ROLES = {"⚔️ • الإدارة": 60, "🛡️ • المشرف": 61, "🔮 • المالك المشارك": 62}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000, help="عدد الأعضاء في levels/economy/reputation")
+    parser.add_argument("--active", type=float, default=0.05, help="نسبة الأعضاء النشطين الذين يرسلون رسائل وأوامر")
+    parser.add_argument("--cached", type=float, default=0.02, help="نسبة الأعضاء الموجودين في كاش الأعضاء")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--commands", type=int, default=20_000, help="أوامر الاقتصاد")
+    parser.add_argument("--tickets", type=int, default=2_000)
+    parser.add_argument("--leaderboards", type=int, default=5_000)
+    parser.add_argument("--moderation", type=int, default=300, help="دورات /اغلاق و/فتح و/سرعة على قناة واحدة")
+    parser.add_argument("--xp-cooldown", type=float, default=None, help="تجاوز XP_COOLDOWN (0 يمنح الخبرة لكل رسالة)")
+    parser.add_argument("--concurrency", type=int, default=1, help="عدد الأحداث المتزامنة على حلقة الأحداث")
+    parser.add_argument("--backend", choices=("sqlite", "json"), default="sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+os.environ["STORAGE_BACKEND"] = ARGS.backend
+
+import discord  # noqa: E402
+import bot5  # noqa: E402
+
+
+# ---------- بدائل كائنات ديسكورد ----------
+class FakeAsset:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+
+class FakeMember:
+    __slots__ = ("id", "name", "display_name", "mention", "bot")
+    display_avatar = FakeAsset()
+    roles = ()
+
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = f"User {user_id}"
+        self.mention = f"<@{user_id}>"
+        self.bot = bot
+
+
+def sent_embeds(kwargs):
+    # to_dict مثل ما يفعله discord.py قبل الإرسال، حتى تُحسب تكلفة بناء الرسالة
+    embeds = kwargs.get("embeds") or ([kwargs["embed"]] if kwargs.get("embed") else [])
+    for embed in embeds:
+        embed.to_dict()
+    return embeds
+
+
+class FakeChannel:
+    category = None
+
+    def __init__(self, channel_id, name, guild=None):
+        self.id = channel_id
+        self.name = name
+        self.mention = f"<#{channel_id}>"
+        self.guild = guild
+        self.slowmode_delay = 0
+        self.sent = 0
+        self._overwrites = {}
+
+    @property
+    def overwrites(self):
+        return dict(self._overwrites)
+
+    async def edit(self, *, overwrites=None, slowmode_delay=None, reason=None):
+        if overwrites is not None:
+            self._overwrites = dict(overwrites)
+        if slowmode_delay is not None:
+            self.slowmode_delay = slowmode_delay
+
+    async def send(self, content=None, **kwargs):
+        sent_embeds(kwargs)
+        self.sent += 1
+
+
+class ReplayGuild(discord.Guild):
+    # Guild حقيقي من payload (فالـ resolver وisinstance يعملان كما في الإنتاج)؛ فقط نداءات الشبكة مستبدلة
+    __slots__ = ("cached_members", "ticket_channels", "queries", "_next_channel_id")
+
+    def setup(self, cached_ids):
+        self.cached_members = {user_id: FakeMember(user_id) for user_id in cached_ids}
+        self.ticket_channels = {}
+        self.queries = 0
+        self._next_channel_id = 10_000_000
+
+    @property
+    def me(self):
+        return FakeMember(BOT_ID, bot=True)
+
+    def get_member(self, user_id):
+        return self.cached_members.get(user_id)
+
+    def get_channel(self, channel_id):
+        return self.ticket_channels.get(channel_id) or super().get_channel(channel_id)
+
+    async def query_members(self, query=None, *, limit=5, user_ids=None, presences=False, cache=True):
+        self.queries += 1
+        return [FakeMember(user_id) for user_id in (user_ids or [])]
+
+    async def create_text_channel(self, name, **kwargs):
+        self._next_channel_id += 1
+        channel = FakeChannel(self._next_channel_id, name)
+        self.ticket_channels[channel.id] = channel
+        return channel
+
+
+class FakeResponse:
+    def __init__(self, sent):
+        self._done = False
+        self.sent = sent
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self.sent.extend(sent_embeds(kwargs))
+        self._done = True
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def send(self, content=None, **kwargs):
+        self.sent.extend(sent_embeds(kwargs))
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, channel):
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild_id = guild.id
+        self.extras = {}
+        self.command = None
+        self.sent = []
+        self.response = FakeResponse(self.sent)
+        self.followup = FakeFollowup(self.sent)
+
+
+class FakeMessage:
+    def __init__(self, guild, author, channel):
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+        self.content = "مرحبا"
+
+
+def guild_payload():
+    roles = [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+              "hoist": False, "managed": False, "mentionable": False}]
+    roles += [{"id": str(role_id), "name": name, "permissions": "0", "position": i + 1, "color": 0,
+               "hoist": False, "managed": False, "mentionable": True} for i, (name, role_id) in enumerate(STAFF_ROLES.items())]
+    channels = [
+        {"id": str(SUPPORT_CATEGORY_ID), "type": 4, "name": "🎫 • الدعم الفني", "position": 0, "permission_overwrites": []},
+        {"id": "51", "type": 0, "name": "💬・الدردشة", "position": 1, "permission_overwrites": [], "parent_id": None},
+    ]
+    return {"id": str(GUILD_ID), "name": "Replay", "member_count": ARGS.users, "roles": roles, "channels": channels,
+            "members": [], "presences": [], "voice_states": []}
+
+
+# ---------- البيانات الاصطناعية ----------
+def seed_storage(user_ids, rng):
+    # تُكتب عبر نفس التخزين الذي يقرأ منه البوت، فيُقاس التحميل البارد أيضاً
+    gid = str(GUILD_ID)
+    levels, economy, reputation = {}, {}, {}
+    for user_id in user_ids:
+        uid = str(user_id)
+        level = 1 + int(rng.expovariate(0.15))
+        levels[uid] = {"xp": rng.randrange(0, level * 200), "level": level, "messages": rng.randrange(0, 5000),
+                       "last_xp": "2024-01-01T00:00:00"}
+        economy[uid] = {"coins": rng.randrange(0, 5000), "bank": rng.randrange(0, 20000), "last_daily": None}
+        if rng.random() < 0.3:
+            reputation[uid] = {"rep": rng.randrange(1, 50), "last_rep": None}
+    # الأرصدة تعتبر مُرحّلة إلى الدفتر مسبقاً، حتى لا يتحول أول تحميل إلى مليون قيد افتتاحي
+    meta = {"ledger_opened": True}
+    bot5.DATABASE_FILE = os.path.join(WORKDIR, "database.json")  # لا يُرحَّل ملف المستودع الحقيقي
+    bot5.load_data()
+    if ARGS.backend == "json":
+        bot5.write_json(bot5.storage.path_for(gid), {"levels": levels, "economy": economy, "reputation": reputation, "meta": meta})
+        return
+    records = [("levels", gid, uid, rec) for uid, rec in levels.items()]
+    records += [("economy", gid, uid, rec) for uid, rec in economy.items()]
+    records += [("reputation", gid, uid, rec) for uid, rec in reputation.items()]
+    records += [("meta", gid, key, value) for key, value in meta.items()]
+    for i in range(0, len(records), 50_000):
+        bot5.storage.write_records(records[i:i + 50_000])
+
+
+# ---------- القياس ----------
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+
+async def replay(name, events, handler):
+    samples = []
+    queue = iter(events)
+
+    async def worker():
+        for event in queue:
+            started = time.perf_counter()
+            await handler(event)
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, ARGS.concurrency))))
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    print(f"{name:<14} {len(samples):>9,} حدث  {len(samples) / elapsed:>11,.0f}/ثانية  "
+          f"p50 {percentile(samples, 50) * 1e6:8.1f}µs  p95 {percentile(samples, 95) * 1e6:8.1f}µs  "
+          f"p99 {percentile(samples, 99) * 1e6:8.1f}µs  max {samples[-1] * 1e3 if samples else 0:8.2f}ms")
+
+
+async def measure_stall(name, action):
+    # أقصى تأخر لحلقة الأحداث أثناء الحفظ: مؤقت كل 1ms يقيس كم تأخر استيقاظه
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    running = True
+
+    async def probe():
+        nonlocal worst
+        while running:
+            expected = loop.time() + 0.001
+            await asyncio.sleep(0.001)
+            worst = max(worst, loop.time() - expected)
+
+    task = asyncio.create_task(probe())
+    await asyncio.sleep(0.01)
+    pending = bot5.persistence.pending
+    started = time.perf_counter()
+    written = await action()
+    elapsed = time.perf_counter() - started
+    running = False
+    await task
+    print(f"{name:<22} {written if written is not None else pending:>10,} سجل  {elapsed * 1e3:9.1f}ms إجمالي  "
+          f"أقصى توقف للحلقة {worst * 1e3:8.1f}ms")
+
+
+async def main():
+    rng = random.Random(ARGS.seed)
+    user_ids = list(range(100_000_000, 100_000_000 + ARGS.users))
+    active = rng.sample(user_ids, max(2, int(ARGS.users * ARGS.active)))
+    print(f"📊 {ARGS.users:,} عضو ({ARGS.backend})، {len(active):,} نشط، تزامن {ARGS.concurrency}، المجلد {WORKDIR}")
+
+    started = time.perf_counter()
+    seed_storage(user_ids, rng)
+    print(f"{'تجهيز البيانات':<22} {(time.perf_counter() - started):9.1f}s")
+
+    # أوامر البادئة تحتاج bot.user بعد تسجيل الدخول، وbot5 لا يعرّف أي أمر بادئة
+    async def no_prefix_commands(message):
+        return None
+    bot5.bot.process_commands = no_prefix_commands
+    if ARGS.xp_cooldown is not None:
+        bot5.xp_cooldowns.seconds = ARGS.xp_cooldown
+    bot5.persistence.start()
+
+    guild = ReplayGuild(data=guild_payload(), state=bot5.bot._connection)
+    guild.setup(rng.sample(user_ids, int(ARGS.users * ARGS.cached)))
+    chat = FakeChannel(51, "💬・الدردشة")
+
+    started = time.perf_counter()
+    guild_data = await bot5.partitions.get(GUILD_ID)
+    print(f"{'تحميل السيرفر والفهارس':<22} {(time.perf_counter() - started):9.1f}s  "
+          f"({len(guild_data.levels):,} مستوى، {len(guild_data.wealth_rank):,} في قائمة الثروة)")
+    print("-" * 100)
+
+    members = {user_id: FakeMember(user_id) for user_id in active}
+
+    async def on_message(user_id):
+        await bot5.on_message(FakeMessage(guild, members[user_id], chat))
+    await replay("on_message", [rng.choice(active) for _ in range(ARGS.messages)], on_message)
+
+    economy = [
+        (bot5.daily_slash, ()),
+        (bot5.balance_slash, ("member",)),
+        (bot5.deposit_slash, ("100",)),
+        (bot5.withdraw_slash, ("50",)),
+        (bot5.transfer_slash, ("member", 10)),
+    ]
+
+    async def economy_command(event):
+        (command, args), user_id, other_id = event
+        args = tuple(members[other_id] if arg == "member" else arg for arg in args)
+        await command.callback(FakeInteraction(guild, members[user_id], chat), *args)
+
+    def pair():
+        user_id = rng.choice(active)
+        other_id = rng.choice(active)
+        while other_id == user_id:
+            other_id = rng.choice(active)
+        return user_id, other_id
+    await replay("economy", [(rng.choice(economy),) + pair() for _ in range(ARGS.commands)], economy_command)
+
+    select = bot5.TicketTypeSelect()
+    ticket_types = [option.value for option in select.options]
+
+    async def open_ticket(event):
+        user_id, ticket_type = event
+        interaction = FakeInteraction(guild, members[user_id], chat)
+        select._refresh_state(interaction, {"values": [ticket_type]})
+        await select.callback(interaction)
+    await replay("tickets", [(rng.choice(active), rng.choice(ticket_types)) for _ in range(ARGS.tickets)], open_ticket)
+
+    pages = max(1, len(guild_data.level_rank) // bot5.PAGE_SIZE)
+
+    async def leaderboard(event):
+        command, page = event
+        await command.callback(FakeInteraction(guild, members[rng.choice(active)], chat), page)
+    # معظم الطلبات على الصفحات الأولى، مثل الاستخدام الفعلي
+    boards = [(rng.choice((bot5.leaderboard_slash, bot5.rich_list_slash)), min(pages, 1 + int(rng.expovariate(0.5))))
+              for _ in range(ARGS.leaderboards)]
+    await replay("leaderboards", boards, leaderboard)
+    print(f"{'':<14} طلبات query_members: {guild.queries:,} | كاش الصفحات: {dict((k[0], v) for k, v in bot5.page_cache_lookups.values.items())}")
+
+    # أوامر الإدارة تعدل الرسالة قبل إرسالها (تذييل ووقت)، فأي رد خطأ هنا يعني أن الأمر فشل بعد تعديل القناة
+    moderated = FakeChannel(52, "🔒・اختبار", guild)
+    staff = FakeMember(BOT_ID + 1)
+
+    async def moderation(event):
+        command, args = event
+        interaction = FakeInteraction(guild, staff, moderated)
+        notices = moderated.sent
+        await command.callback(interaction, *args)
+        failed = [embed for embed in interaction.sent if (embed.title or "").startswith("❌")]
+        if failed or not interaction.sent:
+            raise AssertionError(f"{command.name}{args}: {failed[0].description if failed else 'بدون رد'}")
+        if command is not bot5.slowmode_slash and moderated.sent != notices + 1:
+            raise AssertionError(f"{command.name}: لم يُرسل إشعار القناة")
+    cycle = [(bot5.lock_slash, ("channel",)), (bot5.unlock_slash, ("channel",)),
+             (bot5.slowmode_slash, (0,)), (bot5.slowmode_slash, (30,))]
+    await replay("moderation", [cycle[i % len(cycle)] for i in range(ARGS.moderation)], moderation)
+    print("-" * 100)
+
+    await measure_stall("persistence.flush()", bot5.persistence.flush)
+
+    async def full_save():
+        return bot5.save_data()
+    await measure_stall("save_data() (متزامن)", full_save)
+    await bot5.persistence.close()
+    bot5.storage.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
@@ -2,9 +2,23 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from discord.ui import Button, View, Select, Modal, TextInput
+from aiohttp import web
 import asyncio
 import random
+import re
 import json
+import io
+import gzip
+import html
+import functools
+import hashlib
+import contextlib
+import math
+import time
+from collections import deque
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
@@ -21,8 +35,362 @@ if not TOKEN:
     exit()
 
 # ====================== إعدادات البوت ======================
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='!', intents=intents)
+INTENTS_PROFILE = os.getenv("INTENTS_PROFILE", "standard")  # full | standard | minimal
+QUERY_MEMBERS_TIMEOUT = float(os.getenv("QUERY_MEMBERS_TIMEOUT", "2"))
+
+def build_intents(profile):
+    # full: السلوك القديم (كل الأعضاء والحالات في الذاكرة). standard و minimal: بدون presences
+    # وبدون تحميل كل الأعضاء عند الإقلاع؛ العضو المطلوب يُجلب عند الحاجة عبر resolve_members
+    if profile == "full":
+        return discord.Intents.all(), discord.MemberCacheFlags.all(), True
+    intents = discord.Intents.default()
+    intents.members = True  # أحداث الدخول والخروج و query_members
+    intents.message_content = True  # فلتر النص في /مسح
+    intents.typing = False
+    if profile == "minimal":
+        intents.voice_states = False
+        intents.invites = False
+        intents.integrations = False
+        intents.webhooks = False
+        return intents, discord.MemberCacheFlags.none(), False
+    return intents, discord.MemberCacheFlags.from_intents(intents), False
+
+intents, member_cache_flags, chunk_at_startup = build_intents(INTENTS_PROFILE)
+COMMAND_HASH_FILE = os.getenv("COMMAND_HASH_FILE", ".commands.sha256")  # بصمة آخر شجرة أوامر تمت مزامنتها
+FORCE_SYNC = os.getenv("FORCE_SYNC", "0") == "1"
+
+class StartupTimer:
+    # يقيس مراحل الإقلاع: تسجيل الدخول، التحميل، الجاهزية، والمزامنة في الخلفية
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.phases = []
+        self.ready = False
+
+    def begin(self):
+        self.started = self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        parts = " | ".join(f"{phase}: {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        return f"⏱️ الإقلاع في {(self.last - self.started) * 1000:.0f}ms ({parts})"
+
+startup = StartupTimer()
+
+def command_tree_hash(tree, application_id):
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c["name"], c.get("type", 1)))
+    return hashlib.sha256(json.dumps([application_id, payload], sort_keys=True).encode("utf-8")).hexdigest()
+
+# ====================== المقاييس ======================
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # محلي فقط، ويُعرض للخارج عبر Prometheus أو بروكسي
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 يعطل نقطة المقاييس
+LOOP_LAG_INTERVAL = 0.5
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SAVE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {} if labels else {(): 0}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for values, value in self.values.items():
+            yield self.name + format_labels(self.labels, values), value
+
+class Gauge:
+    # القيمة تُحسب عند كل قراءة للمقاييس، فلا يتحمل المسار الساخن أي تكلفة
+    kind = "gauge"
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:
+            return
+        if value is not None:
+            yield self.name, value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}  # label_values -> [عدادات الحدود..., المجموع, العدد]
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        names = self.labels + ("le",)
+        for values, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(names, values + (bound,))}", cumulative
+            yield f"{self.name}_bucket{format_labels(names, values + ('+Inf',))}", series[-1]
+            yield f"{self.name}_sum{format_labels(self.labels, values)}", series[-2]
+            yield f"{self.name}_count{format_labels(self.labels, values)}", series[-1]
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.loop_lag = 0.0
+        self._runner = None
+        self._lag_task = None
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, read):
+        return self._add(Gauge(name, help_text, read))
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        return self._add(Histogram(name, help_text, buckets, labels))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, request):
+        return web.Response(body=self.render().encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def _measure_lag(self):
+        # الفرق بين موعد الاستيقاظ المطلوب والفعلي هو مدة حجب الحلقة بعمل متزامن
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(0.0, loop.time() - expected)
+            loop_lag_seconds.observe(self.loop_lag)
+
+    async def start(self, host=METRICS_HOST, port=METRICS_PORT):
+        self._lag_task = asyncio.get_running_loop().create_task(self._measure_lag())
+        if not port:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError as e:
+            print(f"⚠️ تعذر تشغيل نقطة المقاييس على {host}:{port}: {e}")
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        print(f"📈 المقاييس متاحة على http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics = MetricsRegistry()
+messages_processed = metrics.counter("kimi_messages_processed_total", "رسائل السيرفرات التي وصلت إلى on_message")
+xp_awards = metrics.counter("kimi_xp_awards_total", "عدد مرات منح الخبرة")
+xp_points = metrics.counter("kimi_xp_points_total", "مجموع نقاط الخبرة الممنوحة")
+level_ups = metrics.counter("kimi_level_ups_total", "عدد الترقيات")
+cooldown_hits = metrics.counter("kimi_cooldown_hits_total", "طلبات رُفضت بسبب فترة الانتظار", ("kind",))
+save_seconds = metrics.histogram("kimi_save_duration_seconds", "مدة كتابة دفعة الحفظ في خيط الحفظ", SAVE_BUCKETS)
+save_records = metrics.counter("kimi_save_records_total", "السجلات المكتوبة إلى التخزين")
+save_bytes = metrics.counter("kimi_save_bytes_total", "البايتات المكتوبة إلى التخزين")
+save_failures = metrics.counter("kimi_save_failures_total", "دفعات حفظ فشلت وأُعيدت إلى الطابور")
+ticket_events = metrics.counter("kimi_ticket_events_total", "فتح وإغلاق وحذف التذاكر", ("event",))
+command_latency = metrics.histogram("kimi_command_duration_seconds", "زمن تنفيذ أوامر السلاش", LATENCY_BUCKETS, ("command",))
+command_errors = metrics.counter("kimi_command_errors_total", "أوامر انتهت بخطأ", ("command",))
+page_cache_lookups = metrics.counter("kimi_page_cache_lookups_total", "قراءات كاش صفحات القوائم", ("result",))
+ledger_entries = metrics.counter("kimi_ledger_entries_total", "قيود دفتر الاقتصاد", ("kind",))
+command_deferred = metrics.counter("kimi_command_deferred_total", "أوامر أُجّلت تلقائياً لتجاوزها مهلة الرد", ("command",))
+loop_lag_seconds = metrics.histogram("kimi_event_loop_lag_seconds", "تأخر استيقاظ حلقة الأحداث", LATENCY_BUCKETS)
+metrics.gauge("kimi_event_loop_lag_last_seconds", "آخر قياس لتأخر حلقة الأحداث", lambda: metrics.loop_lag)
+metrics.gauge("kimi_gateway_latency_seconds", "زمن نبضة البوابة", lambda: bot.latency if math.isfinite(bot.latency) else None)
+metrics.gauge("kimi_guilds", "عدد السيرفرات", lambda: len(bot.guilds))
+metrics.gauge("kimi_guild_partitions_loaded", "السيرفرات المحمّلة في الذاكرة", lambda: len(partitions))
+metrics.gauge("kimi_save_pending_records", "سجلات معدلة تنتظر الحفظ", lambda: persistence.pending)
+metrics.gauge("kimi_save_latency_seconds", "المدة بين أول تعديل ووصوله للقرص في آخر دفعة", lambda: persistence.last_latency)
+metrics.gauge("kimi_tickets_open", "التذاكر المفتوحة", lambda: len(tickets_by_channel))
+metrics.gauge("kimi_role_queue_size", "أعضاء ينتظرون رتبة الانضمام", lambda: join_pipeline.stats()["role_queue"])
+metrics.gauge("kimi_audit_pending_events", "أحداث سجل التدقيق التي تنتظر الإرسال", lambda: sum(len(box) for box in audit.outbox.values()))
+
+# ====================== طبقة تنفيذ الأوامر ======================
+INTERACTION_DEFER_BUDGET = float(os.getenv("INTERACTION_DEFER_BUDGET", "2"))  # مهلة ديسكورد للرد 3 ثوانٍ
+LATENCY_SAMPLES = 1024  # آخر عدد من القياسات يُحتفظ به لكل أمر
+
+class LatencyStats:
+    def __init__(self):
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.count = 0
+        self.errors = 0
+        self.deferred = 0
+
+    def record(self, seconds, failed=False):
+        self.samples.append(seconds)
+        self.count += 1
+        if failed:
+            self.errors += 1
+
+    def percentiles(self, *points):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0 for _ in points]
+        return [ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points]
+
+command_stats = {}
+
+def response_lock(interaction):
+    # يمنع التعارض بين التأجيل التلقائي ورد الأمر نفسه
+    return interaction.extras.setdefault("response_lock", asyncio.Lock())
+
+async def respond(interaction, content=None, **kwargs):
+    # الرد الأول عبر response، وما بعده (أو بعد التأجيل) عبر followup
+    async with response_lock(interaction):
+        if interaction.response.is_done():
+            return await interaction.followup.send(content, **kwargs)
+        await interaction.response.send_message(content, **kwargs)
+
+async def defer_response(interaction, **kwargs):
+    async with response_lock(interaction):
+        if not interaction.response.is_done():
+            await interaction.response.defer(**kwargs)
+
+def finish_command(interaction, failed=False):
+    started = interaction.extras.pop("started", None)
+    timer = interaction.extras.pop("defer_timer", None)
+    if timer:
+        timer.cancel()
+    if started is None or interaction.command is None:
+        return
+    name = interaction.command.qualified_name
+    elapsed = time.perf_counter() - started
+    command_stats.setdefault(name, LatencyStats()).record(elapsed, failed)
+    command_latency.observe(elapsed, name)
+    if failed:
+        command_errors.inc(name)
+
+class KimiCommandTree(app_commands.CommandTree):
+    # يقيس زمن كل أمر ويؤجل الرد تلقائياً إذا تجاوز المعالج ميزانية الزمن
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.type is not discord.InteractionType.application_command:
+            return True
+        interaction.extras["started"] = time.perf_counter()
+        command = interaction.command
+        ephemeral = bool(command and command.extras.get("ephemeral"))
+        interaction.extras["defer_timer"] = asyncio.get_running_loop().call_later(
+            INTERACTION_DEFER_BUDGET, lambda: asyncio.ensure_future(self._auto_defer(interaction, ephemeral))
+        )
+        return True
+
+    async def _auto_defer(self, interaction, ephemeral):
+        interaction.extras.pop("defer_timer", None)
+        try:
+            async with response_lock(interaction):
+                if interaction.response.is_done():
+                    return
+                await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+        except discord.HTTPException:
+            return
+        if interaction.command:
+            command_stats.setdefault(interaction.command.qualified_name, LatencyStats()).deferred += 1
+            command_deferred.inc(interaction.command.qualified_name)
+
+class KimiBot(commands.Bot):
+    async def start(self, token, *, reconnect=True):
+        startup.begin()
+        await super().start(token, reconnect=reconnect)
+
+    async def setup_hook(self):
+        # يُستدعى مرة واحدة بعد تسجيل الدخول وقبل الاتصال بالبوابة، فلا تُعاد أي خطوة عند إعادة الاتصال
+        startup.mark("تسجيل الدخول")
+        # قاعدة البيانات يجب أن تكون جاهزة قبل أول رسالة، لأن بيانات كل سيرفر تُحمَّل عند أول استخدام
+        load_data()
+        load_tickets()
+        lockdowns.load()
+        persistence.start()
+        warning_wheel.start(expire_warning)
+        join_pipeline.start()
+        audit.start()
+        await metrics.start()
+        # تسجيل العروض الدائمة مرة واحدة لكل التذاكر المفتوحة
+        self.add_view(TicketView())
+        self.add_view(TicketManagementView())
+        startup.mark("التحميل")
+        self.loop.create_task(self.sync_commands())
+        self.loop.create_task(periodic_save())
+
+    async def sync_commands(self):
+        # المزامنة العامة بطيئة، فلا تُرسل إلا إذا تغيرت بصمة الشجرة
+        digest = command_tree_hash(self.tree, self.application_id)
+        previous = None
+        if os.path.exists(COMMAND_HASH_FILE):
+            with open(COMMAND_HASH_FILE) as f:
+                previous = f.read().strip()
+        if digest == previous and not FORCE_SYNC:
+            print("⏭️ شجرة الأوامر لم تتغير، تم تخطي المزامنة")
+            return
+        began = time.perf_counter()
+        try:
+            synced = await self.tree.sync()
+        except Exception as e:
+            print(f"❌ خطأ في المزامنة: {e}")
+            return
+        await persistence.run_io(write_atomic, COMMAND_HASH_FILE, digest.encode("utf-8"))
+        print(f"✅ تمت مزامنة {len(synced)} أمر Slash في {(time.perf_counter() - began) * 1000:.0f}ms")
+
+    async def close(self):
+        # حفظ كل التعديلات المعلقة قبل قطع الاتصال
+        try:
+            await audit.close()
+            ledger.settle_all()
+            await persistence.close()
+        except Exception as e:
+            print(f"❌ خطأ في الحفظ عند الإيقاف: {e}")
+        await metrics.close()
+        storage.close()
+        await super().close()
+
+bot = KimiBot(command_prefix='!', intents=intents, tree_cls=KimiCommandTree, member_cache_flags=member_cache_flags, chunk_guilds_at_startup=chunk_at_startup)
 
 # الألوان الفخمة (ثيم متسق)
 SUCCESS_COLOR = 0x00FF9F  # أخضر نيون فخم
@@ -32,39 +400,1153 @@ INFO_COLOR = 0x118AB2     # أزرق مائي فخم
 MAIN_COLOR = 0x9B5DE5     # أرجواني فخم
 DARK_BLUE = 0x1E3A8A      # أزرق غامق فخم
 
+# ====================== قوالب الرسائل ======================
+STATIC_EMBED_CACHE_MAX = 256  # أقصى عدد نصوص ثابتة مختلفة تُحفظ لكل قالب
+
+class StaticEmbed(discord.Embed):
+    # رسالة ثابتة مشتركة بين كل الردود: تُبنى وتُحوَّل إلى dict مرة واحدة، وأي تعديل عليها يرفع خطأ
+    __slots__ = ("_payload",)
+
+    def freeze(self):
+        if getattr(self, "_fields", None) is not None:
+            super().__setattr__("_fields", tuple(self._fields))  # add_field على نسخة مجمدة يفشل بدلاً من تعديلها للجميع
+        payload = super().to_dict()
+        super().__setattr__("_payload", payload)
+        return self
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_payload"):
+            raise TypeError("رسالة القالب الثابتة مشتركة، استخدم copy() قبل تعديلها")
+        super().__setattr__(name, value)
+
+    def to_dict(self):
+        return dict(self._payload)
+
+    def copy(self):
+        return discord.Embed.from_dict(self.to_dict())
+
+class EmbedTemplate:
+    # العنوان واللون (كائن Colour) يُبنيان مرة واحدة؛ الاستدعاء يملأ الوصف فقط
+    def __init__(self, title, color, description=None):
+        self.title = title
+        self.colour = discord.Colour(color)
+        self.description = description
+        self._static = {}
+
+    def static(self, description=None):
+        # للنصوص الثابتة فقط: نفس الكائن يُعاد في كل مرة
+        description = self.description if description is None else description
+        embed = self._static.get(description)
+        if embed is None:
+            embed = StaticEmbed(title=self.title, colour=self.colour, description=description).freeze()
+            if len(self._static) < STATIC_EMBED_CACHE_MAX:
+                self._static[description] = embed
+        return embed
+
+    def render(self, description=None, **values):
+        # رسالة جديدة قابلة للتعديل، للنصوص التي تحتوي على قيم متغيرة
+        if description is None:
+            description = self.description.format(**values) if values else self.description
+        return discord.Embed(title=self.title, colour=self.colour, description=description)
+
+EMBEDS = {
+    "error": EmbedTemplate("❌ خطأ", ERROR_COLOR),
+    "denied": EmbedTemplate("❌ صلاحية مرفوضة", ERROR_COLOR),
+    "bot_error": EmbedTemplate("❌ خطأ البوت", ERROR_COLOR),
+    "command_not_found": EmbedTemplate("❌ أمر غير موجود", ERROR_COLOR),
+    "ticket_exists": EmbedTemplate("❌ تذكرة مفتوحة بالفعل", ERROR_COLOR),
+    "outside_system": EmbedTemplate("⚠️ خارج النظام", WARN_COLOR),
+    "confirm_close": EmbedTemplate("⚠️ تأكيد الإغلاق", WARN_COLOR),
+    "cancelled": EmbedTemplate("✅ تم الإلغاء", SUCCESS_COLOR),
+    "ticket_delete_now": EmbedTemplate("🗑️ حذف فوري", ERROR_COLOR),
+    "transcript_options": EmbedTemplate("📄 نسخة التذكرة", INFO_COLOR),
+    "channel_locked": EmbedTemplate("🔒 تم قفل القناة", ERROR_COLOR),
+    "channel_unlocked": EmbedTemplate("🔓 تم فتح القناة", SUCCESS_COLOR),
+    "slowmode_off": EmbedTemplate("✅ تم تعطيل وضع الكتابة البطيء", SUCCESS_COLOR),
+    "setup_running": EmbedTemplate("🔄 جاري الإعداد...", INFO_COLOR),
+    "wait": EmbedTemplate("⏰ انتظر", WARN_COLOR),
+    "level_up": EmbedTemplate(
+        "🎉 ترقية مستوى!", 0xFFD700,
+        "مبروك {mention}، لقد وصلت للمستوى **{level}**!\n🎁 حصلت على **{reward}** 🪙"
+    ),
+}
+
 # قاعدة البيانات
-DATABASE_FILE = "database.json"
-tickets_db = {}
-tickets_by_channel = {}
-warnings_db = {}
-levels_db = {}
-economy_db = {}
-rep_db = {}  # نظام السمعة الجديد
+DATABASE_FILE = "database.json"  # الملف القديم غير المقسّم، يُرحَّل تلقائياً
+SQLITE_FILE = os.getenv("SQLITE_FILE", "database.sqlite3")
+GUILDS_DIR = os.getenv("GUILDS_DIR", "guilds")  # ملف لكل سيرفر عند استخدام json
+TICKETS_FILE = os.path.join(GUILDS_DIR, "tickets.json")
+AUDIT_FILE = os.path.join(GUILDS_DIR, "audit.jsonl")  # سجل التدقيق عند استخدام json
+LEDGER_FILE = os.path.join(GUILDS_DIR, "ledger.jsonl")  # دفتر الاقتصاد عند استخدام json
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")  # sqlite أو json
+LEGACY_GUILD_ID = os.getenv("LEGACY_GUILD_ID")  # السيرفر الذي تُنقل إليه بيانات database.json القديمة
+GUILD_IDLE_SECONDS = int(os.getenv("GUILD_IDLE_SECONDS", "1800"))  # إزالة السيرفرات الخاملة من الذاكرة
 
-def load_data():
-    global warnings_db, levels_db, economy_db, rep_db
+LEGACY_GUILD = "0"
+GUILD_STORES = ("warnings", "levels", "economy", "reputation", "meta")
+# التذاكر المفتوحة قليلة، فتُحمَّل كلها عند التشغيل ومفهرسة حسب صاحبها وحسب القناة
+tickets_db = {}  # guild_id -> {owner_id: ticket}
+tickets_by_channel = {}  # channel_id -> ticket
+
+def guild_tickets(guild_id):
+    return tickets_db.setdefault(str(guild_id), {})
+
+ticket_versions = {}  # guild_id -> عداد يزيد مع كل تعديل على تذاكر السيرفر، لإبطال صفحات /التذاكر
+
+def touch_ticket(ticket):
+    ticket_versions[ticket["guild_id"]] = ticket_versions.get(ticket["guild_id"], 0) + 1
+    persistence.mark_dirty("tickets", ticket["guild_id"], ticket["channel_id"])
+
+def add_ticket(ticket, persist=True):
+    guild_tickets(ticket["guild_id"])[ticket["owner_id"]] = ticket
+    tickets_by_channel[ticket["channel_id"]] = ticket
+    if persist:
+        touch_ticket(ticket)
+
+def remove_ticket(channel_id):
+    ticket = tickets_by_channel.pop(channel_id, None)
+    if ticket:
+        owners = tickets_db.get(ticket.get("guild_id"), {})
+        if owners.get(ticket.get("owner_id")) is ticket:
+            del owners[ticket["owner_id"]]
+        touch_ticket(ticket)
+    return ticket
+
+def load_tickets():
+    for ticket in storage.load_tickets():
+        add_ticket(ticket, persist=False)
+    print(f"🎫 تم تحميل {len(tickets_by_channel)} تذكرة مفتوحة")
+
+def prune_stale_tickets():
+    # التذاكر التي حُذفت قنواتها أثناء توقف البوت، بالاعتماد على الكاش فقط بدون طلبات API
+    guild_ids = {str(guild.id) for guild in bot.guilds}
+    stale = [
+        channel_id for channel_id, ticket in tickets_by_channel.items()
+        if ticket["guild_id"] in guild_ids and bot.get_channel(channel_id) is None
+    ]
+    for channel_id in stale:
+        remove_ticket(channel_id)
+    return len(stale)
+
+def read_json_file(path):
     try:
-        with open(DATABASE_FILE, 'r') as f:
-            data = json.load(f)
-            warnings_db = data.get("warnings", {})
-            levels_db = data.get("levels", {})
-            economy_db = data.get("economy", {})
-            rep_db = data.get("reputation", {})
-            print("✅ تم تحميل البيانات بنجاح.")
+        with open(path, 'r') as f:
+            return json.load(f)
     except FileNotFoundError:
         print("⚠️ ملف البيانات غير موجود، سيتم إنشاء ملف جديد عند الحفظ.")
     except json.JSONDecodeError:
         print("❌ خطأ في قراءة ملف البيانات، قد يكون تالفاً.")
+    return None
+
+def load_data():
+    # البيانات نفسها تُحمَّل لكل سيرفر عند أول استخدام عبر partitions.get
+    storage.open()
+    storage.migrate_from_json(DATABASE_FILE)
+    print("✅ تم تجهيز قاعدة البيانات بنجاح.")
+
+def copy_record(record):
+    # نسخة سطحية تؤخذ على حلقة الأحداث حتى يكتبها الخيط دون تعارض مع التعديلات الجارية
+    if isinstance(record, list):
+        return list(record)
+    if isinstance(record, dict):
+        return dict(record)
+    return record
+
+def write_atomic(path, payload: bytes):
+    # الكتابة في ملف مؤقت ثم fsync ثم rename، فلا يبقى الملف الأصلي مبتوراً عند أي انهيار
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def write_json(path, data):
+    # بدون indent حتى يُستخدم مُرمّز JSON المكتوب بلغة C بدلاً من المُرمّز البطيء
+    payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    write_atomic(path, payload)
+    return len(payload)
+
+# ====================== فهارس الترتيب ======================
+class _RankEnd:
+    # نهاية القائمة: أكبر من أي مفتاح
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return False
+
+class _RankNode:
+    __slots__ = ("key", "member_id", "score", "next", "width")
+
+    def __init__(self, key, member_id, score, height):
+        self.key = key
+        self.member_id = member_id
+        self.score = score
+        self.next = [None] * height
+        self.width = [1] * height
+
+class RankIndex:
+    # قائمة تخطي مفهرسة (indexable skiplist): التحديث وحساب الترتيب وجلب الصفحة كلها O(log n)
+    MAX_LEVELS = 24
+
+    def __init__(self):
+        self._end = _RankNode(_RankEnd(), None, None, 0)
+        self._head = _RankNode(None, None, None, self.MAX_LEVELS)
+        self._head.next = [self._end] * self.MAX_LEVELS
+        self._keys = {}
+        self.version = 0  # يزيد مع كل تعديل
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, member_id):
+        return member_id in self._keys
+
+    @staticmethod
+    def _make_key(member_id, score):
+        # الترتيب تنازلي حسب النقاط ثم تصاعدي حسب المعرف
+        if isinstance(score, tuple):
+            return tuple(-value for value in score) + (member_id,)
+        return (-score, member_id)
+
+    def _insert(self, key, member_id, score):
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        height = 1
+        while height < self.MAX_LEVELS and random.random() < 0.5:
+            height += 1
+        new_node = _RankNode(key, member_id, score, height)
+        steps = 0
+        for level in range(height):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+    def update(self, member_id, score):
+        key = self._make_key(member_id, score)
+        old_key = self._keys.get(member_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._remove(old_key)
+        self._insert(key, member_id, score)
+        self._keys[member_id] = key
+        self.version += 1
+
+    def discard(self, member_id):
+        key = self._keys.pop(member_id, None)
+        if key is not None:
+            self._remove(key)
+            self.version += 1
+
+    def rank(self, member_id):
+        # الترتيب يبدأ من 1، أو None إذا لم يكن العضو في الفهرس
+        key = self._keys.get(member_id)
+        if key is None:
+            return None
+        position = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position + 1
+
+    def page(self, offset, limit):
+        # قائمة (member_id, score) بدءاً من الموضع offset
+        if offset >= len(self._keys) or limit <= 0:
+            return []
+        node = self._head
+        remaining = offset + 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        result = []
+        while node is not self._end and len(result) < limit:
+            result.append((node.member_id, node.score))
+            node = node.next[0]
+        return result
+
+    def top(self, limit):
+        return self.page(0, limit)
+
+def level_score(record):
+    return (record["level"], record["xp"])
+
+def wealth_score(account):
+    return account.get("coins", 0) + account.get("bank", 0)
+
+def update_rank(index, member_id, score):
+    # الأصفار لا تدخل قوائم الثروة والسمعة، فلا تمتلئ بكل من كتب رسالة واحدة
+    if score:
+        index.update(member_id, score)
+    else:
+        index.discard(member_id)
+
+# ====================== فهرس التحذيرات ======================
+WARN_EXPIRY_DAYS = float(os.getenv("WARN_EXPIRY_DAYS", "0"))  # 0 يعني أن التحذيرات لا تنتهي
+# عدد:إجراء[:دقائق]؛ الافتراضي هو السلوك القديم (طرد عند 3)، ومثال لسلم أشد: "2:timeout:60,3:kick,5:ban"
+WARN_LADDER = os.getenv("WARN_LADDER", "3:kick")
+WHEEL_TICK = 60  # دقة عجلة المؤقتات بالثواني
+WHEEL_SLOTS = 1440  # دورة كاملة = يوم
+
+def parse_warn_ladder(spec):
+    ladder = {}
+    for step in spec.split(","):
+        parts = step.strip().split(":")
+        if len(parts) < 2:
+            continue
+        ladder[int(parts[0])] = (parts[1], int(parts[2]) if len(parts) > 2 else 0)
+    return ladder
+
+ESCALATION_LADDER = parse_warn_ladder(WARN_LADDER)
+ESCALATION_TOP = max(ESCALATION_LADDER, default=0)
+
+def escalation_for(count):
+    # بحث مباشر في القاموس، وما بعد آخر درجة يكرر أشدها
+    if count > ESCALATION_TOP:
+        return ESCALATION_LADDER.get(ESCALATION_TOP)
+    return ESCALATION_LADDER.get(count)
+
+def next_escalation(count):
+    for threshold in sorted(ESCALATION_LADDER):
+        if threshold > count:
+            return threshold, ESCALATION_LADDER[threshold]
+    return None
+
+class TimerWheel:
+    # عجلة مؤقتات: كل خانة تحمل ما ينتهي فيها، وكل نبضة تفحص خانة واحدة فقط
+    def __init__(self, tick=WHEEL_TICK, slots=WHEEL_SLOTS):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.cursor = 0
+        self._scheduled = set()
+        self._task = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def schedule(self, deadline, item):
+        if item in self._scheduled:
+            return
+        ticks = max(1, int(-(-(deadline - time.time()) // self.tick)))
+        slot = (self.cursor + ticks) % len(self.slots)
+        self.slots[slot].append([(ticks - 1) // len(self.slots), item])
+        self._scheduled.add(item)
+
+    def advance(self):
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        due, pending = [], []
+        for entry in self.slots[self.cursor]:
+            if entry[0] > 0:
+                entry[0] -= 1
+                pending.append(entry)
+            else:
+                due.append(entry[1])
+                self._scheduled.discard(entry[1])
+        self.slots[self.cursor] = pending
+        return due
+
+    def start(self, on_due):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(on_due))
+
+    async def _run(self, on_due):
+        while True:
+            await asyncio.sleep(self.tick)
+            for item in self.advance():
+                on_due(item)
+
+warning_wheel = TimerWheel()
+
+def warning_deadline(warn):
+    return datetime.fromisoformat(warn["timestamp"]).timestamp() + WARN_EXPIRY_DAYS * 86400
+
+class WarningIndex:
+    # معرفات تصاعدية لكل سيرفر مع فهرس معرف -> (عضو، تحذير)؛ عدد تحذيرات العضو هو طول قائمته
+    def __init__(self, guild_data):
+        self.data = guild_data
+        self.by_id = {}
+        self.version = 0  # يزيد مع كل إضافة أو حذف، لإبطال صفحات /تحذيرات
+        warnings = guild_data.warnings
+        ids = [warn["id"] for warns in warnings.values() for warn in warns]
+        if len(ids) != len(set(ids)):
+            self._renumber()
+        for user_id, warns in warnings.items():
+            for warn in warns:
+                self.by_id[warn["id"]] = (user_id, warn)
+        self.seq = max(guild_data.meta.get("warn_seq", 0), max(self.by_id, default=0))
+        if WARN_EXPIRY_DAYS > 0:
+            self._schedule_all()
+
+    def _renumber(self):
+        # المعرفات القديمة كانت لكل عضو على حدة فتتكرر داخل السيرفر؛ تُعاد بترتيب زمني
+        warnings = self.data.warnings
+        entries = sorted(
+            ((warn["timestamp"] or "", user_id, warn) for user_id, warns in warnings.items() for warn in warns),
+            key=lambda entry: entry[:2]
+        )
+        for new_id, (_, _, warn) in enumerate(entries, 1):
+            warn["id"] = new_id
+        for user_id in warnings:
+            warnings[user_id].sort(key=lambda warn: warn["id"])
+            self.data.touch("warnings", user_id)
+        self.data.meta["warn_seq"] = len(entries)
+        self.data.touch("meta", "warn_seq")
+
+    def _schedule_all(self):
+        now = time.time()
+        for warn_id, (_, warn) in list(self.by_id.items()):
+            deadline = warning_deadline(warn)
+            if deadline <= now:
+                self.remove(warn_id)
+            else:
+                warning_wheel.schedule(deadline, (self.data.guild_id, warn_id))
+
+    def count(self, user_id):
+        return len(self.data.warnings.get(user_id, ()))
+
+    def get(self, warn_id):
+        return self.by_id.get(warn_id)
+
+    def add(self, user_id, reason, moderator):
+        self.seq += 1
+        warn = {"id": self.seq, "reason": reason, "moderator": moderator, "timestamp": datetime.now().isoformat()}
+        self.data.warnings.setdefault(user_id, []).append(warn)
+        self.by_id[warn["id"]] = (user_id, warn)
+        self.data.meta["warn_seq"] = self.seq
+        self.version += 1
+        self.data.touch("warnings", user_id)
+        self.data.touch("meta", "warn_seq")
+        if WARN_EXPIRY_DAYS > 0:
+            warning_wheel.schedule(warning_deadline(warn), (self.data.guild_id, warn["id"]))
+        return warn
+
+    def remove(self, warn_id):
+        entry = self.by_id.pop(warn_id, None)
+        if entry is None:
+            return None
+        user_id, warn = entry
+        self.data.warnings[user_id].remove(warn)
+        self.version += 1
+        self.data.touch("warnings", user_id)
+        return entry
+
+def expire_warning(item):
+    # السيرفر غير المحمّل تُحذف تحذيراته المنتهية عند تحميله التالي
+    guild_id, warn_id = item
+    data = partitions.peek(guild_id)
+    if data is not None:
+        data.warn_index.remove(warn_id)
+
+# ====================== بيانات السيرفرات ======================
+class GuildData:
+    def __init__(self, guild_id, data=None):
+        data = data or {}
+        self.guild_id = guild_id
+        self.warnings = data.get("warnings", {})
+        self.levels = data.get("levels", {})
+        self.economy = data.get("economy", {})
+        self.reputation = data.get("reputation", {})
+        self.meta = data.get("meta", {})  # إعدادات السيرفر مثل عداد التحذيرات
+        self.level_rank = RankIndex()
+        for user_id, record in self.levels.items():
+            self.level_rank.update(user_id, level_score(record))
+        self.wealth_rank = RankIndex()
+        for user_id, account in self.economy.items():
+            update_rank(self.wealth_rank, user_id, wealth_score(account))
+        self.rep_rank = RankIndex()
+        for user_id, record in self.reputation.items():
+            update_rank(self.rep_rank, user_id, record.get("rep", 0))
+        self.warn_index = WarningIndex(self)
+        self.ledger = {}  # قيود الدفتر التي لم تُكتب بعد: seq -> قيد
+        self.last_access = time.monotonic()
+
+    def store(self, name):
+        return getattr(self, name)
+
+    def touch(self, store, user_id):
+        persistence.mark_dirty(store, self.guild_id, user_id)
+
+    def snapshot(self):
+        return {name: {k: copy_record(v) for k, v in self.store(name).items()} for name in GUILD_STORES}
+
+async def owns_legacy_data(guild_id):
+    # بيانات database.json القديمة لا تحمل معرف سيرفر، فتُنسب إلى LEGACY_GUILD_ID أو للسيرفر الوحيد.
+    # بدون LEGACY_GUILD_ID ننتظر on_ready حتى تكتمل bot.guilds، فلا يعتمد القرار على ترتيب أحداث البوابة
+    if not await persistence.run_io(storage.legacy_pending):
+        return False
+    if LEGACY_GUILD_ID:
+        return guild_id == LEGACY_GUILD_ID
+    await bot.wait_until_ready()
+    return len(bot.guilds) == 1 and str(bot.guilds[0].id) == guild_id
+
+class GuildPartitions:
+    def __init__(self):
+        self._loaded = {}
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._loaded)
+
+    def loaded(self):
+        return list(self._loaded.values())
+
+    def peek(self, guild_id):
+        return self._loaded.get(guild_id)
+
+    async def get(self, guild_id):
+        guild_id = str(guild_id)
+        data = self._loaded.get(guild_id)
+        if data is not None:
+            data.last_access = time.monotonic()
+            return data
+        # طلبات متزامنة لنفس السيرفر تنتظر تحميلاً واحداً
+        future = self._loading.get(guild_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(guild_id))
+            self._loading[guild_id] = future
+            future.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        return await asyncio.shield(future)
+
+    async def _load(self, guild_id):
+        raw = await persistence.run_io(storage.load_guild, guild_id, await owns_legacy_data(guild_id))
+        data = GuildData(guild_id, raw)
+        self._loaded[guild_id] = data
+        opened = ledger.open_guild(data)
+        if opened:
+            print(f"📒 تم فتح دفتر الاقتصاد للسيرفر {guild_id} ({opened} رصيد افتتاحي)")
+        return data
+
+    async def unload_idle(self, max_idle=GUILD_IDLE_SECONDS):
+        now = time.monotonic()
+        idle = [gid for gid, data in self._loaded.items() if now - data.last_access > max_idle]
+        if not idle:
+            return 0
+        await persistence.flush()
+        pending = persistence.pending_guilds()
+        unloaded = 0
+        for guild_id in idle:
+            data = self._loaded.get(guild_id)
+            if data is None or guild_id in pending or time.monotonic() - data.last_access <= max_idle:
+                continue
+            del self._loaded[guild_id]
+            unloaded += 1
+        return unloaded
+
+partitions = GuildPartitions()
+
+# ====================== تخزين SQLite ======================
+class SQLiteStorage:
+    SCHEMA_VERSION = 2
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS levels (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        xp INTEGER NOT NULL DEFAULT 0,
+        level INTEGER NOT NULL DEFAULT 1,
+        messages INTEGER NOT NULL DEFAULT 0,
+        last_xp TEXT,
+        PRIMARY KEY (guild_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS economy (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        coins INTEGER NOT NULL DEFAULT 0,
+        bank INTEGER NOT NULL DEFAULT 0,
+        last_daily TEXT,
+        PRIMARY KEY (guild_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS reputation (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        rep INTEGER NOT NULL DEFAULT 0,
+        last_rep TEXT,
+        PRIMARY KEY (guild_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS warnings (
+        guild_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        reason TEXT,
+        moderator TEXT,
+        timestamp TEXT,
+        PRIMARY KEY (guild_id, user_id, id)
+    );
+    CREATE TABLE IF NOT EXISTS tickets (
+        channel_id INTEGER PRIMARY KEY,
+        guild_id TEXT NOT NULL,
+        owner_id TEXT NOT NULL,
+        type TEXT,
+        accepted_by TEXT,
+        created_at TEXT,
+        status TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_tickets_owner ON tickets (guild_id, owner_id);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts TEXT NOT NULL,
+        guild_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        actor_id TEXT,
+        target_id TEXT,
+        details TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_audit_guild ON audit_log (guild_id, id);
+    CREATE TABLE IF NOT EXISTS ledger (
+        guild_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        tx INTEGER NOT NULL,
+        ts TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        coins INTEGER NOT NULL DEFAULT 0,
+        bank INTEGER NOT NULL DEFAULT 0,
+        ref TEXT,
+        PRIMARY KEY (guild_id, seq)
+    );
+    CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger (guild_id, user_id, seq);
+    """
+    COLUMNS = {
+        "levels": ("xp", "level", "messages", "last_xp"),
+        "economy": ("coins", "bank", "last_daily"),
+        "reputation": ("rep", "last_rep"),
+        "warnings": ("id", "reason", "moderator", "timestamp"),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        # الاتصال مشترك بين حلقة الأحداث وخيط الحفظ
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._upgrade_schema()
+        self.conn.executescript(self.SCHEMA)
+        # الترتيب يُحسب من RankIndex في الذاكرة، فهذا الفهرس القديم كان يبطئ كل كتابة بلا فائدة
+        self.conn.execute("DROP INDEX IF EXISTS idx_levels_rank")
+        self.conn.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+
+    def _upgrade_schema(self):
+        # الإصدار الأول كان بدون guild_id: تُنقل صفوفه إلى السيرفر القديم LEGACY_GUILD
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(levels)")]
+        if not columns or "guild_id" in columns:
+            return
+        script = ["BEGIN;"]
+        script += [f"ALTER TABLE {table} RENAME TO {table}_flat;" for table in self.COLUMNS]
+        script.append(self.SCHEMA)
+        for table, cols in self.COLUMNS.items():
+            names = ", ".join(("user_id",) + cols)
+            script.append(f"INSERT INTO {table} (guild_id, {names}) SELECT '{LEGACY_GUILD}', {names} FROM {table}_flat;")
+            script.append(f"DROP TABLE {table}_flat;")
+        script.append("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_pending', '1');")
+        script.append("COMMIT;")
+        self.conn.executescript("\n".join(script))
+        print("📦 تم تحديث قاعدة البيانات لتقسيم البيانات حسب السيرفر")
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    # ---------- الكتابة ----------
+    def _upsert_level(self, guild_id, user_id, rec):
+        self.conn.execute(
+            "INSERT INTO levels (guild_id, user_id, xp, level, messages, last_xp) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, user_id) DO UPDATE SET xp=excluded.xp, level=excluded.level, "
+            "messages=excluded.messages, last_xp=excluded.last_xp",
+            (guild_id, user_id, rec.get("xp", 0), rec.get("level", 1), rec.get("messages", 0), rec.get("last_xp"))
+        )
+
+    def _upsert_economy(self, guild_id, user_id, rec):
+        self.conn.execute(
+            "INSERT INTO economy (guild_id, user_id, coins, bank, last_daily) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, user_id) DO UPDATE SET coins=excluded.coins, bank=excluded.bank, "
+            "last_daily=excluded.last_daily",
+            (guild_id, user_id, rec.get("coins", 0), rec.get("bank", 0), rec.get("last_daily"))
+        )
+
+    def _upsert_reputation(self, guild_id, user_id, rec):
+        self.conn.execute(
+            "INSERT INTO reputation (guild_id, user_id, rep, last_rep) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, user_id) DO UPDATE SET rep=excluded.rep, last_rep=excluded.last_rep",
+            (guild_id, user_id, rec.get("rep", 0), rec.get("last_rep"))
+        )
+
+    def _replace_warnings(self, guild_id, user_id, warns):
+        # تحذيرات العضو تُستبدل ككتلة واحدة لأنها قائمة وليست سجلاً منفرداً
+        self.conn.execute("DELETE FROM warnings WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        self.conn.executemany(
+            "INSERT INTO warnings (guild_id, user_id, id, reason, moderator, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            [(guild_id, user_id, w["id"], w.get("reason"), w.get("moderator"), w.get("timestamp")) for w in warns]
+        )
+
+    def _write_ticket(self, guild_id, channel_id, ticket):
+        # None تعني أن التذكرة أُغلقت
+        if ticket is None:
+            self.conn.execute("DELETE FROM tickets WHERE channel_id = ?", (channel_id,))
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tickets (channel_id, guild_id, owner_id, type, accepted_by, created_at, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (channel_id, guild_id, ticket["owner_id"], ticket.get("type"), ticket.get("accepted_by"),
+             ticket.get("created_at"), ticket.get("status"))
+        )
+
+    def _write_guild_meta(self, guild_id, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"guild:{guild_id}:{key}", json.dumps(value))
+        )
+
+    def _append_ledger(self, guild_id, seq, entry):
+        # إلحاق فقط؛ OR IGNORE يجعل إعادة الدفعة بعد فشل الكتابة آمنة
+        self.conn.execute(
+            "INSERT OR IGNORE INTO ledger (guild_id, seq, tx, ts, user_id, kind, coins, bank, ref) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (guild_id, seq, entry["tx"], entry["ts"], entry["user_id"], entry["kind"], entry["coins"], entry["bank"], entry["ref"])
+        )
+
+    _UPSERTS = {
+        "levels": "_upsert_level",
+        "economy": "_upsert_economy",
+        "reputation": "_upsert_reputation",
+        "warnings": "_replace_warnings",
+        "tickets": "_write_ticket",
+        "meta": "_write_guild_meta",
+        "ledger": "_append_ledger",
+    }
+
+    def write_records(self, records):
+        # records: قائمة (store, guild_id, user_id, record) تُكتب داخل معاملة واحدة
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for store, guild_id, user_id, record in records:
+                    getattr(self, self._UPSERTS[store])(guild_id, user_id, record)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(records)
+
+    def collect(self, dirty):
+        # يُنفَّذ على حلقة الأحداث: نسخ السجلات المعدلة فقط
+        changes = []
+        for store, guild_id, user_id in dirty:
+            if store == "tickets":
+                ticket = tickets_by_channel.get(user_id)
+                changes.append((store, guild_id, user_id, dict(ticket) if ticket else None))
+                continue
+            data = partitions.peek(guild_id)
+            record = data.store(store).get(user_id) if data else None
+            if record is not None:
+                changes.append((store, guild_id, user_id, copy_record(record)))
+        return changes
+
+    def write_changes(self, changes):
+        # يعيد حجم البيانات المكتوبة بالبايت (حجم السجلات مُرمّزة، فصفحات SQLite لا تُقاس من هنا)
+        self.write_records(changes)
+        return sum(len(json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')) for _, _, _, record in changes if record is not None)
+
+    def committed(self, changes):
+        # قيود الدفتر تبقى في الذاكرة حتى تُكتب فعلاً، فلا تضيع إذا فشلت الدفعة
+        for store, guild_id, seq, _ in changes:
+            if store == "ledger":
+                release_ledger_entry(guild_id, seq)
+
+    def append_audit(self, events):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO audit_log (ts, guild_id, kind, actor_id, target_id, details) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(e["ts"], e["guild_id"], e["kind"], e["actor_id"], e["target_id"],
+                      json.dumps(e["details"], ensure_ascii=False)) for e in events]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(events)
+
+    # ---------- القراءة ----------
+    def load_tickets(self):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT channel_id, guild_id, owner_id, type, accepted_by, created_at, status FROM tickets"
+            ).fetchall()
+        return [
+            {"channel_id": r[0], "guild_id": r[1], "owner_id": r[2], "type": r[3],
+             "accepted_by": r[4], "created_at": r[5], "status": r[6]}
+            for r in rows
+        ]
+
+    def ledger_account(self, guild_id, user_id, limit):
+        # مجموع قيود العضو (الرصيد المعاد بناؤه) وآخر القيود للعرض
+        with self._lock:
+            coins, bank, last_seq, count = self.conn.execute(
+                "SELECT COALESCE(SUM(coins), 0), COALESCE(SUM(bank), 0), COALESCE(MAX(seq), 0), COUNT(*) "
+                "FROM ledger WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+            ).fetchone()
+            rows = self.conn.execute(
+                "SELECT seq, tx, ts, kind, coins, bank, ref FROM ledger WHERE guild_id = ? AND user_id = ? ORDER BY seq DESC LIMIT ?",
+                (guild_id, user_id, limit)
+            ).fetchall()
+        recent = [
+            {"seq": r[0], "tx": r[1], "ts": r[2], "user_id": user_id, "kind": r[3], "coins": r[4], "bank": r[5], "ref": r[6]}
+            for r in rows
+        ]
+        return {"coins": coins, "bank": bank, "last_seq": last_seq, "count": count, "recent": recent}
+
+    def legacy_pending(self):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_pending'").fetchone() is not None
+
+    def _adopt_legacy(self, guild_id):
+        # نقل صفوف السيرفر القديم إلى هذا السيرفر، مع تفضيل الصفوف الموجودة أصلاً
+        if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_pending'").fetchone():
+            return
+        self.conn.execute("BEGIN")
+        for table, cols in self.COLUMNS.items():
+            names = ", ".join(("user_id",) + cols)
+            self.conn.execute(
+                f"INSERT OR IGNORE INTO {table} (guild_id, {names}) SELECT ?, {names} FROM {table} WHERE guild_id = ?",
+                (guild_id, LEGACY_GUILD)
+            )
+            self.conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (LEGACY_GUILD,))
+        self.conn.execute("DELETE FROM meta WHERE key = 'legacy_pending'")
+        self.conn.execute("COMMIT")
+        print(f"📦 تم نقل البيانات القديمة إلى السيرفر {guild_id}")
+
+    def load_guild(self, guild_id, adopt_legacy=False):
+        with self._lock:
+            if adopt_legacy:
+                self._adopt_legacy(guild_id)
+            levels = {
+                r[0]: {"xp": r[1], "level": r[2], "messages": r[3], "last_xp": r[4]}
+                for r in self.conn.execute(
+                    "SELECT user_id, xp, level, messages, last_xp FROM levels WHERE guild_id = ?", (guild_id,)
+                )
+            }
+            economy = {
+                r[0]: {"coins": r[1], "bank": r[2], "last_daily": r[3]}
+                for r in self.conn.execute(
+                    "SELECT user_id, coins, bank, last_daily FROM economy WHERE guild_id = ?", (guild_id,)
+                )
+            }
+            reputation = {
+                r[0]: {"rep": r[1], "last_rep": r[2]}
+                for r in self.conn.execute(
+                    "SELECT user_id, rep, last_rep FROM reputation WHERE guild_id = ?", (guild_id,)
+                )
+            }
+            warnings = {}
+            for r in self.conn.execute(
+                "SELECT user_id, id, reason, moderator, timestamp FROM warnings WHERE guild_id = ? ORDER BY user_id, id",
+                (guild_id,)
+            ):
+                warnings.setdefault(r[0], []).append({"id": r[1], "reason": r[2], "moderator": r[3], "timestamp": r[4]})
+            prefix = f"guild:{guild_id}:"
+            meta = {
+                r[0][len(prefix):]: json.loads(r[1])
+                for r in self.conn.execute("SELECT key, value FROM meta WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff"))
+            }
+        return {"warnings": warnings, "levels": levels, "economy": economy, "reputation": reputation, "meta": meta}
+
+    # ---------- الترحيل ----------
+    def migrate_from_json(self, json_path):
+        # ترحيل لمرة واحدة من database.json إلى السيرفر القديم، وتُسجَّل العلامة في جدول meta
+        with self._lock:
+            done = self.conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done or not os.path.exists(json_path):
+            return 0
+        data = read_json_file(json_path)
+        if data is None:
+            return 0
+        records = [
+            (store, LEGACY_GUILD, user_id, record)
+            for store in self._UPSERTS
+            for user_id, record in data.get(store, {}).items()
+        ]
+        count = self.write_records(records)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (datetime.now().isoformat(),)
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_pending', '1')")
+        print(f"📦 تم ترحيل {count:,} سجل من {json_path} إلى {self.path}")
+        return count
+
+# ====================== تخزين JSON (ملف لكل سيرفر) ======================
+class JSONStorage:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def close(self):
+        pass
+
+    def path_for(self, guild_id):
+        return os.path.join(self.directory, f"{guild_id}.json")
+
+    def legacy_pending(self):
+        return os.path.exists(DATABASE_FILE)
+
+    def load_guild(self, guild_id, adopt_legacy=False):
+        path = self.path_for(guild_id)
+        data = read_json_file(path) if os.path.exists(path) else {}
+        if adopt_legacy and os.path.exists(DATABASE_FILE):
+            # دمج الملف القديم مع تفضيل بيانات السيرفر الموجودة، ثم إعادة تسميته حتى لا يُدمج مرتين
+            legacy = read_json_file(DATABASE_FILE) or {}
+            for store in GUILD_STORES:
+                merged = dict(legacy.get(store, {}))
+                merged.update(data.get(store, {}))
+                data[store] = merged
+            write_json(path, data)
+            os.replace(DATABASE_FILE, f"{DATABASE_FILE}.migrated")
+            print(f"📦 تم نقل البيانات القديمة إلى السيرفر {guild_id}")
+        return data
+
+    def load_tickets(self):
+        data = read_json_file(TICKETS_FILE) if os.path.exists(TICKETS_FILE) else None
+        return list((data or {}).values())
+
+    def collect(self, dirty):
+        # ملف JSON لا يدعم الكتابة الجزئية، فيُكتب ملف كل سيرفر تغيّر فقط
+        guild_ids = {guild_id for store, guild_id, _ in dirty if store != "tickets"}
+        guilds = {gid: partitions.peek(gid).snapshot() for gid in guild_ids if partitions.peek(gid)}
+        tickets = None
+        if any(store == "tickets" for store, _, _ in dirty):
+            tickets = {str(channel_id): dict(ticket) for channel_id, ticket in tickets_by_channel.items()}
+        entries = []
+        for store, guild_id, seq in sorted((key for key in dirty if key[0] == "ledger"), key=lambda key: key[2]):
+            data = partitions.peek(guild_id)
+            entry = data.ledger.get(seq) if data else None
+            if entry is not None:
+                entries.append(dict(entry, guild_id=guild_id, seq=seq))
+        return guilds, tickets, entries
+
+    def write_changes(self, changes):
+        guilds, tickets, entries = changes
+        written = 0
+        if entries:
+            # الدفتر يُكتب قبل الأرصدة: عند انهيار بينهما يبقى الدفتر هو المرجع لإعادة البناء
+            payload = "".join(json.dumps(e, ensure_ascii=False, separators=(',', ':')) + "\n" for e in entries).encode("utf-8")
+            with open(LEDGER_FILE, "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            written += len(payload)
+        for guild_id, data in guilds.items():
+            written += write_json(self.path_for(guild_id), data)
+        if tickets is not None:
+            written += write_json(TICKETS_FILE, tickets)
+        return written
+
+    def committed(self, changes):
+        for entry in changes[2]:
+            release_ledger_entry(entry["guild_id"], entry["seq"])
+
+    def ledger_account(self, guild_id, user_id, limit):
+        totals = {"coins": 0, "bank": 0, "last_seq": 0, "count": 0}
+        recent = deque(maxlen=limit)
+        if os.path.exists(LEDGER_FILE):
+            with open(LEDGER_FILE, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["guild_id"] != guild_id or entry["user_id"] != user_id:
+                        continue
+                    totals["coins"] += entry["coins"]
+                    totals["bank"] += entry["bank"]
+                    totals["last_seq"] = max(totals["last_seq"], entry["seq"])
+                    totals["count"] += 1
+                    recent.append(entry)
+        totals["recent"] = list(reversed(recent))
+        return totals
+
+    def append_audit(self, events):
+        # ملف إلحاق فقط: سطر JSON لكل حدث
+        payload = "".join(json.dumps(e, ensure_ascii=False, separators=(',', ':')) + "\n" for e in events)
+        with open(AUDIT_FILE, "a", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(events)
+
+    def migrate_from_json(self, json_path):
+        # الملف القديم يُدمج عند أول تحميل للسيرفر المالك له
+        return 0
+
+storage = SQLiteStorage(SQLITE_FILE) if STORAGE_BACKEND == "sqlite" else JSONStorage(GUILDS_DIR)
 
 def save_data():
-    with open(DATABASE_FILE, 'w') as f:
-        data_to_save = {
-            "warnings": warnings_db,
-            "levels": levels_db,
-            "economy": economy_db,
-            "reputation": rep_db
-        }
-        json.dump(data_to_save, f, indent=4)
+    # حفظ متزامن كامل لكل السيرفرات المحمّلة، يُستخدم فقط خارج حلقة الأحداث أو عند الطوارئ
+    ledger.settle_all()
+    dirty = {
+        (store, data.guild_id, user_id)
+        for data in partitions.loaded()
+        for store in GUILD_STORES + ("ledger",)
+        for user_id in data.store(store)
+    }
+    changes = storage.collect(dirty)
+    storage.write_changes(changes)
+    storage.committed(changes)
+    return len(dirty)
+
+# ====================== محرك الحفظ (Write-Behind) ======================
+SAVE_MAX_DELAY = float(os.getenv("SAVE_MAX_DELAY", "5"))     # أقصى مدة بين أول تعديل ووصوله للقرص
+SAVE_BATCH_SIZE = int(os.getenv("SAVE_BATCH_SIZE", "500"))   # حفظ فوري عند تراكم هذا العدد من السجلات
+
+class PersistenceEngine:
+    def __init__(self, collect, writer, committed=None, max_delay=SAVE_MAX_DELAY, batch_size=SAVE_BATCH_SIZE):
+        self.collect = collect
+        self.writer = writer
+        self.committed = committed
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.dirty_since = None
+        self.last_duration = 0.0
+        self.last_written = 0
+        self.last_latency = 0.0
+        self.total_written = 0
+        self.flush_count = 0
+        self._dirty = set()
+        self._wakeup = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+        self._write_lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def pending(self):
+        return len(self._dirty)
+
+    def pending_guilds(self):
+        return {guild_id for _, guild_id, _ in self._dirty}
+
+    def mark_dirty(self, store, guild_id, user_id):
+        # تسجيل السجل المعدل فقط، والحفظ يتم بعد max_delay أو عند امتلاء الدفعة
+        self._dirty.add((store, guild_id, user_id))
+        if self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+        self._wakeup.set()
+        if len(self._dirty) >= self.batch_size:
+            self._batch_full.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def run_io(self, func, *args):
+        # القراءات تمر بنفس خيط الحفظ حتى تُرى الكتابات السابقة دائماً
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def _run(self):
+        while not self._closing.is_set():
+            await self._wakeup.wait()
+            remaining = self.max_delay - (time.monotonic() - (self.dirty_since or time.monotonic()))
+            if remaining > 0 and not self._batch_full.is_set():
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ خطأ في الحفظ: {e}")
+                await asyncio.sleep(1)
+
+    async def flush(self):
+        async with self._write_lock:
+            if not self._dirty:
+                self._wakeup.clear()
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            dirty_since, self.dirty_since = self.dirty_since, None
+            self._wakeup.clear()
+            self._batch_full.clear()
+            changes = self.collect(dirty)
+            started = time.monotonic()
+            try:
+                written = await asyncio.get_running_loop().run_in_executor(self._executor, self.writer, changes)
+            except Exception:
+                # إعادة السجلات حتى لا تضيع التعديلات إذا فشلت الكتابة
+                save_failures.inc()
+                self._dirty |= dirty
+                self.dirty_since = dirty_since
+                self._wakeup.set()
+                raise
+            if self.committed:
+                self.committed(changes)
+            finished = time.monotonic()
+            self.last_duration = finished - started
+            self.last_latency = finished - dirty_since
+            self.last_written = len(dirty)
+            self.total_written += len(dirty)
+            self.flush_count += 1
+            save_seconds.observe(self.last_duration)
+            save_records.inc(amount=len(dirty))
+            save_bytes.inc(amount=written or 0)
+            return len(dirty)
+
+    async def close(self):
+        # حفظ أخير عند إيقاف البوت
+        self._closing.set()
+        self._wakeup.set()
+        self._batch_full.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+persistence = PersistenceEngine(storage.collect, storage.write_changes, storage.committed)
 
 # ====================== الرتب والقنوات الفخمة ======================
 ROLES = [
@@ -94,6 +1576,213 @@ CATEGORIES_AND_CHANNELS = {
     "ℹ️ • المعلومات": ["📜・القوانين", "👋・الترحيب", "📌・الروابط-المهمة", "📊・الإحصائيات", "📈・التوب"]
 }
 
+ROLE_RANKS = {name: rank for rank, name in enumerate(ROLE_HIERARCHY)}
+HIGH_STAFF_ROLES = ["👑 • المالك", "🔮 • المالك المشارك", "⚔️ • الإدارة"]
+STAFF_ROLES = HIGH_STAFF_ROLES + ["🛡️ • المشرف"]
+
+# ====================== كاش الرتب والقنوات ======================
+KNOWN_ROLE_NAMES = set(ROLE_HIERARCHY)
+KNOWN_CHANNEL_NAMES = set(CATEGORIES_AND_CHANNELS) | {name for names in CATEGORIES_AND_CHANNELS.values() for name in names}
+
+class GuildResolver:
+    # يحوّل أسماء رتب وقنوات البوت المعروفة إلى IDs بمسح واحد لكل سيرفر، ثم get_role/get_channel في O(1)
+    def __init__(self):
+        self._roles = {}     # guild_id -> {name: role_id}
+        self._channels = {}  # guild_id -> {(kind, name): channel_id}
+
+    @staticmethod
+    def _kind(channel):
+        if isinstance(channel, discord.CategoryChannel):
+            return "category"
+        if isinstance(channel, discord.TextChannel):
+            return "text"
+        return "other"
+
+    def _role_map(self, guild):
+        mapping = self._roles.get(guild.id)
+        if mapping is None:
+            mapping = {}
+            # نفس ترتيب guild.roles حتى تطابق النتيجة discord.utils.get عند تكرار الاسم
+            for role in guild.roles:
+                if role.name in KNOWN_ROLE_NAMES:
+                    mapping.setdefault(role.name, role.id)
+            self._roles[guild.id] = mapping
+        return mapping
+
+    def _channel_map(self, guild):
+        mapping = self._channels.get(guild.id)
+        if mapping is None:
+            mapping = {}
+            for channel in guild.channels:
+                if channel.name in KNOWN_CHANNEL_NAMES:
+                    mapping.setdefault((self._kind(channel), channel.name), channel.id)
+            self._channels[guild.id] = mapping
+        return mapping
+
+    def role(self, guild, name):
+        if name not in KNOWN_ROLE_NAMES:
+            return discord.utils.get(guild.roles, name=name)
+        role_id = self._role_map(guild).get(name)
+        return guild.get_role(role_id) if role_id else None
+
+    def role_ids(self, guild, names):
+        mapping = self._role_map(guild)
+        return {mapping[name] for name in names if name in mapping}
+
+    def _channel(self, guild, kind, name):
+        channel_id = self._channel_map(guild).get((kind, name))
+        return guild.get_channel(channel_id) if channel_id else None
+
+    def category(self, guild, name):
+        if name not in KNOWN_CHANNEL_NAMES:
+            return discord.utils.get(guild.categories, name=name)
+        return self._channel(guild, "category", name)
+
+    def text_channel(self, guild, name):
+        if name not in KNOWN_CHANNEL_NAMES:
+            return discord.utils.get(guild.text_channels, name=name)
+        return self._channel(guild, "text", name)
+
+    def invalidate_roles(self, guild_id):
+        self._roles.pop(guild_id, None)
+
+    def invalidate_channels(self, guild_id):
+        self._channels.pop(guild_id, None)
+
+    def forget(self, guild_id):
+        self.invalidate_roles(guild_id)
+        self.invalidate_channels(guild_id)
+
+resolver = GuildResolver()
+
+# ====================== سجل التدقيق ======================
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "5"))
+AUDIT_QUEUE_MAX = 500  # أقصى عدد أحداث تنتظر الإرسال لكل سيرفر، الأقدم يُسقط من القناة فقط
+AUDIT_EMBEDS_PER_MESSAGE = 10
+AUDIT_MESSAGE_CHARS = 5500  # حد ديسكورد لمجموع نصوص الـ embeds في رسالة واحدة 6000
+
+AUDIT_KINDS = {
+    "member_kick": ("👢 طرد عضو", WARN_COLOR),
+    "member_ban": ("⛔ حظر عضو", ERROR_COLOR),
+    "member_unban": ("🔓 فك حظر", SUCCESS_COLOR),
+    "member_timeout": ("⏳ إسكات عضو", WARN_COLOR),
+    "member_leave": ("👋 غادر العضو", ERROR_COLOR),
+    "role_give": ("🎖️ إعطاء رتبة", INFO_COLOR),
+    "warn_add": ("⚠️ تحذير جديد", WARN_COLOR),
+    "warn_remove": ("🗑️ حذف تحذير", SUCCESS_COLOR),
+    "purge": ("🧹 مسح رسائل", INFO_COLOR),
+    "slowmode": ("🐢 الوضع البطيء", INFO_COLOR),
+    "lockdown": ("🔒 قفل", ERROR_COLOR),
+    "unlock": ("🔓 فتح", SUCCESS_COLOR),
+    "raid_start": ("🚨 تم تفعيل وضع الغارة", ERROR_COLOR),
+    "raid_end": ("✅ انتهى وضع الغارة", SUCCESS_COLOR),
+    "ticket_open": ("🎫 فتح تذكرة", INFO_COLOR),
+    "ticket_accept": ("✋ قبول تذكرة", SUCCESS_COLOR),
+    "ticket_rename": ("📝 إعادة تسمية تذكرة", INFO_COLOR),
+    "ticket_add_user": ("➕ إضافة عضو لتذكرة", INFO_COLOR),
+    "ticket_transcript": ("📄 نسخة تذكرة", INFO_COLOR),
+    "ticket_close": ("🔒 إغلاق تذكرة", WARN_COLOR),
+    "ticket_delete": ("🗑️ حذف تذكرة", ERROR_COLOR),
+    "economy_transfer": ("💸 تحويل", MAIN_COLOR),
+    "economy_repair": ("🛠️ تصحيح رصيد", WARN_COLOR),
+}
+
+def build_audit_embed(event):
+    title, color = AUDIT_KINDS.get(event["kind"], (event["kind"], INFO_COLOR))
+    lines = []
+    if event["actor_id"]:
+        lines.append(f"**المنفذ:** <@{event['actor_id']}>")
+    if event["target_id"]:
+        lines.append(f"**العضو:** <@{event['target_id']}> (`{event['target_id']}`)")
+    embed = discord.Embed(title=title, description="\n".join(lines) or None, color=color)
+    for name, value in event["details"].items():
+        embed.add_field(name=name, value=str(value)[:200] or "-", inline=True)
+    embed.timestamp = datetime.fromisoformat(event["ts"])
+    return embed
+
+class AuditSink:
+    # الأحداث تُسجل فوراً في الذاكرة، ثم تُلحق بالسجل المحلي وتُرسل لقناة السجلات بدفعات
+    def __init__(self, interval=AUDIT_FLUSH_INTERVAL):
+        self.interval = interval
+        self.buffer = []
+        self.outbox = {}
+        self._task = None
+        self.published = 0
+        self.persisted = 0
+        self.messages_sent = 0
+        self.dropped = 0
+
+    def publish(self, guild_id, kind, actor_id=None, target_id=None, details=None):
+        event = {
+            "ts": datetime.now().isoformat(),
+            "guild_id": str(guild_id),
+            "kind": kind,
+            "actor_id": str(actor_id) if actor_id else None,
+            "target_id": str(target_id) if target_id else None,
+            "details": {name: value for name, value in (details or {}).items() if value is not None},
+        }
+        self.buffer.append(event)
+        box = self.outbox.setdefault(event["guild_id"], deque(maxlen=AUDIT_QUEUE_MAX))
+        if len(box) == box.maxlen:
+            self.dropped += 1
+        box.append(event)
+        self.published += 1
+        return event
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ خطأ في سجل التدقيق: {e}")
+
+    async def flush(self):
+        events, self.buffer = self.buffer, []
+        if events:
+            try:
+                await persistence.run_io(storage.append_audit, events)
+            except Exception:
+                self.buffer[:0] = events
+                raise
+            self.persisted += len(events)
+        for guild_id, box in list(self.outbox.items()):
+            guild = bot.get_guild(int(guild_id))
+            logs_channel = resolver.text_channel(guild, "📊・السجلات") if guild else None
+            if logs_channel is None:
+                # بدون قناة سجلات تبقى الأحداث في السجل المحلي فقط
+                del self.outbox[guild_id]
+                continue
+            while box:
+                embeds, size = [], 0
+                while box and len(embeds) < AUDIT_EMBEDS_PER_MESSAGE:
+                    embed = build_audit_embed(box[0])
+                    if embeds and size + len(embed) > AUDIT_MESSAGE_CHARS:
+                        break
+                    box.popleft()
+                    embeds.append(embed)
+                    size += len(embed)
+                try:
+                    await logs_channel.send(embeds=embeds)
+                    self.messages_sent += 1
+                except discord.HTTPException as e:
+                    print(f"⚠️ فشل إرسال السجلات في {guild_id}: {e}")
+                    break
+            if not box:
+                self.outbox.pop(guild_id, None)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+audit = AuditSink()
+
 # ====================== نظام التذاكر المتطور ======================
 class TicketTypeSelect(Select):
     def __init__(self):
@@ -113,15 +1802,16 @@ class TicketTypeSelect(Select):
         ticket_type = self.values[0]
 
         # التحقق من وجود تذكرة مفتوحة
-        if str(member.id) in tickets_db and any(ch.id == tickets_db[str(member.id)]["channel_id"] for ch in guild.channels):
-            embed = discord.Embed(title="❌ تذكرة مفتوحة بالفعل", description="لديك تذكرة مفتوحة بالفعل، يرجى إغلاقها أولاً.", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        open_tickets = guild_tickets(guild.id)
+        if str(member.id) in open_tickets and guild.get_channel(open_tickets[str(member.id)]["channel_id"]):
+            embed = EMBEDS["ticket_exists"].static("لديك تذكرة مفتوحة بالفعل، يرجى إغلاقها أولاً.")
+            await respond(interaction, embed=embed, ephemeral=True)
             return
 
-        category = discord.utils.get(guild.categories, name="🎫 • الدعم الفني")
+        category = resolver.category(guild, "🎫 • الدعم الفني")
         if not category:
-            embed = discord.Embed(title="❌ خطأ", description="لا يمكن العثور على قسم الدعم الفني.", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            embed = EMBEDS["error"].static("لا يمكن العثور على قسم الدعم الفني.")
+            await respond(interaction, embed=embed, ephemeral=True)
             return
 
         # إعداد الصلاحيات
@@ -131,9 +1821,9 @@ class TicketTypeSelect(Select):
             guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
         }
 
-        admin_role = discord.utils.get(guild.roles, name="⚔️ • الإدارة")
-        mod_role = discord.utils.get(guild.roles, name="🛡️ • المشرف")
-        coowner_role = discord.utils.get(guild.roles, name="🔮 • المالك المشارك")
+        admin_role = resolver.role(guild, "⚔️ • الإدارة")
+        mod_role = resolver.role(guild, "🛡️ • المشرف")
+        coowner_role = resolver.role(guild, "🔮 • المالك المشارك")
 
         if admin_role: overwrites[admin_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
         if mod_role: overwrites[mod_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
@@ -153,11 +1843,13 @@ class TicketTypeSelect(Select):
             "type": ticket_type, 
             "accepted_by": None, 
             "owner_id": str(member.id),
+            "guild_id": str(guild.id),
             "created_at": datetime.now().isoformat(),
             "status": "مفتوحة"
         }
-        tickets_db[str(member.id)] = ticket_data
-        tickets_by_channel[ticket_channel.id] = ticket_data
+        add_ticket(ticket_data)
+        ticket_events.inc("open")
+        audit.publish(guild.id, "ticket_open", target_id=member.id, details={"النوع": ticket_type, "القناة": ticket_channel.mention})
 
         # تعيين أسماء الأنواع
         type_names = {
@@ -192,14 +1884,14 @@ class TicketTypeSelect(Select):
         elif admin_role:
             mention_text = f"{admin_role.mention}"
 
-        await ticket_channel.send(content=mention_text, embeds=[terms_embed, embed], view=TicketManagementView(ticket_channel.id))
+        await ticket_channel.send(content=mention_text, embeds=[terms_embed, embed], view=TicketManagementView())
         
         success_embed = discord.Embed(
             title="✅ تم إنشاء التذكرة", 
             description=f"تم إنشاء تذكرتك في {ticket_channel.mention}", 
             color=SUCCESS_COLOR
         )
-        await interaction.response.send_message(embed=success_embed, ephemeral=True)
+        await respond(interaction, embed=success_embed, ephemeral=True)
 
 class TicketView(View):
     def __init__(self):
@@ -211,11 +1903,12 @@ class RenameModal(Modal, title="إعادة تسمية التذكرة"):
     async def on_submit(self, interaction: discord.Interaction):
         try:
             await interaction.channel.edit(name=self.new_name.value)
+            audit.publish(interaction.guild.id, "ticket_rename", actor_id=interaction.user.id, details={"القناة": interaction.channel.mention, "الاسم الجديد": self.new_name.value})
             embed = discord.Embed(title="✅ تم التعديل", description=f"تم تغيير اسم القناة إلى: **{self.new_name.value}**", color=SUCCESS_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await respond(interaction, embed=embed, ephemeral=True)
         except Exception as e:
-            embed = discord.Embed(title="❌ خطأ", description=f"حدث خطأ: {e}", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            embed = EMBEDS["error"].render(f"حدث خطأ: {e}")
+            await respond(interaction, embed=embed, ephemeral=True)
 
 class AddUserModal(Modal, title="إضافة عضو للتذكرة"):
     user_id = TextInput(label="معرف العضو (ID)", placeholder="أدخل ID العضو...", required=True)
@@ -228,44 +1921,191 @@ class AddUserModal(Modal, title="إضافة عضو للتذكرة"):
             overwrites = interaction.channel.overwrites_for(user)
             overwrites.update(read_messages=True, send_messages=True)
             await interaction.channel.set_permissions(user, overwrite=overwrites)
+            audit.publish(interaction.guild.id, "ticket_add_user", actor_id=interaction.user.id, target_id=user.id, details={"القناة": interaction.channel.mention})
             
             embed = discord.Embed(title="✅ تمت الإضافة", description=f"تم إضافة {user.mention} للتذكرة", color=SUCCESS_COLOR)
-            await interaction.response.send_message(embed=embed)
+            await respond(interaction, embed=embed)
         except Exception as e:
-            embed = discord.Embed(title="❌ خطأ", description=f"حدث خطأ: {e}", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            embed = EMBEDS["error"].render(f"حدث خطأ: {e}")
+            await respond(interaction, embed=embed, ephemeral=True)
+
+# ====================== نسخ التذاكر ======================
+TRANSCRIPT_MAX_BYTES = int(os.getenv("TRANSCRIPT_MAX_BYTES", str(8 * 1024 * 1024)))  # حد الذاكرة لكل عملية نسخ
+TRANSCRIPT_CONCURRENCY = int(os.getenv("TRANSCRIPT_CONCURRENCY", "2"))
+transcript_slots = asyncio.Semaphore(TRANSCRIPT_CONCURRENCY)
+
+class TextTranscript:
+    extension = "txt"
+
+    def __init__(self, channel, compress=False, max_bytes=TRANSCRIPT_MAX_BYTES):
+        self.channel = channel
+        self.compress = compress
+        # zlib يحتفظ بجزء من البيانات داخلياً قبل إخراجه، فيُترك هامش عند الضغط
+        self.max_bytes = int(max_bytes * 0.9) if compress else max_bytes
+        self.count = 0
+        self.truncated = False
+        # الكتابة تتم مباشرة في ذاكرة مؤقتة (مضغوطة اختيارياً) بدلاً من تجميع الرسائل في قائمة
+        self.buffer = io.BytesIO()
+        self._sink = gzip.GzipFile(fileobj=self.buffer, mode="wb") if compress else self.buffer
+
+    @property
+    def filename(self):
+        name = f"transcript-{self.channel.id}.{self.extension}"
+        return f"{name}.gz" if self.compress else name
+
+    def write(self, text):
+        self._sink.write(text.encode("utf-8"))
+
+    def header(self):
+        self.write(f"# {self.channel.name} ({self.channel.id})\n")
+
+    def footer(self):
+        if self.truncated:
+            self.write("\n... تم إيقاف النسخ عند الحد الأقصى للحجم\n")
+
+    def format(self, msg):
+        line = f"[{msg.created_at.strftime('%Y-%m-%d %H:%M')}] {msg.author.name}: {msg.content}\n"
+        for attachment in msg.attachments:
+            line += f"    📎 {attachment.url}\n"
+        return line
+
+    def add(self, msg):
+        if self.buffer.tell() >= self.max_bytes:
+            self.truncated = True
+            return False
+        self.write(self.format(msg))
+        self.count += 1
+        return True
+
+    def finish(self):
+        self.footer()
+        if self.compress:
+            self._sink.close()
+        self.buffer.seek(0)
+        return discord.File(self.buffer, filename=self.filename)
+
+class JSONLTranscript(TextTranscript):
+    extension = "jsonl"
+
+    def header(self):
+        pass
+
+    def footer(self):
+        if self.truncated:
+            self.write(json.dumps({"truncated": True}) + "\n")
+
+    def format(self, msg):
+        return json.dumps({
+            "id": str(msg.id),
+            "author_id": str(msg.author.id),
+            "author": msg.author.name,
+            "created_at": msg.created_at.isoformat(),
+            "content": msg.content,
+            "attachments": [attachment.url for attachment in msg.attachments],
+            "embeds": len(msg.embeds)
+        }, ensure_ascii=False) + "\n"
+
+class HTMLTranscript(TextTranscript):
+    extension = "html"
+
+    def header(self):
+        self.write(
+            '<!DOCTYPE html><html dir="rtl"><head><meta charset="utf-8">'
+            f"<title>{html.escape(self.channel.name)}</title>"
+            "<style>body{font-family:sans-serif;background:#313338;color:#dbdee1}"
+            ".m{padding:4px 8px}.a{font-weight:bold;color:#fff}.t{color:#949ba4;font-size:12px}</style>"
+            f"</head><body><h2>{html.escape(self.channel.name)}</h2>\n"
+        )
+
+    def footer(self):
+        if self.truncated:
+            self.write("<p>... تم إيقاف النسخ عند الحد الأقصى للحجم</p>")
+        self.write("</body></html>\n")
+
+    def format(self, msg):
+        attachments = "".join(
+            f'<div><a href="{html.escape(a.url)}">{html.escape(a.filename)}</a></div>' for a in msg.attachments
+        )
+        return (
+            f'<div class="m"><span class="a">{html.escape(msg.author.name)}</span> '
+            f'<span class="t">{msg.created_at.strftime("%Y-%m-%d %H:%M")}</span>'
+            f"<div>{html.escape(msg.content)}</div>{attachments}</div>\n"
+        )
+
+TRANSCRIPT_FORMATS = {"txt": TextTranscript, "html": HTMLTranscript, "jsonl": JSONLTranscript}
+
+async def export_transcript(channel, fmt="txt", compress=False):
+    # channel.history تجلب الرسائل على صفحات من 100 فلا يوجد حد 1000 ولا قائمة كاملة في الذاكرة
+    max_bytes = min(TRANSCRIPT_MAX_BYTES, channel.guild.filesize_limit)
+    writer = TRANSCRIPT_FORMATS[fmt](channel, compress=compress, max_bytes=max_bytes)
+    async with transcript_slots:
+        writer.header()
+        async for msg in channel.history(limit=None, oldest_first=True):
+            if not writer.add(msg):
+                break
+        return writer.finish(), writer
+
+class TranscriptOptionsView(View):
+    def __init__(self):
+        super().__init__(timeout=120)
+        self.fmt = "txt"
+        self.compress = False
+
+    @discord.ui.select(placeholder="📄 صيغة النسخة", options=[
+        discord.SelectOption(label="نص", value="txt", emoji="📄", default=True),
+        discord.SelectOption(label="صفحة HTML", value="html", emoji="🌐"),
+        discord.SelectOption(label="JSONL", value="jsonl", emoji="🧾"),
+    ])
+    async def format_select(self, interaction: discord.Interaction, select: Select):
+        self.fmt = select.values[0]
+        await defer_response(interaction)
+
+    @discord.ui.select(placeholder="🗜️ الضغط", options=[
+        discord.SelectOption(label="بدون ضغط", value="none", default=True),
+        discord.SelectOption(label="ضغط gzip", value="gzip"),
+    ])
+    async def compress_select(self, interaction: discord.Interaction, select: Select):
+        self.compress = select.values[0] == "gzip"
+        await defer_response(interaction)
+
+    @discord.ui.button(label="إنشاء النسخة", style=discord.ButtonStyle.green, emoji="📄")
+    async def export(self, interaction: discord.Interaction, button: Button):
+        await defer_response(interaction, ephemeral=True, thinking=True)
+        file, writer = await export_transcript(interaction.channel, self.fmt, self.compress)
+        audit.publish(interaction.guild.id, "ticket_transcript", actor_id=interaction.user.id, details={"القناة": interaction.channel.mention, "الصيغة": self.fmt, "الرسائل": writer.count})
+        
+        embed = discord.Embed(title="📄 تم إنشاء النسخة", description=f"تم نسخ **{writer.count:,}** رسالة من التذكرة", color=SUCCESS_COLOR)
+        if writer.truncated:
+            embed.add_field(name="⚠️ تنبيه", value="تم إيقاف النسخ عند الحد الأقصى لحجم الملف.", inline=False)
+        await interaction.followup.send(embed=embed, file=file, ephemeral=True)
 
 class TicketManagementView(View):
-    def __init__(self, channel_id):
+    # عرض دائم واحد يخدم كل التذاكر: التذكرة تُحدد من قناة التفاعل، فيعمل بعد إعادة التشغيل بدون تسجيل لكل قناة
+    def __init__(self):
         super().__init__(timeout=None)
-        self.channel_id = channel_id
 
     @discord.ui.button(label="✋ قبول التذكرة", style=discord.ButtonStyle.green, custom_id="accept_ticket", emoji="✋")
     async def accept_ticket(self, interaction: discord.Interaction, button: Button):
-        ticket_data = tickets_by_channel.get(self.channel_id)
+        ticket_data = tickets_by_channel.get(interaction.channel_id)
         if not ticket_data:
+            embed = EMBEDS["error"].static("هذه القناة ليست تذكرة مفتوحة.")
+            await respond(interaction, embed=embed, ephemeral=True)
             return
         
         if ticket_data["accepted_by"]:
             embed = discord.Embed(title="❌ تم قبولها مسبقاً", description=f"التذكرة مقبولة بالفعل من قبل <@{ticket_data['accepted_by']}>", color=WARN_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await respond(interaction, embed=embed, ephemeral=True)
             return
         
         ticket_data["accepted_by"] = str(interaction.user.id)
         ticket_data["status"] = "قيد المعالجة"
-        tickets_by_channel[self.channel_id] = ticket_data
         
         # تحديث قاعدة البيانات
-        owner_id = ticket_data["owner_id"]
-        if owner_id in tickets_db:
-            tickets_db[owner_id] = ticket_data
+        touch_ticket(ticket_data)
+        audit.publish(interaction.guild.id, "ticket_accept", actor_id=interaction.user.id, target_id=ticket_data["owner_id"], details={"القناة": interaction.channel.mention})
         
         embed = discord.Embed(title="✅ تم قبول التذكرة", description=f"التذكرة الآن تحت إشراف {interaction.user.mention}", color=SUCCESS_COLOR)
-        await interaction.response.send_message(embed=embed)
-        
-        # إضافة زر جديد للإغلاق
-        self.add_item(Button(label="🔒 إغلاق", style=discord.ButtonStyle.red, custom_id="close_ticket_btn", emoji="🔒"))
-        await interaction.message.edit(view=self)
+        await respond(interaction, embed=embed)
 
     @discord.ui.button(label="📝 إعادة تسمية", style=discord.ButtonStyle.blurple, custom_id="rename_ticket", emoji="📝")
     async def rename_ticket(self, interaction: discord.Interaction, button: Button):
@@ -277,27 +2117,12 @@ class TicketManagementView(View):
 
     @discord.ui.button(label="📄 نسخة", style=discord.ButtonStyle.gray, custom_id="transcript", emoji="📄")
     async def transcript(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.defer(ephemeral=True)
-        
-        messages = []
-        async for msg in interaction.channel.history(limit=1000, oldest_first=True):
-            messages.append(f"[{msg.created_at.strftime('%Y-%m-%d %H:%M')}] {msg.author.name}: {msg.content}")
-        
-        transcript = "\n".join(messages)
-        
-        # إنشاء ملف نصي
-        filename = f"transcript-{interaction.channel.name}.txt"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(transcript)
-        
-        embed = discord.Embed(title="📄 تم إنشاء النسخة", description="تم إنشاء نسخة من التذكرة", color=SUCCESS_COLOR)
-        await interaction.followup.send(embed=embed, file=discord.File(filename), ephemeral=True)
-        
-        os.remove(filename)
+        embed = EMBEDS["transcript_options"].static("اختر صيغة النسخة ثم اضغط على إنشاء النسخة.")
+        await respond(interaction, embed=embed, view=TranscriptOptionsView(), ephemeral=True)
 
     @discord.ui.button(label="🔒 إغلاق التذكرة", style=discord.ButtonStyle.danger, custom_id="close_ticket_btn", emoji="🔒")
     async def close_ticket(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.defer(ephemeral=True)
+        await defer_response(interaction, ephemeral=True)
         
         # تأكيد الإغلاق
         confirm_view = View()
@@ -312,11 +2137,9 @@ class TicketManagementView(View):
             await interaction_confirm.response.send_message("⏳ جاري إغلاق التذكرة خلال 5 ثواني...", ephemeral=False)
             
             # حذف التذكرة من قاعدة البيانات
-            owner_id = tickets_by_channel.get(self.channel_id, {}).get("owner_id")
-            if owner_id and owner_id in tickets_db:
-                del tickets_db[owner_id]
-            if self.channel_id in tickets_by_channel:
-                del tickets_by_channel[self.channel_id]
+            ticket = remove_ticket(interaction.channel_id)
+            ticket_events.inc("close")
+            audit.publish(interaction.guild.id, "ticket_close", actor_id=interaction.user.id, target_id=ticket["owner_id"] if ticket else None, details={"القناة": interaction.channel.name})
             
             await asyncio.sleep(5)
             try:
@@ -336,34 +2159,105 @@ class TicketManagementView(View):
         confirm_view.add_item(confirm_button)
         confirm_view.add_item(cancel_button)
         
-        embed = discord.Embed(title="⚠️ تأكيد الإغلاق", description="هل أنت متأكد من إغلاق هذه التذكرة؟", color=WARN_COLOR)
+        embed = EMBEDS["confirm_close"].static("هل أنت متأكد من إغلاق هذه التذكرة؟")
         await interaction.followup.send(embed=embed, view=confirm_view, ephemeral=True)
 
     @discord.ui.button(label="🗑️ حذف فوري", style=discord.ButtonStyle.red, custom_id="delete_ticket", emoji="🗑️")
     async def delete_ticket(self, interaction: discord.Interaction, button: Button):
-        high_staff = ["👑 • المالك", "🔮 • المالك المشارك", "⚔️ • الإدارة"]
-        user_roles = [role.name for role in interaction.user.roles]
+        high_staff = resolver.role_ids(interaction.guild, HIGH_STAFF_ROLES)
         
-        if not any(role in high_staff for role in user_roles):
-            embed = discord.Embed(title="❌ صلاحية مرفوضة", description="هذه الصلاحية للإدارة العليا فقط.", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        if not any(role.id in high_staff for role in interaction.user.roles):
+            embed = EMBEDS["denied"].static("هذه الصلاحية للإدارة العليا فقط.")
+            await respond(interaction, embed=embed, ephemeral=True)
             return
 
-        embed = discord.Embed(title="🗑️ حذف فوري", description="سيتم حذف القناة فوراً...", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=False)
+        embed = EMBEDS["ticket_delete_now"].static("سيتم حذف القناة فوراً...")
+        await respond(interaction, embed=embed, ephemeral=False)
         
         # حذف التذكرة من قاعدة البيانات
-        owner_id = tickets_by_channel.get(self.channel_id, {}).get("owner_id")
-        if owner_id and owner_id in tickets_db:
-            del tickets_db[owner_id]
-        if self.channel_id in tickets_by_channel:
-            del tickets_by_channel[self.channel_id]
+        ticket = remove_ticket(interaction.channel_id)
+        ticket_events.inc("delete")
+        audit.publish(interaction.guild.id, "ticket_delete", actor_id=interaction.user.id, target_id=ticket["owner_id"] if ticket else None, details={"القناة": interaction.channel.name})
 
         try:
             await interaction.channel.delete(reason=f"حذف فوري بواسطة {interaction.user}")
         except discord.NotFound:
             pass
 
+# ==================== ذاكرة فترات الانتظار ====================
+class CooldownCache:
+    # تخزن وقت انتهاء الانتظار كرقم monotonic لكل عضو، فالفحص مقارنة واحدة بدلاً من تحليل نص ISO
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._expires = {}
+        self._next_sweep = time.monotonic() + seconds
+
+    def __len__(self):
+        return len(self._expires)
+
+    def __contains__(self, key):
+        return key in self._expires
+
+    def _maybe_sweep(self, now):
+        # كل المداخل (hit وstart وremaining) تمر هنا، فكاش اليومي والسمعة يُنظف أيضاً
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+    def remaining(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        self._maybe_sweep(now)
+        expires = self._expires.get(key)
+        if expires is None or expires <= now:
+            return 0.0
+        return expires - now
+
+    def start(self, key, now=None, elapsed=0.0):
+        now = time.monotonic() if now is None else now
+        self._maybe_sweep(now)
+        self._expires[key] = now + self.seconds - elapsed
+
+    def hit(self, key, now=None):
+        # يعيد 0 ويبدأ الانتظار إذا كان العضو متاحاً، وإلا يعيد الوقت المتبقي
+        now = time.monotonic() if now is None else now
+        self._maybe_sweep(now)
+        expires = self._expires.get(key)
+        if expires is not None and expires > now:
+            return expires - now
+        self._expires[key] = now + self.seconds
+        return 0.0
+
+    def remaining_since(self, key, last_iso):
+        # للأوامر التي يجب أن يبقى انتظارها بعد إعادة التشغيل: يُبذر الكاش من الوقت المحفوظ مرة واحدة
+        if key in self._expires or not last_iso:
+            return self.remaining(key)
+        elapsed = (datetime.now() - datetime.fromisoformat(last_iso)).total_seconds()
+        if elapsed >= self.seconds:
+            return 0.0
+        self.start(key, elapsed=elapsed)
+        return self.remaining(key)
+
+    def sweep(self, now=None):
+        # حذف المنتهية دورياً حتى لا يكبر القاموس مع كل عضو مرّ على البوت
+        now = time.monotonic() if now is None else now
+        expired = [key for key, expires in self._expires.items() if expires <= now]
+        for key in expired:
+            del self._expires[key]
+        self._next_sweep = now + self.seconds
+        return len(expired)
+
+XP_COOLDOWN = 60
+DAILY_COOLDOWN = timedelta(hours=23, minutes=30).total_seconds()
+REP_COOLDOWN = timedelta(hours=12).total_seconds()
+
+xp_cooldowns = CooldownCache(XP_COOLDOWN)
+daily_cooldowns = CooldownCache(DAILY_COOLDOWN)
+rep_cooldowns = CooldownCache(REP_COOLDOWN)
+
+def format_wait(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}س {minutes}د"
+
 # ==================== نظام المستويات والاقتصاد المتطور ====================
 @bot.event
 async def on_message(message):
@@ -372,56 +2266,54 @@ async def on_message(message):
     
     user_id = str(message.author.id)
     guild_id = str(message.guild.id)
-    
-    # نظام المستويات
-    if user_id not in levels_db:
-        levels_db[user_id] = {"xp": 0, "level": 1, "messages": 0, "last_xp": datetime.now().isoformat()}
+    messages_processed.inc()
     
     # منع الـ XP المستمر
-    last_xp_time = datetime.fromisoformat(levels_db[user_id]["last_xp"])
-    if datetime.now() - last_xp_time < timedelta(seconds=60):
+    if xp_cooldowns.hit((guild_id, user_id)):
+        cooldown_hits.inc("xp")
         await bot.process_commands(message)
         return
     
-    levels_db[user_id]["messages"] += 1
-    levels_db[user_id]["xp"] += random.randint(10, 25)
-    levels_db[user_id]["last_xp"] = datetime.now().isoformat()
+    guild_data = await partitions.get(guild_id)
+    
+    # نظام المستويات
+    if user_id not in guild_data.levels:
+        guild_data.levels[user_id] = {"xp": 0, "level": 1, "messages": 0, "last_xp": datetime.now().isoformat()}
+    
+    gained = random.randint(10, 25)
+    guild_data.levels[user_id]["messages"] += 1
+    guild_data.levels[user_id]["xp"] += gained
+    xp_awards.inc()
+    xp_points.inc(amount=gained)
     
-    xp = levels_db[user_id]["xp"]
-    level = levels_db[user_id]["level"]
+    xp = guild_data.levels[user_id]["xp"]
+    level = guild_data.levels[user_id]["level"]
     xp_needed = level * 150 + (level * 50)
     
     if xp >= xp_needed:
-        levels_db[user_id]["level"] += 1
-        levels_db[user_id]["xp"] = 0
-        new_level = levels_db[user_id]["level"]
+        guild_data.levels[user_id]["level"] += 1
+        guild_data.levels[user_id]["xp"] = 0
+        new_level = guild_data.levels[user_id]["level"]
+        level_ups.inc()
         
         # مكافأة الترقية
-        if user_id not in economy_db:
-            economy_db[user_id] = {"coins": 0, "bank": 0, "last_daily": None}
-        economy_db[user_id]["coins"] += new_level * 100
+        ledger.credit(guild_data, user_id, "level_up", new_level * 100, ref=str(new_level))
         
-        embed = discord.Embed(
-            title="🎉 ترقية مستوى!", 
-            description=f"مبروك {message.author.mention}، لقد وصلت للمستوى **{new_level}**!\n🎁 حصلت على **{new_level * 100}** 🪙", 
-            color=0xFFD700
-        )
+        embed = EMBEDS["level_up"].render(mention=message.author.mention, level=new_level, reward=new_level * 100)
         embed.set_thumbnail(url=message.author.display_avatar.url)
         await message.channel.send(embed=embed, delete_after=15)
     
-    # نظام الاقتصاد
-    if user_id not in economy_db:
-        economy_db[user_id] = {"coins": 0, "bank": 0, "last_daily": None}
+    guild_data.level_rank.update(user_id, level_score(guild_data.levels[user_id]))
     
-    economy_db[user_id]["coins"] += random.randint(2, 5)
+    # نظام الاقتصاد
+    ledger.accrue(guild_data, user_id, random.randint(2, 5))
     
     # نظام السمعة
-    if user_id not in rep_db:
-        rep_db[user_id] = {"rep": 0, "last_rep": None}
+    if user_id not in guild_data.reputation:
+        guild_data.reputation[user_id] = {"rep": 0, "last_rep": None}
+        guild_data.touch("reputation", user_id)
     
-    # حفظ تلقائي عشوائي
-    if random.randint(1, 50) == 1:
-        save_data()
+    guild_data.touch("levels", user_id)
 
     await bot.process_commands(message)
 
@@ -431,7 +2323,32 @@ async def ping_slash(interaction: discord.Interaction):
     latency = round(bot.latency * 1000)
     embed = discord.Embed(title="🏓 بينج!", description=f"سرعة الاستجابة: **{latency}ms**", color=INFO_COLOR)
     embed.set_footer(text=f"طلب بواسطة {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
+
+@bot.tree.command(name="احصائيات_البوت", description="إحصائيات أداء البوت وزمن تنفيذ الأوامر", extras={"ephemeral": True})
+@app_commands.checks.has_permissions(administrator=True)
+async def bot_stats_slash(interaction: discord.Interaction):
+    embed = discord.Embed(title="📊 إحصائيات البوت", color=INFO_COLOR)
+    embed.add_field(name="🏓 البوابة", value=f"{bot.latency * 1000:.0f}ms", inline=True)
+    embed.add_field(name="🗂️ سيرفرات محمّلة", value=f"{len(partitions)}/{len(bot.guilds)}", inline=True)
+    embed.add_field(name="💾 الحفظ", value=f"{persistence.pending} معلق | آخر دفعة {persistence.last_duration * 1000:.0f}ms", inline=True)
+    joins = join_pipeline.stats()
+    embed.add_field(name="👥 الانضمام", value=f"طابور {joins['role_queue']} | تأخير {joins['role_lag']:.1f}s", inline=True)
+    embed.add_field(name="📜 السجلات", value=f"{audit.published:,} حدث | {audit.messages_sent:,} رسالة", inline=True)
+    
+    ranked = sorted(command_stats.items(), key=lambda item: item[1].count, reverse=True)[:15]
+    lines = []
+    for name, stats in ranked:
+        p50, p95, p99 = stats.percentiles(50, 95, 99)
+        extra = ""
+        if stats.deferred:
+            extra += f" ⏳{stats.deferred}"
+        if stats.errors:
+            extra += f" ❌{stats.errors}"
+        lines.append(f"`{name}` ×{stats.count} | {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f}ms{extra}")
+    embed.add_field(name="⚡ زمن الأوامر (p50 / p95 / p99)", value="\n".join(lines)[:1024] or "لا توجد بيانات بعد", inline=False)
+    embed.set_footer(text=f"تأجيل تلقائي بعد {INTERACTION_DEFER_BUDGET:.1f} ثانية")
+    await respond(interaction, embed=embed, ephemeral=True)
 
 @bot.tree.command(name="serverinfo", description="عرض معلومات السيرفر")
 async def serverinfo_slash(interaction: discord.Interaction):
@@ -446,7 +2363,7 @@ async def serverinfo_slash(interaction: discord.Interaction):
     embed.add_field(name="💬 القنوات", value=len(guild.channels), inline=True)
     embed.add_field(name="🌟 البوسترز", value=guild.premium_subscription_count, inline=True)
     embed.set_footer(text=f"ID: {guild.id}")
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
 @bot.tree.command(name="userinfo", description="عرض معلومات المستخدم")
 @app_commands.describe(member="العضو")
@@ -467,7 +2384,7 @@ async def userinfo_slash(interaction: discord.Interaction, member: discord.Membe
     
     embed.add_field(name="🎨 اللون", value=str(member.color), inline=True)
     embed.set_footer(text=f"طلب بواسطة {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
 @bot.tree.command(name="avatar", description="عرض صورة العضو")
 @app_commands.describe(member="العضو")
@@ -476,15 +2393,17 @@ async def avatar_slash(interaction: discord.Interaction, member: discord.Member
     embed = discord.Embed(title=f"🖼️ صورة {member.display_name}", color=member.color)
     embed.set_image(url=member.display_avatar.url)
     embed.set_footer(text=f"طلب بواسطة {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
 @bot.tree.command(name="مستوى", description="عرض مستوى العضو وخبرته")
 @app_commands.describe(member="العضو الذي تريد عرض مستواه")
+@app_commands.guild_only()
 async def level_slash(interaction: discord.Interaction, member: discord.Member = None):
+    guild_data = await partitions.get(interaction.guild.id)
     member = member or interaction.user
     user_id = str(member.id)
     
-    data = levels_db.get(user_id, {"xp": 0, "level": 1, "messages": 0})
+    data = guild_data.levels.get(user_id, {"xp": 0, "level": 1, "messages": 0})
     xp_needed = data["level"] * 150 + (data["level"] * 50)
     
     progress = int((data['xp'] / xp_needed) * 20) if xp_needed > 0 else 0
@@ -495,239 +2414,1199 @@ async def level_slash(interaction: discord.Interaction, member: discord.Member =
     embed.add_field(name="🏆 المستوى", value=f"**{data['level']}**", inline=True)
     embed.add_field(name="💬 الرسائل", value=f"**{data['messages']:,}**", inline=True)
     embed.add_field(name="⭐ الخبرة", value=f"**{data['xp']} / {xp_needed}**", inline=True)
+    rank = guild_data.level_rank.rank(user_id)
+    if rank:
+        embed.add_field(name="🏅 الترتيب", value=f"**#{rank:,}** من {len(guild_data.level_rank):,}", inline=True)
     embed.add_field(name="📈 التقدم", value=f"`{progress_bar}` **{int((data['xp']/xp_needed)*100)}%**", inline=False)
     embed.set_footer(text=f"ID: {member.id}")
     
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
-@bot.tree.command(name="ترتيب", description="عرض قائمة المتصدرين في المستويات")
-async def leaderboard_slash(interaction: discord.Interaction):
-    sorted_users = sorted(levels_db.items(), key=lambda item: (item[1]['level'], item[1]['xp']), reverse=True)[:10]
-    
-    embed = discord.Embed(title="🏆 لوحة المتصدرين", description="أعلى 10 أعضاء في السيرفر", color=0xFFD700)
-    
-    medals = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
-    
-    for idx, (user_id, data) in enumerate(sorted_users, 1):
-        member = interaction.guild.get_member(int(user_id))
+async def resolve_members(guild, user_ids):
+    # الكاش أولاً، ثم طلب واحد عبر البوابة لكل 100 عضو غير موجود بدلاً من تحميل كل الأعضاء
+    found = {}
+    missing = []
+    for user_id in user_ids:
+        member = guild.get_member(int(user_id))
         if member:
+            found[member.id] = member
+        else:
+            missing.append(int(user_id))
+    if not missing or not bot.intents.members:
+        return found
+    for i in range(0, len(missing), 100):
+        chunk = missing[i:i + 100]
+        try:
+            members = await asyncio.wait_for(
+                guild.query_members(user_ids=chunk, limit=len(chunk), cache=bool(member_cache_flags.value)),
+                QUERY_MEMBERS_TIMEOUT
+            )
+        except (asyncio.TimeoutError, discord.ClientException):
+            break
+        found.update((member.id, member) for member in members)
+    return found
+
+# ==================== صفحات القوائم ====================
+PAGE_SIZE = 10
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "30"))  # أسماء الأعضاء في الصفحة المخزنة قد تتأخر بهذه المدة
+PAGE_CACHE_MAX = 512
+MEDALS = ["🥇", "🥈", "🥉"]
+
+class PageCache:
+    # الصفحة تُحفظ مع نسخة مصدرها، فأي كتابة تغير النسخة تجعل الصفحة القديمة غير صالحة فوراً
+    def __init__(self, ttl=PAGE_CACHE_TTL, max_entries=PAGE_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pages = {}
+
+    def get(self, key, version):
+        entry = self._pages.get(key)
+        if entry is None or entry[1] != version or entry[0] <= time.monotonic():
+            page_cache_lookups.inc("miss")
+            return None
+        page_cache_lookups.inc("hit")
+        return entry[2]
+
+    def put(self, key, version, embed):
+        now = time.monotonic()
+        if len(self._pages) >= self.max_entries:
+            for stale in [k for k, entry in self._pages.items() if entry[0] <= now]:
+                del self._pages[stale]
+            if len(self._pages) >= self.max_entries:
+                del self._pages[next(iter(self._pages))]
+        self._pages[key] = (now + self.ttl, version, embed)
+
+page_cache = PageCache()
+
+class PageSource:
+    # مصدر مفهرس: يعرف عدد العناصر ويجلب شريحة الصفحة فقط، و version يتغير مع كل كتابة على البيانات
+    page_size = PAGE_SIZE
+
+    def __init__(self, guild):
+        self.guild = guild
+
+    @property
+    def key(self):
+        raise NotImplementedError
+
+    def version(self):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def slice(self, offset, limit):
+        raise NotImplementedError
+
+    def member_ids(self, entries):
+        return []
+
+    def format_page(self, entries, offset, members):
+        raise NotImplementedError
+
+    def page_count(self):
+        return max(1, -(-self.count() // self.page_size))
+
+    async def render(self, page):
+        page = max(0, min(page, self.page_count() - 1))
+        key = self.key + (page,)
+        version = self.version()
+        embed = page_cache.get(key, version)
+        if embed is not None:
+            return page, embed
+        offset = page * self.page_size
+        entries = self.slice(offset, self.page_size)
+        # كل أعضاء الصفحة في طلب واحد بدلاً من get_member لكل سطر
+        members = await resolve_members(self.guild, self.member_ids(entries))
+        embed = self.format_page(entries, offset, members)
+        embed.set_footer(text=f"الصفحة {page + 1} من {self.page_count()}")
+        page_cache.put(key, version, embed)
+        return page, embed
+
+class RankPageSource(PageSource):
+    # أي فهرس RankIndex: الصفحة شريحة مباشرة من قائمة التخطي في O(log n)
+    def __init__(self, guild, index, name, title, color):
+        super().__init__(guild)
+        self.index = index
+        self.name = name
+        self.title = title
+        self.color = color
+
+    @property
+    def key(self):
+        return (self.guild.id, self.name)
+
+    def version(self):
+        return self.index.version
+
+    def count(self):
+        return len(self.index)
+
+    def slice(self, offset, limit):
+        return self.index.page(offset, limit)
+
+    def member_ids(self, entries):
+        return [user_id for user_id, _ in entries]
+
+    def heading(self):
+        return f"({self.count():,} عضو)"
+
+    def describe(self, user_id, score):
+        raise NotImplementedError
+
+    def format_page(self, entries, offset, members):
+        embed = discord.Embed(title=self.title, description=self.heading(), color=self.color)
+        for position, (user_id, score) in enumerate(entries, offset + 1):
+            badge = MEDALS[position - 1] if position <= len(MEDALS) else f"#{position}"
+            # العضو الذي غادر يظهر بالمنشن بدلاً من حذفه من الصفحة
+            member = members.get(int(user_id))
             embed.add_field(
-                name=f"{medals[idx-1]} {member.display_name}", 
-                value=f"**المستوى:** {data['level']} | **الخبرة:** {data['xp']} | **الرسائل:** {data['messages']:,}", 
+                name=f"{badge} {member.display_name if member else 'عضو'}",
+                value=f"<@{user_id}> | {self.describe(user_id, score)}",
                 inline=False
             )
-    
-    await interaction.response.send_message(embed=embed)
+        return embed
+
+class LevelRankSource(RankPageSource):
+    def __init__(self, guild, guild_data):
+        super().__init__(guild, guild_data.level_rank, "levels", "🏆 لوحة المتصدرين", 0xFFD700)
+        self.guild_data = guild_data
+
+    def heading(self):
+        return f"ترتيب أعضاء السيرفر حسب المستوى ({self.count():,} عضو)"
+
+    def describe(self, user_id, score):
+        data = self.guild_data.levels[user_id]
+        return f"**المستوى:** {data['level']} | **الخبرة:** {data['xp']} | **الرسائل:** {data['messages']:,}"
+
+class WarningsSource(PageSource):
+    # الأحدث أولاً؛ قائمة تحذيرات العضو مرتبة بالمعرف فالشريحة فهرسة مباشرة من نهايتها
+    page_size = 5
+
+    def __init__(self, guild, guild_data, member):
+        super().__init__(guild)
+        self.guild_data = guild_data
+        self.member = member
+        self.user_id = str(member.id)
+
+    @property
+    def key(self):
+        return (self.guild.id, "warnings", self.user_id)
+
+    def version(self):
+        return self.guild_data.warn_index.version
+
+    def _warns(self):
+        return self.guild_data.warnings.get(self.user_id, [])
+
+    def count(self):
+        return len(self._warns())
+
+    def slice(self, offset, limit):
+        warns = self._warns()
+        end = len(warns) - offset
+        return list(reversed(warns[max(0, end - limit):end]))
+
+    def format_page(self, entries, offset, members):
+        total = self.count()
+        description = f"إجمالي التحذيرات: **{total}**"
+        upcoming = next_escalation(total)
+        if upcoming:
+            threshold, (action, _) = upcoming
+            description += f"\nالإجراء التالي: {ESCALATION_LABELS.get(action, action)} عند **{threshold}**"
+        embed = discord.Embed(title=f"⚠️ تحذيرات {self.member.display_name}", description=description, color=WARN_COLOR)
+        embed.set_thumbnail(url=self.member.display_avatar.url)
+        for warn in entries:
+            # المنشن لا يحتاج العضو في الكاش
+            mod_name = f"<@{warn['moderator']}>" if warn.get("moderator") else "غير معروف"
+            timestamp = int(datetime.fromisoformat(warn["timestamp"]).timestamp())
+            embed.add_field(
+                name=f"🚨 تحذير #{warn['id']}",
+                value=f"**المشرف:** {mod_name}\n**السبب:** {warn['reason']}\n**التاريخ:** <t:{timestamp}:R>",
+                inline=False
+            )
+        return embed
+
+class TicketsSource(PageSource):
+    def __init__(self, guild):
+        super().__init__(guild)
+        self.guild_id = str(guild.id)
+        self._sorted = None
+
+    @property
+    def key(self):
+        return (self.guild.id, "tickets")
+
+    def version(self):
+        return ticket_versions.get(self.guild_id, 0)
+
+    def _tickets(self):
+        # الترتيب يُحسب مرة واحدة لكل نسخة من تذاكر السيرفر
+        version = self.version()
+        if self._sorted is None or self._sorted[0] != version:
+            tickets = sorted(guild_tickets(self.guild_id).values(), key=lambda ticket: ticket.get("created_at") or "")
+            self._sorted = (version, tickets)
+        return self._sorted[1]
+
+    def count(self):
+        return len(self._tickets())
+
+    def slice(self, offset, limit):
+        return self._tickets()[offset:offset + limit]
+
+    def member_ids(self, entries):
+        return [ticket["owner_id"] for ticket in entries]
+
+    def format_page(self, entries, offset, members):
+        embed = discord.Embed(title="🎫 التذاكر المفتوحة", description=f"عدد التذاكر: **{self.count():,}**", color=INFO_COLOR)
+        for position, ticket in enumerate(entries, offset + 1):
+            owner = members.get(int(ticket["owner_id"]))
+            handler = f"<@{ticket['accepted_by']}>" if ticket.get("accepted_by") else "لم تُقبل بعد"
+            opened = f"<t:{int(datetime.fromisoformat(ticket['created_at']).timestamp())}:R>" if ticket.get("created_at") else "—"
+            embed.add_field(
+                name=f"#{position} {ticket.get('type') or 'تذكرة'} | {owner.display_name if owner else 'عضو'}",
+                value=f"<#{ticket['channel_id']}> | <@{ticket['owner_id']}> | **الحالة:** {ticket.get('status')} | **المسؤول:** {handler} | {opened}",
+                inline=False
+            )
+        return embed
+
+class Paginator(View):
+    # عرض عام لأي PageSource: صفحة واحدة تُبنى عند الطلب، والصفحات المخزنة تُشارك بين كل من يفتح نفس القائمة
+    def __init__(self, source, owner_id, timeout=180):
+        super().__init__(timeout=timeout)
+        self.source = source
+        self.owner_id = owner_id
+        self.page = 0
+
+    async def start(self, interaction: discord.Interaction, page=0, ephemeral=False):
+        self.page, embed = await self.source.render(page)
+        self._sync_buttons()
+        await respond(interaction, embed=embed, view=self, ephemeral=ephemeral)
+
+    def _sync_buttons(self):
+        pages = self.source.page_count()
+        self.first_page.disabled = self.previous_page.disabled = self.page <= 0
+        self.next_page.disabled = self.last_page.disabled = self.page >= pages - 1
+        self.position.label = f"{self.page + 1}/{pages}"
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.owner_id:
+            await respond(interaction, "❌ هذه القائمة ليست لك", ephemeral=True)
+            return False
+        return True
+
+    async def _show(self, interaction: discord.Interaction, page):
+        self.page, embed = await self.source.render(page)
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.gray)
+    async def first_page(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, 0)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.gray)
+    async def previous_page(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="1/1", style=discord.ButtonStyle.secondary, disabled=True)
+    async def position(self, interaction: discord.Interaction, button: Button):
+        pass
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.gray)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.page + 1)
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.gray)
+    async def last_page(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.source.page_count() - 1)
+
+class WealthRankSource(RankPageSource):
+    def __init__(self, guild, guild_data):
+        super().__init__(guild, guild_data.wealth_rank, "wealth", "💰 أغنى الأعضاء", SUCCESS_COLOR)
+        self.guild_data = guild_data
+
+    def heading(self):
+        return f"ترتيب الأعضاء حسب النقود + البنك ({self.count():,} عضو)"
+
+    def describe(self, user_id, score):
+        account = self.guild_data.economy[user_id]
+        return f"**الثروة:** {score:,} 🪙 | 🪙 {account.get('coins', 0):,} | 🏦 {account.get('bank', 0):,}"
+
+class RepRankSource(RankPageSource):
+    def __init__(self, guild, guild_data):
+        super().__init__(guild, guild_data.rep_rank, "reputation", "🏅 ترتيب السمعة", MAIN_COLOR)
+
+    def heading(self):
+        return f"ترتيب الأعضاء حسب نقاط السمعة ({self.count():,} عضو)"
+
+    def describe(self, user_id, score):
+        return f"**السمعة:** {score:,}"
+
+@bot.tree.command(name="ترتيب", description="عرض قائمة المتصدرين في المستويات")
+@app_commands.describe(page="رقم الصفحة")
+@app_commands.guild_only()
+async def leaderboard_slash(interaction: discord.Interaction, page: int = 1):
+    guild_data = await partitions.get(interaction.guild.id)
+    await Paginator(LevelRankSource(interaction.guild, guild_data), interaction.user.id).start(interaction, page - 1)
+
+@bot.tree.command(name="اغنى", description="عرض أغنى أعضاء السيرفر (النقود + البنك)")
+@app_commands.describe(page="رقم الصفحة")
+@app_commands.guild_only()
+async def rich_list_slash(interaction: discord.Interaction, page: int = 1):
+    guild_data = await partitions.get(interaction.guild.id)
+    await Paginator(WealthRankSource(interaction.guild, guild_data), interaction.user.id).start(interaction, page - 1)
+
+@bot.tree.command(name="سمعة_ترتيب", description="عرض ترتيب الأعضاء حسب السمعة")
+@app_commands.describe(page="رقم الصفحة")
+@app_commands.guild_only()
+async def rep_leaderboard_slash(interaction: discord.Interaction, page: int = 1):
+    guild_data = await partitions.get(interaction.guild.id)
+    await Paginator(RepRankSource(interaction.guild, guild_data), interaction.user.id).start(interaction, page - 1)
+
+@bot.tree.command(name="التذاكر", description="عرض التذاكر المفتوحة في السيرفر", extras={"ephemeral": True})
+@app_commands.describe(page="رقم الصفحة")
+@app_commands.checks.has_permissions(manage_channels=True)
+@app_commands.guild_only()
+async def tickets_list_slash(interaction: discord.Interaction, page: int = 1):
+    source = TicketsSource(interaction.guild)
+    if not source.count():
+        embed = discord.Embed(title="🎫 التذاكر المفتوحة", description="لا توجد تذاكر مفتوحة حالياً.", color=INFO_COLOR)
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    await Paginator(source, interaction.user.id).start(interaction, page - 1, ephemeral=True)
+
+# ==================== دفتر الاقتصاد ====================
+TRANSFER_TAX = 0.05
+LEDGER_HISTORY = 10  # عدد القيود المعروضة في مراجعة الرصيد
+
+LEDGER_KINDS = {
+    "opening": "📂 رصيد افتتاحي",
+    "message": "💬 نشاط",
+    "message_reward": "💬 مكافآت النشاط",
+    "level_up": "🎉 مكافأة ترقية",
+    "daily": "🎁 يومي",
+    "deposit": "🏦 إيداع",
+    "withdraw": "💵 سحب",
+    "transfer": "💸 تحويل",
+    "tax": "🧾 ضريبة",
+}
+
+def new_account():
+    return {"coins": 0, "bank": 0, "last_daily": None}
+
+def release_ledger_entry(guild_id, seq):
+    data = partitions.peek(guild_id)
+    if data is not None:
+        data.ledger.pop(seq, None)
+
+class EconomyLedger:
+    # كل تغيير في الأرصدة قيد في دفتر إلحاق فقط، والرصيد في economy مجرد إسقاط مخزن يمكن إعادة بنائه منه
+    def __init__(self):
+        self._locks = {}  # (guild_id, user_id) -> [lock, عدد المنتظرين]
+
+    @contextlib.asynccontextmanager
+    async def accounts(self, guild_id, *user_ids):
+        # الأقفال تؤخذ دائماً بترتيب المعرف، فتحويلان متعاكسان لا يتبادلان الانتظار
+        keys = sorted({(str(guild_id), str(user_id)) for user_id in user_ids}, key=lambda key: int(key[1]))
+        entries = []
+        for key in keys:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            entries.append((key, entry))
+        acquired = []
+        try:
+            for _, entry in entries:
+                await entry[0].acquire()
+                acquired.append(entry[0])
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            for key, entry in entries:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def balance(self, guild_data, user_id):
+        account = guild_data.economy.get(str(user_id)) or new_account()
+        return account.get("coins", 0), account.get("bank", 0)
+
+    def post(self, guild_data, legs, apply=True):
+        # legs: [(user_id, kind, coins, bank, ref)] تُطبق كلها أو لا يُطبق شيء، بدون أي await بينها
+        totals = {}
+        for user_id, _, coins, bank, _ in legs:
+            current = totals.get(user_id) or self.balance(guild_data, user_id)
+            totals[user_id] = (current[0] + coins, current[1] + bank)
+        for user_id, (coins, bank) in totals.items():
+            if apply and (coins < 0 or bank < 0):
+                raise ValueError(f"رصيد غير كافٍ للعضو {user_id}")
+        ts = datetime.now().isoformat()
+        seq = guild_data.meta.get("ledger_seq", 0)
+        tx = seq + 1
+        for user_id, kind, coins, bank, ref in legs:
+            seq += 1
+            if apply:
+                account = guild_data.economy.setdefault(user_id, new_account())
+                account["coins"] = account.get("coins", 0) + coins
+                account["bank"] = account.get("bank", 0) + bank
+                update_rank(guild_data.wealth_rank, user_id, wealth_score(account))
+                guild_data.touch("economy", user_id)
+            guild_data.ledger[seq] = {"seq": seq, "tx": tx, "ts": ts, "user_id": user_id, "kind": kind,
+                                      "coins": coins, "bank": bank, "ref": ref}
+            guild_data.touch("ledger", seq)
+            ledger_entries.inc(kind)
+        guild_data.meta["ledger_seq"] = seq
+        guild_data.touch("meta", "ledger_seq")
+        return tx
+
+    def credit(self, guild_data, user_id, kind, coins, ref=None):
+        return self.post(guild_data, [(user_id, kind, coins, 0, ref)])
+
+    def accrue(self, guild_data, user_id, coins):
+        # مكافآت الرسائل تُضاف للرصيد فوراً لكنها تُجمع لكل عضو في meta (تُحفظ مع الرصيد في نفس الدفعة)
+        # ثم تُرحّل كقيد message_reward واحد لكل عضو في settle، بدلاً من قيد لكل رسالة
+        account = guild_data.economy.setdefault(user_id, new_account())
+        account["coins"] = account.get("coins", 0) + coins
+        update_rank(guild_data.wealth_rank, user_id, wealth_score(account))
+        guild_data.touch("economy", user_id)
+        accruals = guild_data.meta.setdefault("reward_accruals", {})
+        accruals[user_id] = accruals.get(user_id, 0) + coins
+        guild_data.touch("meta", "reward_accruals")
+
+    def settle(self, guild_data):
+        accruals = guild_data.meta.get("reward_accruals")
+        if not accruals:
+            return 0
+        legs = [(user_id, "message_reward", coins, 0, None) for user_id, coins in accruals.items()]
+        self.post(guild_data, legs, apply=False)
+        guild_data.meta["reward_accruals"] = {}
+        guild_data.touch("meta", "reward_accruals")
+        return len(legs)
+
+    def settle_all(self):
+        return sum(self.settle(data) for data in partitions.loaded())
+
+    def transfer(self, guild_data, sender_id, receiver_id, amount, tax_rate=TRANSFER_TAX):
+        tax = int(amount * tax_rate)
+        received = amount - tax
+        legs = [
+            (sender_id, "transfer", -received, 0, receiver_id),
+            (receiver_id, "transfer", received, 0, sender_id),
+        ]
+        if tax:
+            legs.append((sender_id, "tax", -tax, 0, None))
+        return self.post(guild_data, legs), tax, received
+
+    def open_guild(self, guild_data):
+        # أول تحميل بعد إضافة الدفتر: الأرصدة الحالية تُسجل كقيود افتتاحية حتى يطابق الدفتر الإسقاط
+        if guild_data.meta.get("ledger_opened"):
+            return 0
+        legs = [
+            (user_id, "opening", account.get("coins", 0), account.get("bank", 0), None)
+            for user_id, account in guild_data.economy.items()
+            if account.get("coins", 0) or account.get("bank", 0)
+        ]
+        if legs:
+            # الأرصدة موجودة أصلاً في الإسقاط، فالقيد يُسجَّل فقط بدون تطبيق
+            self.post(guild_data, legs, apply=False)
+        guild_data.meta["ledger_opened"] = True
+        guild_data.touch("meta", "ledger_opened")
+        return len(legs)
+
+    async def rebuild(self, guild_data, user_id, limit=LEDGER_HISTORY):
+        # مجموع القيود المكتوبة + القيود التي لم تُكتب بعد (أحدث من آخر قيد مكتوب للعضو)
+        result = await persistence.run_io(storage.ledger_account, guild_data.guild_id, user_id, limit)
+        pending = [
+            entry for seq, entry in sorted(guild_data.ledger.items())
+            if entry["user_id"] == user_id and seq > result["last_seq"]
+        ]
+        for entry in pending:
+            result["coins"] += entry["coins"]
+            result["bank"] += entry["bank"]
+            result["count"] += 1
+        result["accrued"] = guild_data.meta.get("reward_accruals", {}).get(user_id, 0)
+        result["coins"] += result["accrued"]
+        result["recent"] = (list(reversed(pending)) + result["recent"])[:limit]
+        return result
+
+ledger = EconomyLedger()
+
+def format_ledger_entry(entry):
+    parts = []
+    if entry["coins"]:
+        parts.append(f"{entry['coins']:+,} 🪙")
+    if entry["bank"]:
+        parts.append(f"{entry['bank']:+,} 🏦")
+    ref = f" ↔ <@{entry['ref']}>" if entry.get("ref") else ""
+    when = f"<t:{int(datetime.fromisoformat(entry['ts']).timestamp())}:R>"
+    return f"`#{entry['seq']}` {LEDGER_KINDS.get(entry['kind'], entry['kind'])} {' '.join(parts) or '0'}{ref} {when}"
 
 # ==================== الأوامر الاقتصادية المتقدمة ====================
 @bot.tree.command(name="يومي", description="الحصول على المكافأة اليومية")
+@app_commands.guild_only()
 async def daily_slash(interaction: discord.Interaction):
+    guild_data = await partitions.get(interaction.guild.id)
     user_id = str(interaction.user.id)
     
-    user_data = economy_db.get(user_id, {"coins": 0, "bank": 0, "last_daily": None})
-    last_daily_str = user_data.get("last_daily")
+    async with ledger.accounts(guild_data.guild_id, user_id):
+        user_data = guild_data.economy.get(user_id) or new_account()
+        time_left = daily_cooldowns.remaining_since((guild_data.guild_id, user_id), user_data.get("last_daily"))
+        if time_left <= 0:
+            reward = random.randint(300, 1000)
+            bonus = random.randint(0, 500)
+            total_reward = reward + bonus
+            ledger.credit(guild_data, user_id, "daily", total_reward)
+            guild_data.economy[user_id]["last_daily"] = datetime.now().isoformat()
+            daily_cooldowns.start((guild_data.guild_id, user_id))
     
-    if last_daily_str:
-        last_daily = datetime.fromisoformat(last_daily_str)
-        time_left = timedelta(hours=23, minutes=30) - (datetime.now() - last_daily)
-        if time_left.total_seconds() > 0:
-            hours, remainder = divmod(int(time_left.total_seconds()), 3600)
-            minutes, seconds = divmod(remainder, 60)
-            embed = discord.Embed(
-                title="⏰ مكافأتك معلقة", 
-                description=f"لقد حصلت على مكافأتك بالفعل!\nتنتظر: **{hours}س {minutes}د**", 
-                color=WARN_COLOR
-            )
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
-            
-    reward = random.randint(300, 1000)
-    bonus = random.randint(0, 500)
-    total_reward = reward + bonus
-    
-    user_data["coins"] = user_data.get("coins", 0) + total_reward
-    user_data["last_daily"] = datetime.now().isoformat()
-    economy_db[user_id] = user_data
-    save_data()
+    if time_left > 0:
+        cooldown_hits.inc("daily")
+        embed = discord.Embed(
+            title="⏰ مكافأتك معلقة", 
+            description=f"لقد حصلت على مكافأتك بالفعل!\nتنتظر: **{format_wait(time_left)}**", 
+            color=WARN_COLOR
+        )
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
     
     embed = discord.Embed(title="🎁 مكافأة يومية!", color=SUCCESS_COLOR)
     embed.description = f"لقد حصلت على **{reward}** 🪙!"
     if bonus > 0:
         embed.description += f"\n✨ مكافأة إضافية: **+{bonus}** 🪙"
     embed.set_footer(text=f"إجمالي: {total_reward} 🪙")
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
 @bot.tree.command(name="رصيد", description="عرض رصيدك")
 @app_commands.describe(member="العضو")
+@app_commands.guild_only()
 async def balance_slash(interaction: discord.Interaction, member: discord.Member = None):
+    guild_data = await partitions.get(interaction.guild.id)
     member = member or interaction.user
     user_id = str(member.id)
-    data = economy_db.get(user_id, {"coins": 0, "bank": 0, "last_daily": None})
+    coins, bank = ledger.balance(guild_data, user_id)
     
     embed = discord.Embed(title=f"💰 رصيد {member.display_name}", color=SUCCESS_COLOR)
     embed.set_thumbnail(url=member.display_avatar.url)
-    embed.add_field(name="🪙 النقود", value=f"**{data['coins']:,}**", inline=True)
-    embed.add_field(name="🏦 البنك", value=f"**{data['bank']:,}**", inline=True)
-    embed.add_field(name="📊 الإجمالي", value=f"**{data['coins'] + data['bank']:,}** 🪙", inline=False)
+    embed.add_field(name="🪙 النقود", value=f"**{coins:,}**", inline=True)
+    embed.add_field(name="🏦 البنك", value=f"**{bank:,}**", inline=True)
+    embed.add_field(name="📊 الإجمالي", value=f"**{coins + bank:,}** 🪙", inline=True)
+    position = guild_data.wealth_rank.rank(user_id)
+    embed.add_field(name="🏅 الترتيب", value=f"#{position:,}" if position else "—", inline=True)
     embed.set_footer(text=f"طلب بواسطة {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
     
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
 @bot.tree.command(name="ايداع", description="إيداع النقود في البنك")
 @app_commands.describe(amount="المبلغ (أو all للكل)")
+@app_commands.guild_only()
 async def deposit_slash(interaction: discord.Interaction, amount: str):
+    guild_data = await partitions.get(interaction.guild.id)
     user_id = str(interaction.user.id)
-    data = economy_db.get(user_id, {"coins": 0, "bank": 0})
     
-    if amount.lower() == "all":
-        amount = data["coins"]
-    else:
+    deposit_all = amount.lower() == "all"
+    if not deposit_all:
+        try:
+            amount = int(amount)
+        except:
+            embed = EMBEDS["error"].static("يرجى إدخال رقم صحيح أو 'all'")
+            await respond(interaction, embed=embed, ephemeral=True)
+            return
+    
+    # الفحص والقيد تحت قفل الحساب حتى لا يتداخل معهما أي أمر آخر على نفس الرصيد
+    error = None
+    async with ledger.accounts(guild_data.guild_id, user_id):
+        coins, bank = ledger.balance(guild_data, user_id)
+        if deposit_all:
+            amount = coins
+        if amount <= 0:
+            error = "المبلغ يجب أن يكون أكبر من 0"
+        elif coins < amount:
+            error = "ليس لديك نقود كافية!"
+        else:
+            ledger.post(guild_data, [(user_id, "deposit", -amount, amount, None)])
+            coins, bank = ledger.balance(guild_data, user_id)
+    
+    if error:
+        embed = EMBEDS["error"].static(error)
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    embed = discord.Embed(title="✅ تم الإيداع", description=f"تم إيداع **{amount}** 🪙 في البنك", color=SUCCESS_COLOR)
+    embed.add_field(name="الرصيد الجديد", value=f"🪙 {coins} | 🏦 {bank}", inline=False)
+    await respond(interaction, embed=embed)
+
+@bot.tree.command(name="سحب", description="سحب النقود من البنك")
+@app_commands.describe(amount="المبلغ")
+@app_commands.guild_only()
+async def withdraw_slash(interaction: discord.Interaction, amount: str):
+    guild_data = await partitions.get(interaction.guild.id)
+    user_id = str(interaction.user.id)
+    
+    withdraw_all = amount.lower() == "all"
+    if not withdraw_all:
         try:
             amount = int(amount)
         except:
-            embed = discord.Embed(title="❌ خطأ", description="يرجى إدخال رقم صحيح أو 'all'", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            embed = EMBEDS["error"].static("يرجى إدخال رقم صحيح أو 'all'")
+            await respond(interaction, embed=embed, ephemeral=True)
             return
     
+    error = None
+    async with ledger.accounts(guild_data.guild_id, user_id):
+        coins, bank = ledger.balance(guild_data, user_id)
+        if withdraw_all:
+            amount = bank
+        if amount <= 0:
+            error = "المبلغ يجب أن يكون أكبر من 0"
+        elif bank < amount:
+            error = "ليس لديك رصيد كافٍ في البنك!"
+        else:
+            ledger.post(guild_data, [(user_id, "withdraw", amount, -amount, None)])
+            coins, bank = ledger.balance(guild_data, user_id)
+    
+    if error:
+        embed = EMBEDS["error"].static(error)
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    embed = discord.Embed(title="✅ تم السحب", description=f"تم سحب **{amount}** 🪙 من البنك", color=SUCCESS_COLOR)
+    embed.add_field(name="الرصيد الجديد", value=f"🪙 {coins} | 🏦 {bank}", inline=False)
+    await respond(interaction, embed=embed)
+
+@bot.tree.command(name="تحويل", description="تحويل النقود لعضو آخر")
+@app_commands.describe(member="العضو", amount="المبلغ")
+@app_commands.guild_only()
+async def transfer_slash(interaction: discord.Interaction, member: discord.Member, amount: int):
+    guild_data = await partitions.get(interaction.guild.id)
+    if member.bot:
+        embed = EMBEDS["error"].static("لا يمكن التحويل للبوتات!")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
     if amount <= 0:
-        embed = discord.Embed(title="❌ خطأ", description="المبلغ يجب أن يكون أكبر من 0", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("المبلغ يجب أن يكون أكبر من 0")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    if member.id == interaction.user.id:
+        embed = EMBEDS["error"].static("لا يمكنك التحويل لنفسك!")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
-    if data["coins"] < amount:
-        embed = discord.Embed(title="❌ خطأ", description="ليس لديك نقود كافية!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+    sender_id = str(interaction.user.id)
+    receiver_id = str(member.id)
+    
+    # قفل الحسابين بترتيب المعرف ثم فحص الرصيد وكتابة القيود دفعة واحدة
+    async with ledger.accounts(guild_data.guild_id, sender_id, receiver_id):
+        coins, _ = ledger.balance(guild_data, sender_id)
+        if coins >= amount:
+            tx, tax, final_amount = ledger.transfer(guild_data, sender_id, receiver_id, amount)
+            coins, _ = ledger.balance(guild_data, sender_id)
+        else:
+            tx = None
+    
+    if tx is None:
+        embed = EMBEDS["error"].static("ليس لديك نقود كافية!")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
-    data["coins"] -= amount
-    data["bank"] += amount
-    economy_db[user_id] = data
-    save_data()
+    audit.publish(interaction.guild.id, "economy_transfer", actor_id=sender_id, target_id=receiver_id, details={
+        "المبلغ": amount, "الضريبة": tax, "المستلم فعلياً": final_amount, "القيد": f"#{tx}"
+    })
     
-    embed = discord.Embed(title="✅ تم الإيداع", description=f"تم إيداع **{amount}** 🪙 في البنك", color=SUCCESS_COLOR)
-    embed.add_field(name="الرصيد الجديد", value=f"🪙 {data['coins']} | 🏦 {data['bank']}", inline=False)
-    await interaction.response.send_message(embed=embed)
+    embed = discord.Embed(title="✅ تم التحويل", color=SUCCESS_COLOR)
+    embed.description = f"تم تحويل **{final_amount}** 🪙 إلى {member.mention}"
+    embed.add_field(name=f"💸 الضريبة ({TRANSFER_TAX:.0%})", value=f"-{tax} 🪙", inline=True)
+    embed.set_footer(text=f"الرصيد الجديد: {coins} 🪙 | قيد #{tx}")
+    await respond(interaction, embed=embed)
+
+@bot.tree.command(name="سمعة", description="إعطاء نقطة سمعة لعضو")
+@app_commands.describe(member="العضو")
+@app_commands.guild_only()
+async def rep_slash(interaction: discord.Interaction, member: discord.Member):
+    guild_data = await partitions.get(interaction.guild.id)
+    if member.bot:
+        embed = EMBEDS["error"].static("لا يمكن إعطاء سمعة للبوتات!")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    if member.id == interaction.user.id:
+        embed = EMBEDS["error"].static("لا يمكنك إعطاء سمعة لنفسك!")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    user_id = str(interaction.user.id)
+    
+    if user_id not in guild_data.reputation:
+        guild_data.reputation[user_id] = {"rep": 0, "last_rep": None}
+    
+    time_left = rep_cooldowns.remaining_since((guild_data.guild_id, user_id), guild_data.reputation[user_id]["last_rep"])
+    if time_left > 0:
+        cooldown_hits.inc("rep")
+        embed = EMBEDS["wait"].render(f"يمكنك إعطاء سمعة كل 12 ساعة!\nتنتظر: **{format_wait(time_left)}**")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    guild_data.reputation[user_id]["last_rep"] = datetime.now().isoformat()
+    rep_cooldowns.start((guild_data.guild_id, user_id))
+    
+    receiver_id = str(member.id)
+    if receiver_id not in guild_data.reputation:
+        guild_data.reputation[receiver_id] = {"rep": 0, "last_rep": None}
+    
+    guild_data.reputation[receiver_id]["rep"] += 1
+    update_rank(guild_data.rep_rank, receiver_id, guild_data.reputation[receiver_id]["rep"])
+    guild_data.touch("reputation", user_id)
+    guild_data.touch("reputation", receiver_id)
+    
+    embed = discord.Embed(title="✅ تم إعطاء سمعة", description=f"لقد أعطيت نقطة سمعة لـ {member.mention}!\n🏆 سمعته الآن: **{guild_data.reputation[receiver_id]['rep']}**", color=SUCCESS_COLOR)
+    await respond(interaction, embed=embed)
+
+@bot.tree.command(name="مراجعة_رصيد", description="مطابقة رصيد عضو مع دفتر الاقتصاد وعرض آخر قيوده", extras={"ephemeral": True})
+@app_commands.describe(member="العضو", repair="تصحيح الرصيد المخزن ليطابق الدفتر عند الاختلاف")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.guild_only()
+async def ledger_review_slash(interaction: discord.Interaction, member: discord.Member, repair: bool = False):
+    guild_data = await partitions.get(interaction.guild.id)
+    user_id = str(member.id)
+    repaired = False
+    async with ledger.accounts(guild_data.guild_id, user_id):
+        result = await ledger.rebuild(guild_data, user_id)
+        coins, bank = ledger.balance(guild_data, user_id)
+        matches = (coins, bank) == (result["coins"], result["bank"])
+        if not matches and repair:
+            # الدفتر هو المرجع: يُعاد بناء الإسقاط منه مباشرة بدون قيد جديد
+            account = guild_data.economy.setdefault(user_id, new_account())
+            account["coins"], account["bank"] = result["coins"], result["bank"]
+            update_rank(guild_data.wealth_rank, user_id, wealth_score(account))
+            guild_data.touch("economy", user_id)
+            repaired = True
+    
+    embed = discord.Embed(title=f"📒 دفتر {member.display_name}", color=SUCCESS_COLOR if matches else WARN_COLOR)
+    embed.add_field(name="💰 الرصيد المخزن", value=f"🪙 {coins:,} | 🏦 {bank:,}", inline=True)
+    embed.add_field(name="📒 حسب الدفتر", value=f"🪙 {result['coins']:,} | 🏦 {result['bank']:,}", inline=True)
+    embed.add_field(name="🧾 عدد القيود", value=f"{result['count']:,}", inline=True)
+    if result["accrued"]:
+        embed.add_field(name="💬 نشاط لم يُرحّل بعد", value=f"🪙 {result['accrued']:,}", inline=True)
+    if matches:
+        embed.description = "✅ الرصيد مطابق للدفتر"
+    elif repaired:
+        embed.description = "🛠️ تم تصحيح الرصيد ليطابق الدفتر"
+        audit.publish(interaction.guild.id, "economy_repair", actor_id=interaction.user.id, target_id=member.id, details={
+            "قبل": f"🪙 {coins:,} | 🏦 {bank:,}", "بعد": f"🪙 {result['coins']:,} | 🏦 {result['bank']:,}"
+        })
+    else:
+        embed.description = "⚠️ الرصيد لا يطابق الدفتر، استخدم repair لتصحيحه"
+    if result["recent"]:
+        embed.add_field(name="🕘 آخر القيود", value="\n".join(format_ledger_entry(entry) for entry in result["recent"])[:1024], inline=False)
+    await respond(interaction, embed=embed, ephemeral=True)
+
+# ==================== فهرس المحظورين ====================
+UNBAN_CONCURRENCY = int(os.getenv("UNBAN_CONCURRENCY", "3"))  # مسار فك الحظر يشترك في bucket واحد لكل سيرفر
+BULK_UNBAN_LIMIT = 100
+BAN_INDEX_RETRY = 300  # ثوانٍ قبل إعادة محاولة تحميل قائمة حظر فشل تحميلها
+
+class BanIndex:
+    # نسخة محلية من قائمة الحظر لكل سيرفر تُحدّث من أحداث on_member_ban/on_member_unban.
+    # التحميل الكامل يتم في الخلفية عند أول حاجة، والأحداث التي تصل أثناءه تُطبق بعده.
+    def __init__(self):
+        self._bans = {}
+        self._pending = {}
+        self._warming = {}
+        self._failed = {}
+
+    def is_warm(self, guild_id):
+        return guild_id in self._bans
+
+    def contains(self, guild_id, user_id):
+        # None تعني أن الفهرس لم يُحمّل بعد ولا يمكن الجزم
+        bans = self._bans.get(guild_id)
+        if bans is None:
+            return None
+        return user_id in bans
+
+    def count(self, guild_id):
+        bans = self._bans.get(guild_id)
+        return None if bans is None else len(bans)
+
+    def add(self, guild_id, user_id):
+        if guild_id in self._pending:
+            self._pending[guild_id].append((True, user_id))
+        elif guild_id in self._bans:
+            self._bans[guild_id].add(user_id)
+
+    def discard(self, guild_id, user_id):
+        if guild_id in self._pending:
+            self._pending[guild_id].append((False, user_id))
+        elif guild_id in self._bans:
+            self._bans[guild_id].discard(user_id)
+
+    def warm(self, guild):
+        # تحميل واحد لكل سيرفر؛ بعده تبقيه الأحداث محدثاً، والفشل لا يُعاد قبل BAN_INDEX_RETRY
+        if guild.id in self._bans or guild.id in self._warming:
+            return
+        if time.monotonic() - self._failed.get(guild.id, -BAN_INDEX_RETRY) < BAN_INDEX_RETRY:
+            return
+        self._pending[guild.id] = []
+        self._warming[guild.id] = asyncio.create_task(self._load(guild))
+
+    async def _load(self, guild):
+        try:
+            bans = {entry.user.id async for entry in guild.bans(limit=None)}
+        except discord.HTTPException as e:
+            print(f"⚠️ فشل تحميل قائمة الحظر لـ {guild.id}: {e}")
+            self._pending.pop(guild.id, None)
+            self._failed[guild.id] = time.monotonic()
+            return
+        finally:
+            self._warming.pop(guild.id, None)
+        for banned, user_id in self._pending.pop(guild.id, []):
+            if banned:
+                bans.add(user_id)
+            else:
+                bans.discard(user_id)
+        self._bans[guild.id] = bans
+        self._failed.pop(guild.id, None)
+
+    def forget(self, guild_id):
+        self._bans.pop(guild_id, None)
+        self._pending.pop(guild_id, None)
+        self._failed.pop(guild_id, None)
+        task = self._warming.pop(guild_id, None)
+        if task:
+            task.cancel()
+
+ban_index = BanIndex()
+
+async def unban_user(guild, user_id, reason):
+    # عملية واحدة بالمعرف؛ NotFound تعني أن المستخدم غير محظور
+    try:
+        await guild.unban(discord.Object(id=user_id), reason=reason)
+    except discord.NotFound:
+        ban_index.discard(guild.id, user_id)
+        return False
+    ban_index.discard(guild.id, user_id)
+    return True
+
+def parse_user_ids(text):
+    ids = []
+    for token in text.replace(",", " ").split():
+        token = token.strip("<@!>")
+        if token.isdigit() and int(token) not in ids:
+            ids.append(int(token))
+    return ids
+
+# ==================== محرك المسح ====================
+PURGE_MAX = int(os.getenv("PURGE_MAX", "10000"))  # أقصى عدد رسائل يحذفها أمر واحد
+PURGE_SCAN_LIMIT = int(os.getenv("PURGE_SCAN_LIMIT", "50000"))  # أقصى عدد رسائل تُفحص عند وجود فلاتر
+PURGE_SINGLE_DELAY = 1.0  # فاصل الحذف الفردي للرسائل الأقدم من 14 يوم
+PURGE_PROGRESS_INTERVAL = 2.0
+INTERACTION_TOKEN_TTL = 14 * 60  # رمز التفاعل ينتهي بعد 15 دقيقة، فبعدها لا يمكن تعديل رسالة followup
+BULK_DELETE_MAX_AGE = timedelta(days=14, minutes=-2)  # هامش أمان قبل حد ديسكورد
+
+def by_authors(user_ids):
+    user_ids = frozenset(user_ids)
+    return lambda message: message.author.id in user_ids
+
+def by_regex(pattern):
+    return lambda message: pattern.search(message.content) is not None
+
+def with_attachments():
+    return lambda message: bool(message.attachments)
+
+def from_bots():
+    return lambda message: message.author.bot
+
+class PurgeJob:
+    # يقرأ السجل كتدفق ويحذف المطابق: دفعات حتى 100 للرسائل الحديثة، ومسار فردي مقنن للأقدم.
+    def __init__(self, channel, limit, predicates=(), after=None, on_progress=None):
+        self.channel = channel
+        self.limit = limit
+        self.predicates = list(predicates)
+        self.after = after
+        self.on_progress = on_progress
+        self.scan_limit = PURGE_SCAN_LIMIT if self.predicates else limit
+        self.scanned = 0
+        self.matched = 0
+        self.bulk_deleted = 0
+        self.single_deleted = 0
+        self.failed = 0
+        self.cancelled = False
+        self.finished = False
+        self.task = None
+        self.watcher = None
+        self._last_report = 0.0
+
+    @property
+    def deleted(self):
+        return self.bulk_deleted + self.single_deleted
+
+    def matches(self, message):
+        return all(predicate(message) for predicate in self.predicates)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.cancelled = True
+            self.task.cancel()
+
+    async def _report(self, force=False):
+        now = time.monotonic()
+        if self.on_progress and (force or now - self._last_report >= PURGE_PROGRESS_INTERVAL):
+            self._last_report = now
+            try:
+                await self.on_progress(self)
+            except discord.HTTPException:
+                pass
+
+    async def _bulk_delete(self, batch):
+        try:
+            await self.channel.delete_messages(batch)
+            self.bulk_deleted += len(batch)
+        except discord.NotFound:
+            # رسالة حُذفت مسبقاً تُفشل الدفعة كلها، فنحذف الباقي فردياً
+            for message in batch:
+                await self._single_delete(message)
+        except discord.HTTPException:
+            self.failed += len(batch)
+        await self._report()
+
+    async def _single_delete(self, message):
+        try:
+            await message.delete()
+            self.single_deleted += 1
+        except discord.NotFound:
+            pass
+        except discord.HTTPException:
+            self.failed += 1
+
+    async def _single_lane(self, queue):
+        while True:
+            message = await queue.get()
+            if message is None:
+                return
+            await self._single_delete(message)
+            await self._report()
+            await asyncio.sleep(PURGE_SINGLE_DELAY)
+
+    async def run(self):
+        bulk_cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        old_messages = asyncio.Queue()
+        single_lane = asyncio.create_task(self._single_lane(old_messages))
+        batch = []
+        try:
+            async for message in self.channel.history(limit=self.scan_limit, after=self.after, oldest_first=False):
+                self.scanned += 1
+                if not self.matches(message):
+                    continue
+                self.matched += 1
+                if message.created_at > bulk_cutoff:
+                    batch.append(message)
+                    if len(batch) == 100:
+                        await self._bulk_delete(batch)
+                        batch = []
+                else:
+                    old_messages.put_nowait(message)
+                if self.matched >= self.limit:
+                    break
+            if batch:
+                await self._bulk_delete(batch)
+            old_messages.put_nowait(None)
+            await single_lane
+        finally:
+            single_lane.cancel()
+            self.finished = True
+            await asyncio.shield(self._report(force=True))
+
+purge_jobs = {}
+
+async def watch_purge(job, interaction):
+    # تعمل في الخلفية بعد انتهاء الأمر نفسه، فلا يبقى تفاعل حياً طوال المسح ولا تدخل مدته في إحصائيات الأوامر
+    try:
+        await job.task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        try:
+            await interaction.followup.send(f"❌ فشل المسح: {e}", ephemeral=True)
+        except discord.HTTPException:
+            pass
+    finally:
+        audit.publish(interaction.guild.id, "purge", actor_id=interaction.user.id, details={
+            "القناة": interaction.channel.mention, "تم المسح": job.deleted, "تم الفحص": job.scanned,
+            "أوقفت": "نعم" if job.cancelled else None
+        })
+        if purge_jobs.get(interaction.channel_id) is job:
+            del purge_jobs[interaction.channel_id]
 
-@bot.tree.command(name="سحب", description="سحب النقود من البنك")
-@app_commands.describe(amount="المبلغ")
-async def withdraw_slash(interaction: discord.Interaction, amount: str):
-    user_id = str(interaction.user.id)
-    data = economy_db.get(user_id, {"coins": 0, "bank": 0})
-    
-    if amount.lower() == "all":
-        amount = data["bank"]
+def build_purge_embed(job):
+    if not job.finished:
+        title, color = "🧹 جاري المسح...", INFO_COLOR
+    elif job.cancelled:
+        title, color = "⏹️ تم إيقاف المسح", WARN_COLOR
     else:
-        try:
-            amount = int(amount)
-        except:
-            embed = discord.Embed(title="❌ خطأ", description="يرجى إدخال رقم صحيح أو 'all'", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
-    
-    if amount <= 0:
-        embed = discord.Embed(title="❌ خطأ", description="المبلغ يجب أن يكون أكبر من 0", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    if data["bank"] < amount:
-        embed = discord.Embed(title="❌ خطأ", description="ليس لديك رصيد كافٍ في البنك!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    data["bank"] -= amount
-    data["coins"] += amount
-    economy_db[user_id] = data
-    save_data()
-    
-    embed = discord.Embed(title="✅ تم السحب", description=f"تم سحب **{amount}** 🪙 من البنك", color=SUCCESS_COLOR)
-    embed.add_field(name="الرصيد الجديد", value=f"🪙 {data['coins']} | 🏦 {data['bank']}", inline=False)
-    await interaction.response.send_message(embed=embed)
+        title, color = "✅ تم المسح", SUCCESS_COLOR
+    embed = discord.Embed(title=title, description=f"تم مسح **{job.deleted}** رسالة", color=color)
+    embed.add_field(name="🔍 تم فحص", value=str(job.scanned), inline=True)
+    embed.add_field(name="📦 دفعات", value=str(job.bulk_deleted), inline=True)
+    embed.add_field(name="🐢 فردي (+14 يوم)", value=str(job.single_deleted), inline=True)
+    if job.failed:
+        embed.add_field(name="⚠️ فشل", value=str(job.failed), inline=True)
+    return embed
 
-@bot.tree.command(name="تحويل", description="تحويل النقود لعضو آخر")
-@app_commands.describe(member="العضو", amount="المبلغ")
-async def transfer_slash(interaction: discord.Interaction, member: discord.Member, amount: int):
-    if member.bot:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكن التحويل للبوتات!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    if amount <= 0:
-        embed = discord.Embed(title="❌ خطأ", description="المبلغ يجب أن يكون أكبر من 0", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    sender_id = str(interaction.user.id)
-    receiver_id = str(member.id)
-    
-    sender_data = economy_db.get(sender_id, {"coins": 0, "bank": 0})
-    receiver_data = economy_db.get(receiver_id, {"coins": 0, "bank": 0})
-    
-    if sender_data["coins"] < amount:
-        embed = discord.Embed(title="❌ خطأ", description="ليس لديك نقود كافية!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    # خصم 5% ضريبة
-    tax = int(amount * 0.05)
-    final_amount = amount - tax
-    
-    sender_data["coins"] -= amount
-    receiver_data["coins"] += final_amount
-    
-    economy_db[sender_id] = sender_data
-    economy_db[receiver_id] = receiver_data
-    save_data()
-    
-    embed = discord.Embed(title="✅ تم التحويل", color=SUCCESS_COLOR)
-    embed.description = f"تم تحويل **{final_amount}** 🪙 إلى {member.mention}"
-    embed.add_field(name="💸 الضريبة (5%)", value=f"-{tax} 🪙", inline=True)
-    embed.set_footer(text=f"الرصيد الجديد: {sender_data['coins']} 🪙")
-    await interaction.response.send_message(embed=embed)
+class PurgeProgressView(View):
+    def __init__(self, job, owner_id):
+        super().__init__(timeout=None)
+        self.job = job
+        self.owner_id = owner_id
 
-@bot.tree.command(name="سمعة", description="إعطاء نقطة سمعة لعضو")
-@app_commands.describe(member="العضو")
-async def rep_slash(interaction: discord.Interaction, member: discord.Member):
-    if member.bot:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكن إعطاء سمعة للبوتات!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    if member.id == interaction.user.id:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكنك إعطاء سمعة لنفسك!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    user_id = str(interaction.user.id)
-    
-    if user_id not in rep_db:
-        rep_db[user_id] = {"rep": 0, "last_rep": None}
-    
-    last_rep = rep_db[user_id]["last_rep"]
-    if last_rep:
-        last_rep_time = datetime.fromisoformat(last_rep)
-        if datetime.now() - last_rep_time < timedelta(hours=12):
-            time_left = timedelta(hours=12) - (datetime.now() - last_rep_time)
-            hours, remainder = divmod(int(time_left.total_seconds()), 3600)
-            minutes, seconds = divmod(remainder, 60)
-            embed = discord.Embed(title="⏰ انتظر", description=f"يمكنك إعطاء سمعة كل 12 ساعة!\nتنتظر: **{hours}س {minutes}د**", color=WARN_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
-    
-    rep_db[user_id]["last_rep"] = datetime.now().isoformat()
-    
-    receiver_id = str(member.id)
-    if receiver_id not in rep_db:
-        rep_db[receiver_id] = {"rep": 0, "last_rep": None}
-    
-    rep_db[receiver_id]["rep"] += 1
-    save_data()
-    
-    embed = discord.Embed(title="✅ تم إعطاء سمعة", description=f"لقد أعطيت نقطة سمعة لـ {member.mention}!\n🏆 سمعته الآن: **{rep_db[receiver_id]['rep']}**", color=SUCCESS_COLOR)
-    await interaction.response.send_message(embed=embed)
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.owner_id and not interaction.user.guild_permissions.manage_messages:
+            await respond(interaction, "❌ لا يمكنك إيقاف هذه العملية", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="إيقاف", emoji="⏹️", style=discord.ButtonStyle.danger)
+    async def stop_purge(self, interaction: discord.Interaction, button: Button):
+        self.job.cancel()
+        button.disabled = True
+        await interaction.response.edit_message(view=self)
+
+# ==================== الإغلاق الجماعي ====================
+LOCKDOWN_FILE = os.path.join(GUILDS_DIR, "lockdowns.json")
+LOCKDOWN_CONCURRENCY = int(os.getenv("LOCKDOWN_CONCURRENCY", "5"))  # تعديل كل قناة له bucket مستقل
+
+def serialize_overwrites(channel):
+    # channel.overwrites يعيد Object للأهداف غير الموجودة في الكاش، فلا يضيع أي إذن عند الاسترجاع
+    entries = []
+    for target, overwrite in channel.overwrites.items():
+        is_role = isinstance(target, discord.Role) or getattr(target, "type", None) is discord.Role
+        allow, deny = overwrite.pair()
+        entries.append([target.id, is_role, allow.value, deny.value])
+    return entries
+
+def deserialize_overwrites(entries):
+    return {
+        discord.Object(id=target_id, type=discord.Role if is_role else discord.User):
+            discord.PermissionOverwrite.from_pair(discord.Permissions(allow), discord.Permissions(deny))
+        for target_id, is_role, allow, deny in entries
+    }
+
+def build_locked_overwrites(channel, staff_roles):
+    # الخريطة الكاملة تُحسب محلياً ثم تُرسل في طلب تعديل واحد
+    overwrites = channel.overwrites
+    everyone = channel.guild.default_role
+    overwrite = overwrites.get(everyone) or discord.PermissionOverwrite()
+    overwrite.send_messages = False
+    overwrites[everyone] = overwrite
+    for role in staff_roles:
+        overwrite = overwrites.get(role) or discord.PermissionOverwrite()
+        overwrite.send_messages = True
+        overwrites[role] = overwrite
+    return overwrites
+
+def build_unlocked_overwrites(channel):
+    # للقنوات المقفلة قبل حفظ الأذونات: نعيد إذن @everyone للوضع الافتراضي فقط
+    overwrites = channel.overwrites
+    everyone = channel.guild.default_role
+    overwrite = overwrites.get(everyone) or discord.PermissionOverwrite()
+    overwrite.send_messages = None
+    if overwrite.is_empty():
+        overwrites.pop(everyone, None)
+    else:
+        overwrites[everyone] = overwrite
+    return overwrites
+
+class LockdownStore:
+    # الأذونات السابقة لكل قناة مقفلة، تُحفظ على القرص حتى يعمل /فتح بعد إعادة التشغيل
+    def __init__(self, path):
+        self.path = path
+        self.channels = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            self.channels = read_json_file(self.path) or {}
+
+    def is_locked(self, channel_id):
+        return str(channel_id) in self.channels
+
+    def get(self, channel_id):
+        entry = self.channels.get(str(channel_id))
+        return entry["overwrites"] if entry else None
+
+    def remember(self, channel, overwrites):
+        self.channels[str(channel.id)] = {"guild_id": channel.guild.id, "overwrites": overwrites}
+
+    def discard(self, channel_id):
+        return self.channels.pop(str(channel_id), None) is not None
+
+    def locked_in(self, guild):
+        return [channel for channel in (guild.get_channel(int(cid)) for cid, entry in self.channels.items()
+                                        if entry["guild_id"] == guild.id) if channel]
+
+    def _write(self, snapshot):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        write_json(self.path, snapshot)
+
+    async def save(self):
+        snapshot = {cid: dict(entry) for cid, entry in self.channels.items()}
+        await persistence.run_io(self._write, snapshot)
+
+lockdowns = LockdownStore(LOCKDOWN_FILE)
+
+def lockdown_targets(interaction, scope, category=None):
+    if scope == "guild":
+        return [channel for channel in interaction.guild.channels if not isinstance(channel, discord.CategoryChannel)]
+    if scope == "category":
+        category = category or interaction.channel.category
+        return list(category.channels) if category else []
+    return [interaction.channel]
+
+async def apply_lockdown(channels, lock, staff_roles=(), reason=None):
+    slots = asyncio.Semaphore(LOCKDOWN_CONCURRENCY)
+    results = {"done": 0, "skipped": 0, "failed": 0}
+
+    async def apply(channel):
+        if lock:
+            if lockdowns.is_locked(channel.id):
+                results["skipped"] += 1
+                return
+            previous = serialize_overwrites(channel)
+            overwrites = build_locked_overwrites(channel, staff_roles)
+        else:
+            previous = lockdowns.get(channel.id)
+            overwrites = deserialize_overwrites(previous) if previous is not None else build_unlocked_overwrites(channel)
+        async with slots:
+            try:
+                await channel.edit(overwrites=overwrites, reason=reason)
+            except discord.HTTPException:
+                results["failed"] += 1
+                return
+        if lock:
+            lockdowns.remember(channel, previous)
+        else:
+            lockdowns.discard(channel.id)
+        results["done"] += 1
+
+    await asyncio.gather(*(apply(channel) for channel in channels))
+    if results["done"]:
+        await lockdowns.save()
+    return results
+
+LOCKDOWN_SCOPES = [
+    app_commands.Choice(name="القناة الحالية", value="channel"),
+    app_commands.Choice(name="الفئة", value="category"),
+    app_commands.Choice(name="السيرفر كامل", value="guild"),
+]
 
 # ==================== أوامر الإدارة ====================
 def get_role_rank(role_name):
-    return ROLE_HIERARCHY.index(role_name) if role_name in ROLE_HIERARCHY else 999
+    return ROLE_RANKS.get(role_name, 999)
 
 def get_highest_staff_role(user_roles):
     highest_rank = 999
@@ -744,27 +3623,27 @@ def get_highest_staff_role(user_roles):
 @app_commands.checks.has_permissions(manage_roles=True)
 async def give_role_slash(interaction: discord.Interaction, member: discord.Member, role: discord.Role):
     if member.bot:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكن إعطاء رتب للبوتات.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكن إعطاء رتب للبوتات.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
         
     user_highest_role_name, user_rank = get_highest_staff_role(interaction.user.roles)
     target_role_rank = get_role_rank(role.name)
 
     if user_rank == 999 and not interaction.user.guild_permissions.administrator:
-        embed = discord.Embed(title="❌ خطأ", description="ليس لديك صلاحية إعطاء رتب إدارية!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("ليس لديك صلاحية إعطاء رتب إدارية!")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
 
     if not interaction.user.guild_permissions.administrator and target_role_rank <= user_rank:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكنك إعطاء رتبة أعلى من رتبتك أو مساوية لها.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكنك إعطاء رتبة أعلى من رتبتك أو مساوية لها.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     if role.name not in ROLE_HIERARCHY:
         await member.add_roles(role)
-        embed = discord.Embed(title="⚠️ خارج النظام", description="تم إضافة الرتبة خارج النظام الهرمي.", color=WARN_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["outside_system"].static("تم إضافة الرتبة خارج النظام الهرمي.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
 
     roles_to_remove = [r for r in member.roles if r.name in ROLE_HIERARCHY]
@@ -775,6 +3654,9 @@ async def give_role_slash(interaction: discord.Interaction, member: discord.Memb
             await member.remove_roles(*roles_to_remove, reason=f"تغيير الرتبة بواسطة {interaction.user}")
         
         await member.add_roles(role, reason=f"إعطاء رتبة بواسطة {interaction.user}")
+        audit.publish(interaction.guild.id, "role_give", actor_id=interaction.user.id, target_id=member.id, details={
+            "الرتبة": role.mention, "الرتب المزالة": ", ".join(removed_roles_names) or None
+        })
 
         embed = discord.Embed(title="✅ تم تحديث الرتبة", color=SUCCESS_COLOR)
         embed.description = f"تم تحديث رتبة {member.mention}."
@@ -784,36 +3666,37 @@ async def give_role_slash(interaction: discord.Interaction, member: discord.Memb
         embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
         embed.timestamp = datetime.now()
         
-        await interaction.response.send_message(embed=embed)
+        await respond(interaction, embed=embed)
 
     except discord.Forbidden:
-        embed = discord.Embed(title="❌ خطأ", description="ليس لدي الصلاحيات الكافية. قد تكون رتبة البوت أقل!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("ليس لدي الصلاحيات الكافية. قد تكون رتبة البوت أقل!")
+        await respond(interaction, embed=embed, ephemeral=True)
     except Exception as e:
-        embed = discord.Embed(title="❌ خطأ", description=f"حدث خطأ: {e}", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].render(f"حدث خطأ: {e}")
+        await respond(interaction, embed=embed, ephemeral=True)
 
 @bot.tree.command(name="طرد", description="طرد عضو من السيرفر")
 @app_commands.describe(member="العضو", reason="سبب الطرد")
 @app_commands.checks.has_permissions(kick_members=True)
 async def kick_slash(interaction: discord.Interaction, member: discord.Member, reason: str = None):
     if member.bot:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكن طرد البوتات.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكن طرد البوتات.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     if member.top_role >= interaction.user.top_role and not interaction.user.guild_permissions.administrator:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكنك طرد شخص برتبة أعلى منك.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكنك طرد شخص برتبة أعلى منك.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     if member.top_role >= interaction.guild.me.top_role:
-        embed = discord.Embed(title="❌ خطأ", description="رتبة البوت أقل من رتبة العضو!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("رتبة البوت أقل من رتبة العضو!")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     try:
         await member.kick(reason=f"بواسطة {interaction.user}: {reason or 'بدون سبب'}")
+        audit.publish(interaction.guild.id, "member_kick", actor_id=interaction.user.id, target_id=member.id, details={"السبب": reason})
         
         embed = discord.Embed(title="✅ تم الطرد", description=f"تم طرد {member.mention} بنجاح", color=ERROR_COLOR)
         if reason:
@@ -821,7 +3704,7 @@ async def kick_slash(interaction: discord.Interaction, member: discord.Member, r
         embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
         embed.timestamp = datetime.now()
         
-        await interaction.response.send_message(embed=embed)
+        await respond(interaction, embed=embed)
         
         try:
             dm_embed = discord.Embed(title="🚫 تم طردك", description=f"لقد تم طردك من سيرفر **{interaction.guild.name}**", color=ERROR_COLOR)
@@ -832,35 +3715,36 @@ async def kick_slash(interaction: discord.Interaction, member: discord.Member, r
             pass
         
     except Exception as e:
-        embed = discord.Embed(title="❌ خطأ", description=f"فشل الطرد: {e}", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].render(f"فشل الطرد: {e}")
+        await respond(interaction, embed=embed, ephemeral=True)
 
 @bot.tree.command(name="حظر", description="حظر عضو من السيرفر")
 @app_commands.describe(member="العضو", reason="سبب الحظر", delete_days="عدد أيام حذف الرسائل (0-7)")
 @app_commands.checks.has_permissions(ban_members=True)
 async def ban_slash(interaction: discord.Interaction, member: discord.Member, reason: str = None, delete_days: int = 0):
     if delete_days < 0 or delete_days > 7:
-        embed = discord.Embed(title="❌ خطأ", description="عدد الأيام يجب أن يكون بين 0 و 7.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("عدد الأيام يجب أن يكون بين 0 و 7.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     if member.bot:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكن حظر البوتات.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكن حظر البوتات.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     if member.top_role >= interaction.user.top_role and not interaction.user.guild_permissions.administrator:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكنك حظر شخص برتبة أعلى منك.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكنك حظر شخص برتبة أعلى منك.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     if member.top_role >= interaction.guild.me.top_role:
-        embed = discord.Embed(title="❌ خطأ", description="رتبة البوت أقل من رتبة العضو!", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("رتبة البوت أقل من رتبة العضو!")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     try:
         await member.ban(reason=f"بواسطة {interaction.user}: {reason or 'بدون سبب'}", delete_message_seconds=delete_days*86400)
+        audit.publish(interaction.guild.id, "member_ban", actor_id=interaction.user.id, target_id=member.id, details={"السبب": reason, "حذف الرسائل": f"{delete_days} أيام"})
         
         embed = discord.Embed(title="✅ تم الحظر", description=f"تم حظر {member.mention} بنجاح", color=ERROR_COLOR)
         embed.add_field(name="🗑️ حذف الرسائل", value=f"آخر {delete_days} أيام", inline=True)
@@ -869,7 +3753,7 @@ async def ban_slash(interaction: discord.Interaction, member: discord.Member, re
         embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
         embed.timestamp = datetime.now()
         
-        await interaction.response.send_message(embed=embed)
+        await respond(interaction, embed=embed)
         
         try:
             dm_embed = discord.Embed(title="⛔ تم حظرك", description=f"لقد تم حظرك من سيرفر **{interaction.guild.name}**", color=ERROR_COLOR)
@@ -880,8 +3764,8 @@ async def ban_slash(interaction: discord.Interaction, member: discord.Member, re
             pass
         
     except Exception as e:
-        embed = discord.Embed(title="❌ خطأ", description=f"فشل الحظر: {e}", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].render(f"فشل الحظر: {e}")
+        await respond(interaction, embed=embed, ephemeral=True)
 
 @bot.tree.command(name="فك_حظر", description="فك حظر عضو")
 @app_commands.describe(user_id="معرف العضو (ID)", reason="سبب فك الحظر")
@@ -890,113 +3774,228 @@ async def unban_slash(interaction: discord.Interaction, user_id: str, reason: st
     try:
         user_id_int = int(user_id)
     except:
-        embed = discord.Embed(title="❌ خطأ", description="معرف المستخدم غير صالح.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("معرف المستخدم غير صالح.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
+    ban_index.warm(interaction.guild)
+    if ban_index.contains(interaction.guild.id, user_id_int) is False:
+        # الفهرس جاهز ويؤكد أن المستخدم غير محظور، فلا حاجة لطلب API
+        embed = EMBEDS["error"].static("هذا المستخدم غير محظور.")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
     try:
-        banned_users = [ban async for ban in interaction.guild.bans()]
-        target_ban = next((ban for ban in banned_users if ban.user.id == user_id_int), None)
-        
-        if not target_ban:
-            embed = discord.Embed(title="❌ خطأ", description="هذا المستخدم غير محظور.", color=ERROR_COLOR)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        if not await unban_user(interaction.guild, user_id_int, f"بواسطة {interaction.user}: {reason or 'بدون سبب'}"):
+            embed = EMBEDS["error"].static("هذا المستخدم غير محظور.")
+            await respond(interaction, embed=embed, ephemeral=True)
             return
         
-        await interaction.guild.unban(target_ban.user, reason=f"بواسطة {interaction.user}: {reason or 'بدون سبب'}")
-        
-        embed = discord.Embed(title="✅ تم فك الحظر", description=f"تم فك حظر {target_ban.user.mention}", color=SUCCESS_COLOR)
+        audit.publish(interaction.guild.id, "member_unban", actor_id=interaction.user.id, target_id=user_id_int, details={"السبب": reason})
+        embed = discord.Embed(title="✅ تم فك الحظر", description=f"تم فك حظر <@{user_id_int}>", color=SUCCESS_COLOR)
         if reason:
             embed.add_field(name="📝 السبب", value=reason, inline=False)
         embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
         embed.timestamp = datetime.now()
         
-        await interaction.response.send_message(embed=embed)
+        await respond(interaction, embed=embed)
         
     except Exception as e:
-        embed = discord.Embed(title="❌ خطأ", description=f"فشل فك الحظر: {e}", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].render(f"فشل فك الحظر: {e}")
+        await respond(interaction, embed=embed, ephemeral=True)
+
+@bot.tree.command(name="فك_حظر_جماعي", description="فك حظر عدة أعضاء دفعة واحدة")
+@app_commands.describe(user_ids="معرفات الأعضاء مفصولة بمسافة أو فاصلة", reason="سبب فك الحظر")
+@app_commands.checks.has_permissions(ban_members=True)
+async def bulk_unban_slash(interaction: discord.Interaction, user_ids: str, reason: str = None):
+    ids = parse_user_ids(user_ids)
+    if not ids:
+        embed = EMBEDS["error"].static("لم يتم العثور على أي معرف صالح.")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    if len(ids) > BULK_UNBAN_LIMIT:
+        embed = EMBEDS["error"].render(f"الحد الأقصى {BULK_UNBAN_LIMIT} معرف في المرة الواحدة.")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    await defer_response(interaction)
+    guild = interaction.guild
+    ban_index.warm(guild)
+    audit_reason = f"بواسطة {interaction.user}: {reason or 'بدون سبب'}"
+    slots = asyncio.Semaphore(UNBAN_CONCURRENCY)
+    
+    async def unban_one(user_id):
+        # إذا كان الفهرس جاهزاً نتجاوز المعرفات غير المحظورة دون طلب API
+        if ban_index.contains(guild.id, user_id) is False:
+            return user_id, "⚪ غير محظور"
+        async with slots:
+            try:
+                if await unban_user(guild, user_id, audit_reason):
+                    audit.publish(guild.id, "member_unban", actor_id=interaction.user.id, target_id=user_id, details={"السبب": reason, "جماعي": "نعم"})
+                    return user_id, "✅ تم فك الحظر"
+                return user_id, "⚪ غير محظور"
+            except discord.Forbidden:
+                return user_id, "❌ صلاحيات غير كافية"
+            except discord.HTTPException as e:
+                return user_id, f"❌ {e.status}"
+    
+    results = await asyncio.gather(*(unban_one(user_id) for user_id in ids))
+    unbanned = sum(1 for _, status in results if status.startswith("✅"))
+    
+    embed = discord.Embed(
+        title="🔓 فك الحظر الجماعي",
+        description=f"تم فك حظر **{unbanned}** من أصل **{len(ids)}**",
+        color=SUCCESS_COLOR if unbanned else WARN_COLOR
+    )
+    lines = [f"`{user_id}` {status}" for user_id, status in results]
+    for i in range(0, min(len(lines), 60), 15):
+        embed.add_field(name="📋 النتائج" if i == 0 else "\u200b", value="\n".join(lines[i:i + 15]), inline=False)
+    if len(lines) > 60:
+        embed.add_field(name="\u200b", value=f"... و {len(lines) - 60} آخرين", inline=False)
+    if reason:
+        embed.add_field(name="📝 السبب", value=reason, inline=False)
+    embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
+    embed.timestamp = datetime.now()
+    await interaction.followup.send(embed=embed)
 
-@bot.tree.command(name="مسح", description="مسح عدد معين من الرسائل")
-@app_commands.describe(amount="عدد الرسائل (1-100)", member="مسح رسائل عضو معين فقط")
+@bot.tree.command(name="مسح", description="مسح الرسائل مع فلاتر اختيارية")
+@app_commands.describe(
+    amount=f"عدد الرسائل (1-{PURGE_MAX})",
+    member="مسح رسائل عضو معين فقط",
+    users="معرفات أعضاء إضافيين مفصولة بمسافة",
+    contains="نمط (regex) يجب أن يطابق محتوى الرسالة",
+    attachments="الرسائل التي تحتوي مرفقات فقط",
+    bots_only="رسائل البوتات فقط",
+    minutes="الرسائل المرسلة خلال آخر عدد من الدقائق فقط"
+)
 @app_commands.checks.has_permissions(manage_messages=True)
-async def purge_slash(interaction: discord.Interaction, amount: int, member: discord.Member = None):
-    if amount < 1 or amount > 100:
-        embed = discord.Embed(title="❌ خطأ", description="يجب أن يكون العدد بين 1 و 100.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+async def purge_slash(interaction: discord.Interaction, amount: int, member: discord.Member = None, users: str = None,
+                      contains: str = None, attachments: bool = False, bots_only: bool = False, minutes: int = None):
+    if amount < 1 or amount > PURGE_MAX:
+        embed = EMBEDS["error"].render(f"يجب أن يكون العدد بين 1 و {PURGE_MAX}.")
+        await respond(interaction, embed=embed, ephemeral=True)
+        return
+    
+    running = purge_jobs.get(interaction.channel_id)
+    if running and not running.finished:
+        embed = EMBEDS["error"].static("توجد عملية مسح جارية في هذه القناة.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
-    await interaction.response.defer(ephemeral=True)
+    predicates = []
+    authors = parse_user_ids(users) if users else []
+    if member:
+        authors.append(member.id)
+    if authors:
+        predicates.append(by_authors(authors))
+    if contains:
+        try:
+            predicates.append(by_regex(re.compile(contains[:200], re.IGNORECASE)))
+        except re.error:
+            embed = EMBEDS["error"].static("النمط (regex) غير صالح.")
+            await respond(interaction, embed=embed, ephemeral=True)
+            return
+    if attachments:
+        predicates.append(with_attachments())
+    if bots_only:
+        predicates.append(from_bots())
+    after = discord.utils.utcnow() - timedelta(minutes=minutes) if minutes and minutes > 0 else None
+    
+    await defer_response(interaction, ephemeral=True)
+    
+    token_expires = time.monotonic() + INTERACTION_TOKEN_TTL
+    in_channel = False
+    
+    async def on_progress(job):
+        # المسح الفردي الطويل يتجاوز عمر رمز التفاعل، فينتقل التقدم إلى رسالة عادية في القناة
+        nonlocal progress, in_channel
+        embed = build_purge_embed(job)
+        job_view = None if job.finished else view
+        if in_channel or time.monotonic() < token_expires:
+            await progress.edit(embed=embed, view=job_view)
+            return
+        progress = await interaction.channel.send(content=interaction.user.mention, embed=embed, view=job_view)
+        in_channel = True
     
+    job = PurgeJob(interaction.channel, amount, predicates, after=after, on_progress=on_progress)
+    view = PurgeProgressView(job, interaction.user.id)
+    purge_jobs[interaction.channel_id] = job
     try:
-        if member:
-            def check(msg):
-                return msg.author.id == member.id
-            deleted = await interaction.channel.purge(limit=amount, check=check)
-        else:
-            deleted = await interaction.channel.purge(limit=amount)
-        
-        embed = discord.Embed(title="✅ تم المسح", description=f"تم مسح **{len(deleted)}** رسالة", color=SUCCESS_COLOR)
-        await interaction.followup.send(embed=embed, ephemeral=True)
-        
-        await asyncio.sleep(5)
-        await interaction.delete_original_response()
-        
-    except Exception as e:
-        await interaction.followup.send(f"❌ فشل المسح: {e}", ephemeral=True)
+        progress = await interaction.followup.send(embed=build_purge_embed(job), view=view, ephemeral=True, wait=True)
+    except discord.HTTPException:
+        del purge_jobs[interaction.channel_id]
+        raise
+    
+    job.start()
+    job.watcher = asyncio.create_task(watch_purge(job, interaction))
 
 @bot.tree.command(name="سرعة", description="تعيين وضع الكتابة البطيء في القناة")
 @app_commands.describe(seconds="عدد الثواني (0 لتعطيل)")
 @app_commands.checks.has_permissions(manage_channels=True)
 async def slowmode_slash(interaction: discord.Interaction, seconds: int):
     if seconds < 0 or seconds > 21600:
-        embed = discord.Embed(title="❌ خطأ", description="يجب أن يكون العدد بين 0 و 21600 (6 ساعات).", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("يجب أن يكون العدد بين 0 و 21600 (6 ساعات).")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     try:
         await interaction.channel.edit(slowmode_delay=seconds)
+        audit.publish(interaction.guild.id, "slowmode", actor_id=interaction.user.id, details={"القناة": interaction.channel.mention, "الثواني": seconds})
         
         if seconds == 0:
-            embed = discord.Embed(title="✅ تم تعطيل وضع الكتابة البطيء", description="يمكن للجميع الكتابة الآن بدون تأخير", color=SUCCESS_COLOR)
+            embed = EMBEDS["slowmode_off"].render("يمكن للجميع الكتابة الآن بدون تأخير")
         else:
             embed = discord.Embed(title="✅ تم تفعيل وضع الكتابة البطيء", description=f"يجب الانتظار **{seconds}** ثانية بين كل رسالة", color=SUCCESS_COLOR)
         
         embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
         embed.timestamp = datetime.now()
-        await interaction.response.send_message(embed=embed)
+        await respond(interaction, embed=embed)
         
     except Exception as e:
-        embed = discord.Embed(title="❌ خطأ", description=f"فشل التحديث: {e}", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].render(f"فشل التحديث: {e}")
+        await respond(interaction, embed=embed, ephemeral=True)
+
+ESCALATION_LABELS = {"timeout": "⏳ إسكات", "kick": "👢 طرد", "ban": "⛔ حظر"}
+
+async def apply_escalation(member, step, total_warns):
+    action, minutes = step
+    reason = f"إجراء تلقائي بعد {total_warns} تحذيرات"
+    kind = {"timeout": "member_timeout", "kick": "member_kick", "ban": "member_ban"}.get(action)
+    try:
+        if action == "timeout":
+            await member.timeout(timedelta(minutes=minutes), reason=reason)
+            audit.publish(member.guild.id, kind, actor_id=bot.user.id, target_id=member.id, details={"السبب": reason, "المدة": f"{minutes} دقيقة"})
+            return f"تم إسكات {member.mention} لمدة {minutes} دقيقة."
+        if action == "kick":
+            await member.kick(reason=reason)
+            audit.publish(member.guild.id, kind, actor_id=bot.user.id, target_id=member.id, details={"السبب": reason})
+            return f"تم طرد {member.mention} تلقائياً."
+        if action == "ban":
+            await member.ban(reason=reason)
+            audit.publish(member.guild.id, kind, actor_id=bot.user.id, target_id=member.id, details={"السبب": reason})
+            return f"تم حظر {member.mention} تلقائياً."
+    except discord.HTTPException:
+        return f"❌ فشل {ESCALATION_LABELS.get(action, action)} العضو (قد تكون رتبته أعلى من البوت)"
+    return f"❌ إجراء غير معروف: {action}"
 
 @bot.tree.command(name="تحذير", description="إعطاء تحذير لعضو")
 @app_commands.describe(member="العضو", reason="سبب التحذير")
 @app_commands.checks.has_permissions(kick_members=True)
+@app_commands.guild_only()
 async def warn_slash(interaction: discord.Interaction, member: discord.Member, reason: str = None):
+    guild_data = await partitions.get(interaction.guild.id)
     if member.bot:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكن إعطاء تحذير للبوتات.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكن إعطاء تحذير للبوتات.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     if member.top_role >= interaction.user.top_role and not interaction.user.guild_permissions.administrator:
-        embed = discord.Embed(title="❌ خطأ", description="لا يمكنك تحذير شخص برتبة أعلى منك.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("لا يمكنك تحذير شخص برتبة أعلى منك.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
     user_id = str(member.id)
-    if user_id not in warnings_db:
-        warnings_db[user_id] = []
-    
-    warn_id = len(warnings_db[user_id]) + 1
-    warnings_db[user_id].append({
-        "id": warn_id,
-        "reason": reason or "لم يحدد سبب",
-        "moderator": str(interaction.user.id),
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    save_data()
+    warn = guild_data.warn_index.add(user_id, reason or "لم يحدد سبب", str(interaction.user.id))
+    audit.publish(interaction.guild.id, "warn_add", actor_id=interaction.user.id, target_id=member.id, details={"رقم التحذير": f"#{warn['id']}", "السبب": reason})
     
     try:
         dm_embed = discord.Embed(title="⚠️ تلقيت تحذيراً", description=f"لقد تلقيت تحذيراً في سيرفر **{interaction.guild.name}**", color=WARN_COLOR)
@@ -1007,134 +4006,326 @@ async def warn_slash(interaction: discord.Interaction, member: discord.Member, r
     except:
         pass
     
-    total_warns = len(warnings_db[user_id])
-    max_warns = 3
+    total_warns = guild_data.warn_index.count(user_id)
     
     embed = discord.Embed(title="⚠️ تم إعطاء تحذير", color=WARN_COLOR)
     embed.description = f"تم إعطاء تحذير لـ {member.mention}"
-    embed.add_field(name="📊 عدد التحذيرات", value=f"**{total_warns}/{max_warns}**", inline=True)
+    embed.add_field(name="🆔 رقم التحذير", value=f"#{warn['id']}", inline=True)
+    embed.add_field(name="📊 عدد التحذيرات", value=f"**{total_warns}**", inline=True)
     if reason:
         embed.add_field(name="📝 السبب", value=reason, inline=False)
     
-    if total_warns >= max_warns:
-        try:
-            await member.kick(reason=f"تم طرده تلقائياً بعد {max_warns} تحذيرات")
-            embed.add_field(name="🚫 إجراء تلقائي", value=f"تم طرد {member.mention} تلقائياً.", inline=False)
-        except:
-            embed.add_field(name="❌ فشل الإجراء", value="فشل طرد العضو (قد تكون رتبته أعلى من البوت)", inline=False)
+    step = escalation_for(total_warns)
+    if step:
+        embed.add_field(name="🚫 إجراء تلقائي", value=await apply_escalation(member, step, total_warns), inline=False)
     
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
-@bot.tree.command(name="تحذيرات", description="عرض تحذيرات عضو")
-@app_commands.describe(member="العضو")
-async def warnings_slash(interaction: discord.Interaction, member: discord.Member):
+@bot.tree.command(name="تحذيرات", description="عرض تحذيرات عضو", extras={"ephemeral": True})
+@app_commands.describe(member="العضو", page="رقم الصفحة")
+@app_commands.guild_only()
+async def warnings_slash(interaction: discord.Interaction, member: discord.Member, page: int = 1):
+    guild_data = await partitions.get(interaction.guild.id)
     user_id = str(member.id)
-    if user_id not in warnings_db or not warnings_db[user_id]:
+    if user_id not in guild_data.warnings or not guild_data.warnings[user_id]:
         embed = discord.Embed(title="✅ لا توجد تحذيرات", description=f"{member.mention} ليس لديه أي تحذيرات.", color=SUCCESS_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
-    warns = warnings_db[user_id]
-    embed = discord.Embed(title=f"⚠️ تحذيرات {member.display_name}", description=f"إجمالي التحذيرات: **{len(warns)}/3**", color=WARN_COLOR)
-    embed.set_thumbnail(url=member.display_avatar.url)
-    
-    for idx, warn in enumerate(warns[-5:]):
-        moderator = interaction.guild.get_member(int(warn["moderator"]))
-        mod_name = moderator.mention if moderator else "غير معروف"
-        timestamp = int(datetime.fromisoformat(warn["timestamp"]).timestamp())
-        embed.add_field(
-            name=f"🚨 تحذير #{warn['id']}",
-            value=f"**المشرف:** {mod_name}\n**السبب:** {warn['reason']}\n**التاريخ:** <t:{timestamp}:R>",
-            inline=False
-        )
-    
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await Paginator(WarningsSource(interaction.guild, guild_data, member), interaction.user.id).start(interaction, page - 1, ephemeral=True)
 
 @bot.tree.command(name="حذف_تحذير", description="حذف تحذير معين من عضو")
 @app_commands.describe(member="العضو", warn_id="رقم التحذير")
 @app_commands.checks.has_permissions(manage_messages=True)
+@app_commands.guild_only()
 async def removewarn_slash(interaction: discord.Interaction, member: discord.Member, warn_id: int):
+    guild_data = await partitions.get(interaction.guild.id)
     user_id = str(member.id)
-    if user_id not in warnings_db or not warnings_db[user_id]:
-        embed = discord.Embed(title="❌ خطأ", description="هذا العضو ليس لديه تحذيرات.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+    if not guild_data.warn_index.count(user_id):
+        embed = EMBEDS["error"].static("هذا العضو ليس لديه تحذيرات.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
-    warnings_list = warnings_db[user_id]
-    target_warn = next((w for w in warnings_list if w["id"] == warn_id), None)
-    
-    if not target_warn:
-        embed = discord.Embed(title="❌ خطأ", description=f"لم يتم العثور على تحذير رقم {warn_id}.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+    entry = guild_data.warn_index.get(warn_id)
+    if not entry or entry[0] != user_id:
+        embed = EMBEDS["error"].render(f"لم يتم العثور على تحذير رقم {warn_id}.")
+        await respond(interaction, embed=embed, ephemeral=True)
         return
     
-    warnings_list.remove(target_warn)
-    save_data()
+    guild_data.warn_index.remove(warn_id)
+    audit.publish(interaction.guild.id, "warn_remove", actor_id=interaction.user.id, target_id=member.id, details={"رقم التحذير": f"#{warn_id}"})
     
     embed = discord.Embed(title="✅ تم حذف التحذير", description=f"تم حذف التحذير رقم #{warn_id} من {member.mention}", color=SUCCESS_COLOR)
     embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
 
-@bot.tree.command(name="اغلاق", description="قفل القناة الحالية لمنع الأعضاء من الكتابة")
+@bot.tree.command(name="اغلاق", description="قفل القناة أو الفئة أو السيرفر لمنع الأعضاء من الكتابة")
+@app_commands.describe(scope="نطاق القفل", category="الفئة المراد قفلها (افتراضياً فئة القناة الحالية)")
+@app_commands.choices(scope=LOCKDOWN_SCOPES)
 @app_commands.checks.has_permissions(manage_channels=True)
-async def lock_slash(interaction: discord.Interaction):
-    await interaction.response.defer(ephemeral=True)
+async def lock_slash(interaction: discord.Interaction, scope: str = "channel", category: discord.CategoryChannel = None):
+    await defer_response(interaction, ephemeral=True)
     
     try:
-        overwrite = interaction.channel.overwrites_for(interaction.guild.default_role)
-        overwrite.send_messages = False
-        await interaction.channel.set_permissions(interaction.guild.default_role, overwrite=overwrite)
+        channels = lockdown_targets(interaction, scope, category)
+        staff_roles = [role for role in (resolver.role(interaction.guild, name) for name in STAFF_ROLES) if role]
+        results = await apply_lockdown(channels, True, staff_roles, reason=f"قفل بواسطة {interaction.user}")
+        if results["done"]:
+            audit.publish(interaction.guild.id, "lockdown", actor_id=interaction.user.id, details={"النطاق": scope, "القنوات": results["done"]})
         
-        staff_roles = ["👑 • المالك", "🔮 • المالك المشارك", "⚔️ • الإدارة", "🛡️ • المشرف"]
-        for role_name in staff_roles:
-            role = discord.utils.get(interaction.guild.roles, name=role_name)
-            if role:
-                admin_overwrite = interaction.channel.overwrites_for(role)
-                admin_overwrite.send_messages = True
-                await interaction.channel.set_permissions(role, overwrite=admin_overwrite)
+        if scope == "channel" and results["failed"]:
+            embed = EMBEDS["error"].static("ليس لدي صلاحيات كافية.")
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
         
-        embed = discord.Embed(title="🔒 تم قفل القناة", description="تم قفل هذه القناة. فقط الإداريين يمكنهم الكتابة الآن.", color=ERROR_COLOR)
+        if scope == "channel":
+            embed = EMBEDS["channel_locked"].render("تم قفل هذه القناة. فقط الإداريين يمكنهم الكتابة الآن.")
+        else:
+            embed = discord.Embed(title="🔒 تم القفل الجماعي", description=f"تم قفل **{results['done']}** قناة.", color=ERROR_COLOR)
+            if results["skipped"]:
+                embed.add_field(name="⏭️ مقفلة مسبقاً", value=str(results["skipped"]), inline=True)
+            if results["failed"]:
+                embed.add_field(name="⚠️ فشل", value=str(results["failed"]), inline=True)
         embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
         embed.timestamp = datetime.now()
         await interaction.followup.send(embed=embed)
         
-        public_embed = discord.Embed(title="🔒 تم قفل القناة", description="هذه القناة مغلقة حالياً. سيتم إشعاركم عند فتحها.", color=ERROR_COLOR)
-        await interaction.channel.send(embed=public_embed)
+        if scope == "channel" and results["done"]:
+            public_embed = EMBEDS["channel_locked"].static("هذه القناة مغلقة حالياً. سيتم إشعاركم عند فتحها.")
+            await interaction.channel.send(embed=public_embed)
         
     except discord.Forbidden:
-        embed = discord.Embed(title="❌ خطأ", description="ليس لدي صلاحيات كافية.", color=ERROR_COLOR)
+        embed = EMBEDS["error"].static("ليس لدي صلاحيات كافية.")
         await interaction.followup.send(embed=embed, ephemeral=True)
     except Exception as e:
-        embed = discord.Embed(title="❌ خطأ", description=f"حدث خطأ: {e}", color=ERROR_COLOR)
+        embed = EMBEDS["error"].render(f"حدث خطأ: {e}")
         await interaction.followup.send(embed=embed, ephemeral=True)
 
-@bot.tree.command(name="فتح", description="فتح القناة المغلقة")
+@bot.tree.command(name="فتح", description="فتح القناة أو الفئة أو السيرفر واسترجاع الأذونات السابقة")
+@app_commands.describe(scope="نطاق الفتح", category="الفئة المراد فتحها (افتراضياً فئة القناة الحالية)")
+@app_commands.choices(scope=LOCKDOWN_SCOPES)
 @app_commands.checks.has_permissions(manage_channels=True)
-async def unlock_slash(interaction: discord.Interaction):
-    await interaction.response.defer(ephemeral=True)
+async def unlock_slash(interaction: discord.Interaction, scope: str = "channel", category: discord.CategoryChannel = None):
+    await defer_response(interaction, ephemeral=True)
     
     try:
-        overwrite = interaction.channel.overwrites_for(interaction.guild.default_role)
-        overwrite.send_messages = None
-        await interaction.channel.set_permissions(interaction.guild.default_role, overwrite=overwrite)
+        if scope == "channel":
+            channels = [interaction.channel]
+        else:
+            # الفتح الجماعي يشمل فقط القنوات التي قفلها البوت
+            targets = {channel.id for channel in lockdown_targets(interaction, scope, category)}
+            channels = [channel for channel in lockdowns.locked_in(interaction.guild) if channel.id in targets]
+        results = await apply_lockdown(channels, False, reason=f"فتح بواسطة {interaction.user}")
+        if results["done"]:
+            audit.publish(interaction.guild.id, "unlock", actor_id=interaction.user.id, details={"النطاق": scope, "القنوات": results["done"]})
+        
+        if scope == "channel" and results["failed"]:
+            embed = EMBEDS["error"].static("ليس لدي صلاحيات كافية.")
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
         
-        embed = discord.Embed(title="🔓 تم فتح القناة", description="يمكن للجميع الكتابة الآن.", color=SUCCESS_COLOR)
+        if scope == "channel":
+            embed = EMBEDS["channel_unlocked"].render("يمكن للجميع الكتابة الآن.")
+        else:
+            embed = discord.Embed(title="🔓 تم الفتح الجماعي", description=f"تم فتح **{results['done']}** قناة.", color=SUCCESS_COLOR)
+            if results["failed"]:
+                embed.add_field(name="⚠️ فشل", value=str(results["failed"]), inline=True)
         embed.set_footer(text=f"بواسطة: {interaction.user.display_name}", icon_url=interaction.user.display_avatar.url)
         embed.timestamp = datetime.now()
         await interaction.followup.send(embed=embed)
         
-        public_embed = discord.Embed(title="🔓 تم فتح القناة", description="يمكنكم الآن الكتابة في هذه القناة.", color=SUCCESS_COLOR)
-        await interaction.channel.send(embed=public_embed)
+        if scope == "channel":
+            public_embed = EMBEDS["channel_unlocked"].static("يمكنكم الآن الكتابة في هذه القناة.")
+            await interaction.channel.send(embed=public_embed)
         
+    except discord.Forbidden:
+        embed = EMBEDS["error"].static("ليس لدي صلاحيات كافية.")
+        await interaction.followup.send(embed=embed, ephemeral=True)
     except Exception as e:
-        embed = discord.Embed(title="❌ خطأ", description=f"حدث خطأ: {e}", color=ERROR_COLOR)
+        embed = EMBEDS["error"].render(f"حدث خطأ: {e}")
         await interaction.followup.send(embed=embed, ephemeral=True)
 
-@bot.tree.command(name="اعداد_السيرفر", description="إعداد السيرفر تلقائياً (سيحذف كل شيء!)")
+# ==================== محرك إعداد السيرفر ====================
+PROVISION_CONCURRENCY = int(os.getenv("PROVISION_CONCURRENCY", "4"))  # أقصى عدد طلبات متزامنة
+PROVISION_RETRIES = 3
+PROVISION_PROGRESS_INTERVAL = 1.5  # أقل مدة بين تحديثات رسالة التقدم
+VOICE_CHANNEL_MARKERS = ["الروم-العام", "الموسيقى", "الجيمنج"]
+TICKET_PANEL_CHANNEL = "🎫・إنشاء-تذكرة"
+WELCOME_CHANNEL = "👋・الترحيب"
+
+class ServerProvisioner:
+    # يحسب الفرق بين التخطيط المطلوب وحالة السيرفر وينفذ الناقص فقط.
+    # discord.py ينتظر حدود كل bucket تلقائياً، والسيمافور يحد الطلبات المتزامنة،
+    # وعند وصول 429 بعد استنفاد محاولات المكتبة نعيد المحاولة بعد retry_after.
+    def __init__(self, guild, reset=False, on_progress=None, concurrency=PROVISION_CONCURRENCY):
+        self.guild = guild
+        self.reset = reset
+        self.on_progress = on_progress
+        self._slots = asyncio.Semaphore(concurrency)
+        self.phase = ""
+        self.total = 0
+        self.done = 0
+        self.created = 0
+        self.deleted = 0
+        self.failures = []
+
+    async def _call(self, label, factory):
+        # يعيد (نجح؟, النتيجة) لأن الحذف ينجح بنتيجة None
+        ok, result = False, None
+        async with self._slots:
+            for attempt in range(PROVISION_RETRIES):
+                try:
+                    result = await factory()
+                    ok = True
+                    break
+                except discord.HTTPException as e:
+                    if e.status == 429 and attempt < PROVISION_RETRIES - 1:
+                        await asyncio.sleep(getattr(e, "retry_after", None) or 1.0)
+                        continue
+                    self.failures.append(f"{label}: {e}")
+                    break
+                except Exception as e:
+                    self.failures.append(f"{label}: {e}")
+                    break
+        self.done += 1
+        await self._report()
+        return ok, result
+
+    async def _report(self, force=False):
+        if self.on_progress:
+            await self.on_progress(self, force)
+
+    def plan(self):
+        # الحالة الحالية تُقرأ مرة واحدة من الكاش، لا طلبات API هنا
+        guild = self.guild
+        roles = set() if self.reset else {role.name for role in guild.roles}
+        categories = {} if self.reset else {category.name: category for category in guild.categories}
+        channels = set() if self.reset else {(channel.category_id, channel.name) for channel in guild.channels if channel.category_id}
+
+        missing_roles = [info for info in ROLES if info["name"] not in roles]
+        layout = []
+        for category_name, channel_names in CATEGORIES_AND_CHANNELS.items():
+            category = categories.get(category_name)
+            category_id = category.id if category else None
+            missing = [name for name in channel_names if (category_id, name) not in channels]
+            if category is None or missing:
+                layout.append((category_name, category, missing))
+        return missing_roles, layout
+
+    def _teardown_targets(self):
+        guild = self.guild
+        channels = list(guild.channels)
+        roles = [role for role in guild.roles
+                 if not role.is_default() and not role.managed and role < guild.me.top_role]
+        return channels, roles
+
+    async def _delete(self, target):
+        ok, _ = await self._call(f"حذف {target.name}", lambda: target.delete(reason="إعادة إعداد السيرفر"))
+        if ok:
+            self.deleted += 1
+
+    async def _teardown(self):
+        channels, roles = self._teardown_targets()
+        self.phase = "🗑️ حذف القنوات والرتب"
+        self.total += len(channels) + len(roles)
+        await self._report(force=True)
+        # كل قناة ورتبة لها bucket خاص بالحذف، لذا التوازي هنا فعلي
+        await asyncio.gather(*(self._delete(target) for target in channels + roles))
+
+    async def _create_roles(self, missing_roles):
+        # الرتب الجديدة تُنشأ أسفل الهرم، فالترتيب التسلسلي يحافظ على تسلسل ROLES
+        for info in missing_roles:
+            ok, _ = await self._call(info["name"], lambda info=info: self.guild.create_role(
+                name=info["name"],
+                permissions=info["permissions"],
+                colour=discord.Colour(info["color"]),
+                reason="إعداد السيرفر التلقائي"
+            ))
+            if ok:
+                self.created += 1
+
+    async def _create_channel(self, category, name, position):
+        if any(marker in name for marker in VOICE_CHANNEL_MARKERS):
+            factory = lambda: self.guild.create_voice_channel(name, category=category, position=position)
+        elif name == TICKET_PANEL_CHANNEL:
+            factory = lambda: self.guild.create_text_channel(name, category=category, position=position, topic="اضغط على الزر لإنشاء تذكرة")
+        else:
+            factory = lambda: self.guild.create_text_channel(name, category=category, position=position)
+        ok, channel = await self._call(name, factory)
+        if not ok:
+            if name in (TICKET_PANEL_CHANNEL, WELCOME_CHANNEL):
+                self.done += 1
+            return
+        self.created += 1
+        if name == TICKET_PANEL_CHANNEL:
+            await self._call("لوحة التذاكر", lambda: channel.send(
+                embed=discord.Embed(title="🎫 نظام التذاكر", description="اضغط على الزر لإنشاء تذكرة", color=INFO_COLOR),
+                view=TicketView()
+            ))
+        elif name == WELCOME_CHANNEL:
+            embed = discord.Embed(
+                title="👋 أهلاً وسهلاً!",
+                description="تم إعداد السيرفر بنجاح!\nاضغط على الزر أدناه لإنشاء أول تذكرة.",
+                color=SUCCESS_COLOR
+            )
+            await self._call("رسالة الترحيب", lambda: channel.send(embed=embed, view=TicketView()))
+
+    async def _create_category(self, category_name, category, missing):
+        # الطلبات متوازية فترتيب اكتمالها عشوائي، لذا يُرسل موضع كل فئة وقناة حسب CATEGORIES_AND_CHANNELS
+        position = list(CATEGORIES_AND_CHANNELS).index(category_name)
+        if category is None:
+            ok, category = await self._call(category_name, lambda: self.guild.create_category(category_name, position=position))
+            if not ok:
+                # فشل إنشاء الفئة: قنواتها ورسائلها تُحتسب منتهية كي يكتمل العداد
+                self.done += len(missing) + sum(1 for name in missing if name in (TICKET_PANEL_CHANNEL, WELCOME_CHANNEL))
+                return
+            self.created += 1
+        channel_names = CATEGORIES_AND_CHANNELS[category_name]
+        await asyncio.gather(*(self._create_channel(category, name, channel_names.index(name)) for name in missing))
+
+    async def run(self):
+        if self.reset:
+            await self._teardown()
+
+        missing_roles, layout = self.plan()
+        panels = sum(1 for _, _, missing in layout for name in missing if name in (TICKET_PANEL_CHANNEL, WELCOME_CHANNEL))
+        self.phase = "🛠️ إنشاء الرتب والقنوات الناقصة"
+        self.total += len(missing_roles) + panels + sum(
+            (category is None) + len(missing) for _, category, missing in layout
+        )
+        await self._report(force=True)
+
+        # الرتب والقنوات مساران مستقلان يعملان بالتوازي
+        await asyncio.gather(
+            self._create_roles(missing_roles),
+            *(self._create_category(*entry) for entry in layout)
+        )
+        resolver.forget(self.guild.id)
+        self.phase = "✅ اكتمل"
+        await self._report(force=True)
+        return self
+
+def build_provision_embed(provisioner):
+    total = max(provisioner.total, 1)
+    filled = int(10 * min(provisioner.done, total) / total)
+    embed = discord.Embed(
+        title=provisioner.phase or "🔄 جاري الإعداد...",
+        description=f"`{'█' * filled}{'░' * (10 - filled)}` {provisioner.done}/{provisioner.total}",
+        color=INFO_COLOR
+    )
+    embed.add_field(name="🆕 تم الإنشاء", value=str(provisioner.created), inline=True)
+    if provisioner.reset:
+        embed.add_field(name="🗑️ تم الحذف", value=str(provisioner.deleted), inline=True)
+    if provisioner.failures:
+        embed.add_field(name=f"⚠️ أخطاء ({len(provisioner.failures)})", value="\n".join(provisioner.failures[:5])[:1024], inline=False)
+    return embed
+
+@bot.tree.command(name="اعداد_السيرفر", description="إعداد السيرفر تلقائياً (ينشئ الناقص فقط، أو يعيد البناء مع reset)")
+@app_commands.describe(reset="حذف كل الرتب والقنوات قبل الإعداد")
 @app_commands.checks.has_permissions(administrator=True)
-async def setup_server_slash(interaction: discord.Interaction):
+async def setup_server_slash(interaction: discord.Interaction, reset: bool = False):
     confirm_view = View()
-    confirm_button = Button(label="نعم، أؤكد الحذف والإعداد", style=discord.ButtonStyle.danger, emoji="⚠️")
+    confirm_button = Button(label="نعم، أؤكد الحذف والإعداد" if reset else "نعم، ابدأ الإعداد", style=discord.ButtonStyle.danger if reset else discord.ButtonStyle.success, emoji="⚠️" if reset else "🛠️")
     cancel_button = Button(label="إلغاء", style=discord.ButtonStyle.secondary, emoji="✅")
     
     async def confirm_callback(interaction_confirm: discord.Interaction):
@@ -1142,97 +4333,50 @@ async def setup_server_slash(interaction: discord.Interaction):
             await interaction_confirm.response.send_message("❌ هذا التأكيد ليس لك.", ephemeral=True)
             return
         
-        embed = discord.Embed(title="🔄 جاري الإعداد...", description="يرجى الانتظار قليلاً...", color=INFO_COLOR)
+        embed = EMBEDS["setup_running"].static("يرجى الانتظار قليلاً...")
         await interaction_confirm.response.edit_message(embed=embed, view=None)
         
-        guild = interaction_confirm.guild
+        last_edit = 0.0
+        
+        async def on_progress(provisioner, force):
+            # تحديث الرسالة بشكل مقنن حتى لا يستهلك حدود الـ webhook
+            nonlocal last_edit
+            now = time.monotonic()
+            if not force and now - last_edit < PROVISION_PROGRESS_INTERVAL:
+                return
+            last_edit = now
+            try:
+                await interaction_confirm.edit_original_response(embed=build_provision_embed(provisioner))
+            except discord.HTTPException:
+                pass  # قد تُحذف القناة أثناء إعادة البناء
         
         try:
-            # === حذف القنوات ===
-            for channel in guild.channels:
-                try:
-                    await channel.delete(reason="إعادة إعداد السيرفر")
-                    await asyncio.sleep(0.2)
-                except:
-                    pass
-            
-            # === حذف الرتب ===
-            for role in guild.roles:
-                if role.name == "@everyone" or role.managed or role >= guild.me.top_role:
-                    continue
-                try:
-                    await role.delete(reason="إعادة إعداد السيرفر")
-                    await asyncio.sleep(0.2)
-                except:
-                    pass
-            
-            # === إنشاء الرتب ===
-            for role_info in ROLES:
-                try:
-                    await guild.create_role(
-                        name=role_info["name"],
-                        permissions=role_info["permissions"],
-                        colour=discord.Colour(role_info["color"]),
-                        reason="إعداد السيرفر التلقائي"
-                    )
-                    await asyncio.sleep(0.2)
-                except:
-                    pass
-            
-            # === إنشاء القنوات ===
-            for category_name, channels in CATEGORIES_AND_CHANNELS.items():
-                try:
-                    category = await guild.create_category(category_name)
-                    
-                    if "الدعم الفني" in category_name:
-                        ticket_create = await guild.create_text_channel(
-                            "🎫・إنشاء-تذكرة",
-                            category=category,
-                            topic="اضغط على الزر لإنشاء تذكرة"
-                        )
-                        await ticket_create.send(
-                            embed=discord.Embed(title="🎫 نظام التذاكر", description="اضغط على الزر لإنشاء تذكرة", color=INFO_COLOR), 
-                            view=TicketView()
-                        )
-                        await guild.create_text_channel("📋・التذاكر-المفتوحة", category=category)
-                    elif "الترحيب" in str(channels):
-                        welcome_ch = await guild.create_text_channel(channels[0], category=category)
-                        embed = discord.Embed(
-                            title="👋 أهلاً وسهلاً!", 
-                            description="تم إعداد السيرفر بنجاح!\nاضغط على الزر أدناه لإنشاء أول تذكرة.", 
-                            color=SUCCESS_COLOR
-                        )
-                        await welcome_ch.send(embed=embed, view=TicketView())
-                    else:
-                        for channel_name in channels:
-                            if any(x in channel_name for x in ["الروم-العام", "الموسيقى", "الجيمنج"]):
-                                await guild.create_voice_channel(channel_name, category=category)
-                            else:
-                                await guild.create_text_channel(channel_name, category=category)
-                    
-                    await asyncio.sleep(0.2)
-                    
-                except Exception as e:
-                    print(f"خطأ: {e}")
+            provisioner = await ServerProvisioner(interaction_confirm.guild, reset=reset, on_progress=on_progress).run()
             
             # رسالة النجاح
-            success_embed = discord.Embed(
-                title="✅ اكتمل الإعداد", 
-                description="تم إنشاء جميع الرتب والقنوات بنجاح!", 
-                color=SUCCESS_COLOR
-            )
-            await interaction_confirm.edit_original_response(embed=success_embed)
+            success_embed = build_provision_embed(provisioner)
+            success_embed.title = "✅ اكتمل الإعداد" if not provisioner.failures else "⚠️ اكتمل الإعداد مع أخطاء"
+            success_embed.color = SUCCESS_COLOR if not provisioner.failures else WARN_COLOR
+            if provisioner.total == 0:
+                success_embed.description = "السيرفر مُعد بالفعل، لا يوجد شيء ناقص."
+            try:
+                await interaction_confirm.edit_original_response(embed=success_embed)
+            except discord.HTTPException:
+                pass
             
         except Exception as e:
-            error_embed = discord.Embed(title="❌ خطأ", description=f"حدث خطأ: {e}", color=ERROR_COLOR)
-            await interaction_confirm.edit_original_response(embed=error_embed)
+            error_embed = EMBEDS["error"].render(f"حدث خطأ: {e}")
+            try:
+                await interaction_confirm.edit_original_response(embed=error_embed)
+            except discord.HTTPException:
+                pass
     
     async def cancel_callback(interaction_cancel: discord.Interaction):
         if interaction_cancel.user != interaction.user:
             await interaction_cancel.response.send_message("❌ هذا الإلغاء ليس لك.", ephemeral=True)
             return
         
-        cancel_embed = discord.Embed(title="✅ تم الإلغاء", description="تم إلغاء عملية الإعداد.", color=SUCCESS_COLOR)
+        cancel_embed = EMBEDS["cancelled"].static("تم إلغاء عملية الإعداد.")
         await interaction_cancel.response.edit_message(embed=cancel_embed, view=None)
     
     confirm_button.callback = confirm_callback
@@ -1241,96 +4385,320 @@ async def setup_server_slash(interaction: discord.Interaction):
     confirm_view.add_item(confirm_button)
     confirm_view.add_item(cancel_button)
     
-    warning_embed = discord.Embed(
-        title="⚠️ تحذير خطير!",
-        description="هذا الأمر سيحذف **كل الرتب والقنوات والفئات** في السيرفر!\n\n**لا يمكن التراجع عن هذا الإجراء!**\n\nهل أنت متأكد من المتابعة؟",
-        color=ERROR_COLOR
-    )
+    if reset:
+        warning_embed = discord.Embed(
+            title="⚠️ تحذير خطير!",
+            description="هذا الأمر سيحذف **كل الرتب والقنوات والفئات** في السيرفر!\n\n**لا يمكن التراجع عن هذا الإجراء!**\n\nهل أنت متأكد من المتابعة؟",
+            color=ERROR_COLOR
+        )
+    else:
+        warning_embed = discord.Embed(
+            title="🛠️ إعداد السيرفر",
+            description="سيتم إنشاء **الرتب والفئات والقنوات الناقصة فقط** دون حذف أي شيء موجود.\n\nهل تريد المتابعة؟",
+            color=WARN_COLOR
+        )
     warning_embed.set_footer(text="تأكيد مطلوب من Administrator")
-    await interaction.response.send_message(embed=warning_embed, view=confirm_view, ephemeral=False)
+    await respond(interaction, embed=warning_embed, view=confirm_view, ephemeral=False)
+
+# ==================== خط معالجة الانضمام ====================
+JOIN_BATCH_WINDOW = float(os.getenv("JOIN_BATCH_WINDOW", "3"))  # تجميع رسائل الترحيب خلال هذه المدة
+RAID_BATCH_WINDOW = float(os.getenv("RAID_BATCH_WINDOW", "15"))
+JOIN_BATCH_MAX = 40  # أقصى عدد منشنات في رسالة ترحيب واحدة
+RAID_JOIN_THRESHOLD = int(os.getenv("RAID_JOIN_THRESHOLD", "15"))  # عدد الانضمامات خلال RAID_WINDOW لتفعيل وضع الغارة
+RAID_WINDOW = 60
+RAID_COOLDOWN = 300  # مدة الهدوء المطلوبة قبل إلغاء وضع الغارة
+ROLE_WORKERS = int(os.getenv("ROLE_WORKERS", "2"))
+
+class JoinRateDetector:
+    def __init__(self, threshold=RAID_JOIN_THRESHOLD, window=RAID_WINDOW, cooldown=RAID_COOLDOWN):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.joins = deque()
+        self.raid = False
+        self.last_spike = 0.0
+
+    def record(self, now):
+        # يعيد True عند الدخول في وضع الغارة
+        self.joins.append(now)
+        while self.joins and now - self.joins[0] > self.window:
+            self.joins.popleft()
+        if len(self.joins) >= self.threshold:
+            self.last_spike = now
+            if not self.raid:
+                self.raid = True
+                return True
+        return False
+
+    def calmed(self, now):
+        # يعيد True عند الخروج من وضع الغارة
+        if self.raid and now - self.last_spike > self.cooldown:
+            self.raid = False
+            return True
+        return False
+
+class JoinPipeline:
+    # الانضمامات تُجمع في رسائل ترحيب مشتركة، والرتب تُعطى عبر طابور بعدد محدود من العمال
+    def __init__(self):
+        self.pending = {}
+        self.windows = {}
+        self.detectors = {}
+        self.roles = asyncio.Queue()
+        self.workers = []
+        self.joined = 0
+        self.welcome_messages = 0
+        self.roles_assigned = 0
+        self.roles_failed = 0
+        self.role_lag = 0.0
+        self.welcome_lag = 0.0
+
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._role_worker()) for _ in range(ROLE_WORKERS)]
+
+    def raid_mode(self, guild_id):
+        detector = self.detectors.get(guild_id)
+        return bool(detector and detector.raid)
+
+    def enqueue(self, member):
+        guild = member.guild
+        now = time.monotonic()
+        self.joined += 1
+        detector = self.detectors.setdefault(guild.id, JoinRateDetector())
+        if detector.record(now):
+            self._announce_raid(guild, True, len(detector.joins))
+        self.pending.setdefault(guild.id, []).append((member, now))
+        if guild.id not in self.windows:
+            self.windows[guild.id] = asyncio.create_task(self._run_window(guild))
+        self.roles.put_nowait((member, now))
+
+    async def _run_window(self, guild):
+        # أول انضمام يُرحب به فوراً، وما يصل خلال النافذة يُجمع في رسالة واحدة
+        try:
+            if not self.raid_mode(guild.id):
+                await self._flush(guild)
+            while True:
+                await asyncio.sleep(RAID_BATCH_WINDOW if self.raid_mode(guild.id) else JOIN_BATCH_WINDOW)
+                if not self.pending.get(guild.id):
+                    break
+                await self._flush(guild)
+        finally:
+            self.windows.pop(guild.id, None)
+
+    async def _flush(self, guild):
+        batch = self.pending.pop(guild.id, [])
+        if not batch:
+            return
+        self.welcome_lag = time.monotonic() - batch[0][1]
+        welcome_channel = resolver.text_channel(guild, "👋・الترحيب")
+        if not welcome_channel:
+            return
+        try:
+            if len(batch) == 1:
+                member = batch[0][0]
+                embed = discord.Embed(
+                    title=f"🎉 أهلاً بك يا {member.name}!",
+                    description=f"نورت سيرفر **{guild.name}**!\nأنت الآن العضو رقم **{guild.member_count}**.",
+                    color=SUCCESS_COLOR
+                )
+                embed.set_thumbnail(url=member.display_avatar.url)
+                embed.set_image(url=guild.icon.url if guild.icon else None)
+                embed.set_footer(text=f"انضم بتاريخ: {member.joined_at.strftime('%Y-%m-%d')}")
+                await welcome_channel.send(content=member.mention, embed=embed)
+                self.welcome_messages += 1
+                return
+            # أثناء الغارة تظهر المنشنات بدون تنبيه حتى لا تتحول رسالة الترحيب إلى إزعاج
+            mentions = discord.AllowedMentions.none() if self.raid_mode(guild.id) else discord.AllowedMentions(users=True)
+            for i in range(0, len(batch), JOIN_BATCH_MAX):
+                chunk = batch[i:i + JOIN_BATCH_MAX]
+                embed = discord.Embed(
+                    title="🎉 أهلاً بالأعضاء الجدد!",
+                    description=f"نورتوا سيرفر **{guild.name}**!\nانضم **{len(chunk)}** عضو جديد، وأصبح عددنا **{guild.member_count}**.",
+                    color=SUCCESS_COLOR
+                )
+                embed.set_thumbnail(url=guild.icon.url if guild.icon else None)
+                await welcome_channel.send(content=" ".join(member.mention for member, _ in chunk), embed=embed, allowed_mentions=mentions)
+                self.welcome_messages += 1
+        except discord.HTTPException as e:
+            print(f"⚠️ فشل إرسال الترحيب في {guild.id}: {e}")
+
+    async def _role_worker(self):
+        while True:
+            member, enqueued = await self.roles.get()
+            try:
+                member_role = resolver.role(member.guild, "👤 • العضو")
+                if member_role:
+                    await member.add_roles(member_role, reason="ترحيب تلقائي")
+                    self.roles_assigned += 1
+            except discord.NotFound:
+                pass  # العضو غادر قبل وصول دوره
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    await asyncio.sleep(getattr(e, "retry_after", None) or 1.0)
+                    self.roles.put_nowait((member, enqueued))
+                else:
+                    self.roles_failed += 1
+            except Exception as e:
+                print(f"⚠️ فشل إعطاء رتبة العضو: {e}")
+                self.roles_failed += 1
+            finally:
+                self.role_lag = time.monotonic() - enqueued
+                self.roles.task_done()
+
+    def _announce_raid(self, guild, active, joins=0):
+        if active:
+            print(f"🚨 وضع الغارة مفعل في {guild.name}: {joins} انضمام خلال {RAID_WINDOW} ثانية")
+            audit.publish(guild.id, "raid_start", details={"الانضمامات": f"{joins} خلال {RAID_WINDOW} ثانية", "تجميع الترحيب": f"كل {RAID_BATCH_WINDOW:.0f} ثانية"})
+        else:
+            print(f"✅ انتهى وضع الغارة في {guild.name}")
+            audit.publish(guild.id, "raid_end")
+
+    async def sweep(self):
+        # إلغاء وضع الغارة بعد الهدوء وحذف كواشف السيرفرات الخاملة
+        now = time.monotonic()
+        for guild_id, detector in list(self.detectors.items()):
+            if detector.calmed(now):
+                guild = bot.get_guild(guild_id)
+                if guild:
+                    self._announce_raid(guild, False)
+            if not detector.raid and (not detector.joins or now - detector.joins[-1] > RAID_WINDOW):
+                del self.detectors[guild_id]
+
+    def stats(self):
+        return {
+            "joined": self.joined,
+            "role_queue": self.roles.qsize(),
+            "pending_welcomes": sum(len(batch) for batch in self.pending.values()),
+            "welcome_messages": self.welcome_messages,
+            "roles_assigned": self.roles_assigned,
+            "roles_failed": self.roles_failed,
+            "role_lag": self.role_lag,
+            "welcome_lag": self.welcome_lag,
+            "raid_guilds": sum(1 for detector in self.detectors.values() if detector.raid),
+        }
+
+join_pipeline = JoinPipeline()
 
 # ==================== الأحداث ====================
 @bot.event
 async def on_ready():
+    # on_ready يتكرر مع كل إعادة اتصال كاملة، والتهيئة كلها تمت مرة واحدة في setup_hook
+    if startup.ready:
+        print(f"🔄 تمت إعادة الاتصال: {len(bot.guilds)} سيرفر")
+        return
+    startup.ready = True
+    startup.mark("الجاهزية")
+    
     print("=" * 60)
     print(f"🤖 البوت جاهز: {bot.user.name}")
     print(f"✨ البوت يعمل على {len(bot.guilds)} سيرفر")
-    print(f"👥 إجمالي الأعضاء: {sum(g.member_count for g in bot.guilds)}")
+    print(f"👥 إجمالي الأعضاء: {sum(g.member_count or 0 for g in bot.guilds)}")
     
-    load_data()
-    bot.add_view(TicketView())
-    
-    try:
-        synced = await bot.tree.sync()
-        print(f"✅ تمت مزامنة {len(synced)} أمر Slash")
-    except Exception as e:
-        print(f"❌ خطأ في المزامنة: {e}")
+    stale = prune_stale_tickets()
+    if stale:
+        print(f"🧹 تم حذف {stale} تذكرة لم تعد قنواتها موجودة")
+    print(startup.report())
     print("=" * 60)
-    
-    bot.loop.create_task(periodic_save())
 
 @bot.event
 async def on_member_join(member):
-    welcome_channel = discord.utils.get(member.guild.text_channels, name="👋・الترحيب")
-    if welcome_channel:
-        embed = discord.Embed(
-            title=f"🎉 أهلاً بك يا {member.name}!",
-            description=f"نورت سيرفر **{member.guild.name}**!\nأنت الآن العضو رقم **{member.guild.member_count}**.",
-            color=SUCCESS_COLOR
-        )
-        embed.set_thumbnail(url=member.display_avatar.url)
-        embed.set_image(url=member.guild.icon.url if member.guild.icon else None)
-        embed.set_footer(text=f"انضم بتاريخ: {member.joined_at.strftime('%Y-%m-%d')}")
-        await welcome_channel.send(content=member.mention, embed=embed)
-    
-    member_role = discord.utils.get(member.guild.roles, name="👤 • العضو")
-    if member_role:
-        await member.add_roles(member_role, reason="ترحيب تلقائي")
+    join_pipeline.enqueue(member)
 
 @bot.event
 async def on_member_remove(member):
-    logs_channel = discord.utils.get(member.guild.text_channels, name="📊・السجلات")
-    if logs_channel:
-        embed = discord.Embed(title="👋 غادر العضو", description=f"{member.mention} ({member.name})", color=ERROR_COLOR)
-        embed.add_field(name="🆔 الID", value=member.id, inline=True)
-        embed.add_field(name="📅 تاريخ الانضمام", value=f"<t:{int(member.joined_at.timestamp())}:R>", inline=True)
-        embed.set_thumbnail(url=member.display_avatar.url)
-        embed.timestamp = datetime.now()
-        await logs_channel.send(embed=embed)
+    audit.publish(member.guild.id, "member_leave", target_id=member.id, details={
+        "الاسم": member.name,
+        "تاريخ الانضمام": f"<t:{int(member.joined_at.timestamp())}:R>" if member.joined_at else None
+    })
 
 @bot.event
 async def on_guild_channel_delete(channel):
+    resolver.invalidate_channels(channel.guild.id)
     # حذف التذكرة إذا تم حذف القناة يدوياً
     if isinstance(channel, discord.TextChannel) and channel.id in tickets_by_channel:
-        owner_id = tickets_by_channel[channel.id].get("owner_id")
-        if owner_id and owner_id in tickets_db:
-            del tickets_db[owner_id]
-        del tickets_by_channel[channel.id]
-        save_data()
+        remove_ticket(channel.id)
+        ticket_events.inc("channel_deleted")
+    if lockdowns.discard(channel.id):
+        await lockdowns.save()
+
+@bot.event
+async def on_guild_channel_create(channel):
+    resolver.invalidate_channels(channel.guild.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if before.name != after.name or type(before) is not type(after):
+        resolver.invalidate_channels(after.guild.id)
+
+@bot.event
+async def on_guild_role_create(role):
+    resolver.invalidate_roles(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    if before.name != after.name or before.position != after.position:
+        resolver.invalidate_roles(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    resolver.invalidate_roles(role.guild.id)
+
+@bot.event
+async def on_member_ban(guild, user):
+    ban_index.add(guild.id, user.id)
+
+@bot.event
+async def on_member_unban(guild, user):
+    ban_index.discard(guild.id, user.id)
+
+@bot.event
+async def on_guild_remove(guild):
+    resolver.forget(guild.id)
+    ban_index.forget(guild.id)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    finish_command(interaction)
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error):
+    finish_command(interaction, failed=True)
     if isinstance(error, app_commands.errors.MissingPermissions):
-        embed = discord.Embed(title="❌ صلاحية مرفوضة", description="ليس لديك الصلاحيات المطلوبة.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["denied"].static("ليس لديك الصلاحيات المطلوبة.")
     elif isinstance(error, app_commands.errors.BotMissingPermissions):
-        embed = discord.Embed(title="❌ خطأ البوت", description="البوت لا يملك الصلاحيات المطلوبة.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["bot_error"].static("البوت لا يملك الصلاحيات المطلوبة.")
     elif isinstance(error, app_commands.errors.CommandNotFound):
-        embed = discord.Embed(title="❌ أمر غير موجود", description="هذا الأمر غير موجود.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["command_not_found"].static("هذا الأمر غير موجود.")
+    elif isinstance(error, app_commands.errors.NoPrivateMessage):
+        embed = EMBEDS["error"].static("هذا الأمر يعمل داخل السيرفرات فقط.")
     else:
         print(f"❌ خطأ غير معروف: {error}")
-        embed = discord.Embed(title="❌ خطأ", description="حدث خطأ غير متوقع. تم إبلاغ فريق التطوير.", color=ERROR_COLOR)
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        embed = EMBEDS["error"].static("حدث خطأ غير متوقع. تم إبلاغ فريق التطوير.")
+    try:
+        # respond يستخدم followup إذا كان الأمر قد رد أو تأجل قبل الخطأ
+        await respond(interaction, embed=embed, ephemeral=True)
+    except discord.HTTPException:
+        pass
 
-# حفظ تلقائي كل 5 دقائق
+# حفظ تلقائي كل 5 دقائق (شبكة أمان فوق محرك الحفظ) وإزالة السيرفرات الخاملة
 async def periodic_save():
     await bot.wait_until_ready()
+    reported = 0
     while not bot.is_closed():
         try:
-            save_data()
-            print(f"💾 تم حفظ البيانات تلقائياً في {datetime.now().strftime('%H:%M:%S')}")
+            ledger.settle_all()
+            await persistence.flush()
+            written = persistence.total_written - reported
+            reported = persistence.total_written
+            unloaded = await partitions.unload_idle()
+            await join_pipeline.sweep()
+            joins = join_pipeline.stats()
+            if joins["role_queue"] or joins["raid_guilds"]:
+                print(f"👥 طابور الرتب: {joins['role_queue']} (تأخير {joins['role_lag']:.1f}s) | سيرفرات في وضع الغارة: {joins['raid_guilds']}")
+            if unloaded:
+                print(f"🧹 تمت إزالة {unloaded} سيرفر خامل من الذاكرة ({len(partitions)} محمّل)")
+            if written:
+                print(f"💾 تم حفظ {written:,} سجل معدل (آخر دفعة: {persistence.last_written:,} سجل في {persistence.last_duration * 1000:.0f}ms) في {datetime.now().strftime('%H:%M:%S')}")
         except Exception as e:
             print(f"❌ خطأ في الحفظ التلقائي: {e}")
         await asyncio.sleep(300)